@@ -0,0 +1,204 @@
+import hashlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from delivery import DeliveryJournal, SessionPool, deliver
+from draw import (
+    build_outbox, draw_pairings, generate_emails, generate_summary, load_config, load_mail_contacts, record_history
+)
+from mail_utils import EmailHandler
+from spool import write_spool
+
+def discover_groups(path):
+    """
+    Finds the groups of a batch run.
+
+    ``path`` is either a folder tree, where every folder holding a
+    config.yaml (and its contact_information.json) is one group named after
+    its path relative to ``path``, or a single YAML file with a 'groups'
+    mapping of group name -> config. In such a file each group lists its
+    e-mail addresses under 'contacts', and every other top-level key (e.g.
+    'email', 'year', 'matching') is a default for all groups.
+
+    Returns:
+        list: dicts with 'name', 'folder', 'config', 'contacts' and the
+            'files' they were read from, sorted by name.
+    """
+    groups = []
+    if os.path.isdir(path):
+        for folder, subfolders, files in os.walk(path):
+            subfolders.sort()
+            if 'config.yaml' not in files:
+                continue
+            name = os.path.relpath(folder, path)
+            files = [os.path.join(folder, 'config.yaml'), os.path.join(folder, 'contact_information.json')]
+            groups.append({
+                'name': os.path.basename(os.path.abspath(path)) if name == '.' else name,
+                'folder': folder,
+                'config': load_config(files[0]),
+                'contacts': load_mail_contacts(files[1]),
+                'files': files,
+            })
+    else:
+        data = load_config(path)
+        if not isinstance(data, dict) or not isinstance(data.get('groups'), dict):
+            raise ValueError(f"{path} has no 'groups' mapping.")
+        defaults = {key: value for key, value in data.items() if key != 'groups'}
+        for name, group_config in data['groups'].items():
+            config = group_config  # not a mapping: reported by check_group_config when drawn
+            if isinstance(group_config, dict):
+                config = dict(defaults)
+                config.update(group_config)
+            groups.append({
+                'name': str(name),
+                'folder': os.path.dirname(path),
+                'config': config,
+                'contacts': config.pop('contacts', {}) if isinstance(config, dict) else {},
+                'files': [path],
+            })
+    return sorted(groups, key=lambda group: group['name'])
+
+def group_seed(seed, name):
+    """Seed of one group derived from the batch seed, independent of the group order"""
+    return None if seed is None else random.Random(f"{seed}/{name}").getrandbits(32)
+
+def check_group_config(config):
+    """Raises ValueError if a group config lacks what its draw and mails need"""
+    if not isinstance(config, dict):
+        raise ValueError("The group config is not a mapping.")
+    rounds = config.get('rounds')
+    if not isinstance(rounds, list) or not rounds:
+        raise ValueError("The group config has no 'rounds' list.")
+    for number, round_config in enumerate(rounds, 1):
+        if not isinstance(round_config, dict) or not isinstance(round_config.get('participants'), list):
+            raise ValueError(f"Round {number} has no 'participants' list.")
+    if 'year' not in config:
+        raise ValueError("The group config has no 'year'.")
+    email_config = config.get('email')
+    if not isinstance(email_config, dict):
+        raise ValueError("The group config has no 'email' section.")
+    missing = [key for key in ('subject', 'sender') if key not in email_config]
+    if missing:
+        raise ValueError(f"The 'email' section has no {', '.join(missing)}.")
+
+def draw_group(name, config, folder, seed=None):
+    """
+    Checks and draws one group, in a worker process of run_batch.
+
+    Returns:
+        dict: 'name' plus either 'pairings', 'attempts', 'seed' and 'score', or
+            'error' if the group is malformed or cannot be drawn.
+    """
+    try:
+        check_group_config(config)
+        all_pairings, num_attempt, seed, score = draw_pairings(config, folder, seed=seed)
+    except ValueError as error:
+        return {'name': name, 'error': str(error)}
+    except (KeyError, TypeError) as error:
+        return {'name': name, 'error': f"Invalid config: {error!r}"}
+    return {'name': name, 'pairings': all_pairings, 'attempts': num_attempt, 'seed': seed, 'score': score}
+
+def iter_draws(groups, workers=1, seed=None):
+    """Yields the draw_group results as they complete, using a process pool if workers > 1"""
+    if workers <= 1:
+        for group in groups:
+            yield draw_group(group['name'], group['config'], group['folder'], group_seed(seed, group['name']))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(draw_group, group['name'], group['config'], group['folder'], group_seed(seed, group['name']))
+            for group in groups
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+def run_batch(path, sender_email=None, app_password=None, workers=1, seed=None, debug=False,
+              journal_folder='journal', debug_folder='debug', spool_folder=None):
+    """
+    Runs the draws of all groups under ``path`` (see discover_groups) in one process.
+
+    The draws run in ``workers`` processes. Each finished group is handled
+    right away while the others are still drawing: in debug mode its mails
+    and summary go to ``debug_folder/<group>/``, otherwise the draw is
+    journaled per group in ``journal_folder/<group>/<draw id>`` and its
+    mails are sent, or with a ``spool_folder`` rendered to
+    ``spool_folder/<group>/<draw id>`` for spool.send_spool. The draw is
+    stored in the group's history once a mail went out or the spool is
+    written. All groups share the
+    template and translation caches and one SessionPool, so a sender
+    account logs in once per connection for the whole batch.
+
+    Returns:
+        dict: group name -> {'draw_id', 'attempts'} plus the delivery
+            report, or {'error'} for groups that could not be drawn.
+    """
+    groups = {group['name']: group for group in discover_groups(path)}
+    print(f"Batch of {len(groups)} groups from {path}")
+    results = {}
+    with SessionPool() as sessions:
+        for result in iter_draws(list(groups.values()), workers, seed):
+            name = result['name']
+            if 'error' in result:
+                results[name] = {'error': result['error']}
+                print(f"\n[{name}] Draw failed:\n{result['error']}")
+                continue
+            group = groups[name]
+            config = group['config']
+            draw_id = hashlib.md5(f"{time.time()}/{name}".encode()).hexdigest()[:8]
+            all_pairings, num_attempt = result['pairings'], result['attempts']
+            try:
+                email_handler = EmailHandler(config)
+                emails = generate_emails(all_pairings, config, draw_id, email_handler)
+                outbox = None if debug else build_outbox(emails, group['contacts'])
+            except (ValueError, KeyError, TypeError) as error:
+                results[name] = {'error': str(error) if isinstance(error, ValueError) else f"Invalid config: {error!r}"}
+                print(f"\n[{name}] Draw ID: {draw_id} | Not sent:\n{results[name]['error']}")
+                continue
+            results[name] = {'draw_id': draw_id, 'attempts': num_attempt}
+
+            if debug:
+                folder = os.path.join(debug_folder, name)
+                os.makedirs(folder, exist_ok=True)
+                for participant, content in emails.items():
+                    with open(os.path.join(folder, f"{participant}.html"), "w") as f:
+                        f.write(content)
+                summary = generate_summary(all_pairings, num_attempt, config, result['score'])
+                with open(os.path.join(folder, "summary.txt"), "w") as f:
+                    f.write(summary)
+                print(f"\n[{name}] Summary Draw [{draw_id}]:\n{summary}")
+                continue
+
+            journal = DeliveryJournal(os.path.join(journal_folder, name), draw_id)
+            journal.save_draw(all_pairings, num_attempt)
+            if spool_folder:
+                spool = os.path.join(spool_folder, name, draw_id)
+                write_spool(spool, email_handler, outbox, draw_id, os.path.join(journal_folder, name))
+                record_history(config, group['folder'], draw_id, all_pairings)
+                results[name]['spool'] = spool
+                print(f"\n[{name}] Draw ID: {draw_id} | Attempts: {num_attempt} | Spooled to {spool}")
+                continue
+            email_config = config['email']
+            report = deliver(
+                email_handler,
+                sender_email,
+                app_password,
+                outbox,
+                journal=journal,
+                workers=email_config.get('send_workers', 4),
+                rate=email_config.get('send_rate'),
+                retries=email_config.get('send_retries', 3),
+                sessions=sessions,
+            )
+            if report['sent']:
+                record_history(config, group['folder'], draw_id, all_pairings)
+            results[name].update(report)
+            print(f"\n[{name}] Draw ID: {draw_id} | Attempts: {num_attempt} | Sent: {len(report['sent'])} | "
+                  f"Failed: {len(report['failed'])}")
+            for participant, error in report['failed'].items():
+                print(f"  {participant}: {error}")
+    failed = sorted(name for name, result in results.items() if 'error' in result or result.get('failed'))
+    print(f"\nBatch completed: {len(results) - len(failed)} of {len(results)} groups without errors.")
+    if failed:
+        print(f"Groups with errors: {', '.join(failed)}")
+    return results
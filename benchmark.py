@@ -0,0 +1,204 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from draw import generate_emails, generate_summary
+from matcher import SecretSantaMatcher
+
+# name -> (participants, rounds, exclusion density, overlap, prevent reciprocal pairs)
+SCALES = {
+    'small': (10, 3, 0.1, 0.8, True),
+    'medium': (100, 3, 0.05, 0.7, True),
+    'large': (1000, 3, 0.01, 0.7, True),
+    'xlarge': (10000, 2, 0.001, 0.9, False),
+}
+
+BENCH_EMAIL_CONFIG = {
+    'email': {'subject': 'Secret Santa Benchmark', 'sender': 'Benchmark Bot', 'language': 'en'},
+    'year': 2025,
+}
+
+def synthetic_config(participants, rounds, exclusion_density=0.0, overlap=1.0, prevent_reciprocal_pairs=True,
+                     seed=0):
+    """
+    Builds a config dict with the same shape as config.yaml.
+
+    Args:
+        participants (int): Number of distinct people over all rounds.
+        rounds (int): Number of rounds.
+        exclusion_density (float): Share of the other round members each
+            person excludes (exclusions are symmetric when drawing).
+        overlap (float): Share of people taking part in every round; the
+            others join each round with a 50% chance.
+        prevent_reciprocal_pairs (bool): Stored under 'matching'.
+        seed (int): Seed of the generator, the same arguments give the same config.
+    """
+    rng = random.Random(seed)
+    width = len(str(participants))
+    names = [f"P{i:0{width}d}" for i in range(participants)]
+    core_size = round(overlap * participants)
+    core, others = names[:core_size], names[core_size:]
+    config_rounds = []
+    for round_num in range(rounds):
+        members = core + [name for name in others if rng.random() < 0.5]
+        if len(members) < 3:
+            members = names[:3]
+        rng.shuffle(members)
+        excluded_per_person = int(exclusion_density * (len(members) - 1))
+        exclusions = {}
+        if excluded_per_person:
+            for giver in members[::2]:  # symmetric, so half the givers already cover everyone
+                exclusions[giver] = [
+                    receiver for receiver in rng.sample(members, excluded_per_person + 1) if receiver != giver
+                ][:excluded_per_person]
+        round_config = {'participants': members, 'budget': f"{10 * (round_num + 1)}$"}
+        if exclusions:
+            round_config['exclusions'] = exclusions
+        config_rounds.append(round_config)
+    config = dict(BENCH_EMAIL_CONFIG)
+    config['rounds'] = config_rounds
+    config['matching'] = {'prevent_reciprocal_pairs': prevent_reciprocal_pairs}
+    return config
+
+def measure(func, repeat):
+    """Returns (result of the last call, wall times in seconds, peak traced memory in bytes)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    # Memory is traced in a separate call, tracemalloc would distort the timings
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, times, peak
+
+def _stats(times, peak):
+    return {
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'peak_bytes': peak,
+    }
+
+def run_scale(name, participants, rounds, exclusion_density, overlap, prevent_reciprocal_pairs, repeat=5, seed=0,
+              solver='restart'):
+    """Times the matcher, email rendering and the summary for one synthetic config"""
+    config = synthetic_config(participants, rounds, exclusion_density, overlap, prevent_reciprocal_pairs, seed)
+    matcher = SecretSantaMatcher(prevent_reciprocal_pairs=prevent_reciprocal_pairs, solver=solver)
+    attempts = []
+
+    def draw():
+        matcher.rng = random.Random(seed + len(attempts))
+        pairings, attempt = matcher.generate_pairings(config['rounds'], max_attempts=1000)
+        attempts.append(attempt)
+        return pairings
+
+    all_pairings, draw_times, draw_peak = measure(draw, repeat)
+    _, email_times, email_peak = measure(lambda: generate_emails(all_pairings, config, 'bench'), repeat)
+    _, summary_times, summary_peak = measure(lambda: generate_summary(all_pairings, attempts[-1], config), repeat)
+    return {
+        'params': {
+            'participants': participants,
+            'rounds': rounds,
+            'exclusion_density': exclusion_density,
+            'overlap': overlap,
+            'prevent_reciprocal_pairs': prevent_reciprocal_pairs,
+            'solver': solver,
+        },
+        'generate_pairings': dict(_stats(draw_times, draw_peak), attempts=attempts[:repeat]),
+        'generate_emails': _stats(email_times, email_peak),
+        'generate_summary': _stats(summary_times, summary_peak),
+    }
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.001):
+    """
+    Lists the benchmarks of results that got slower than in baseline.
+
+    A benchmark regresses if its minimum time grew by more than ``tolerance``
+    (relative) and by more than ``min_seconds``, so timer noise on very fast
+    benchmarks is not reported. Peak memory is compared the same way.
+
+    Returns:
+        list: Human readable regressions, empty if there are none.
+    """
+    regressions = []
+    for scale, benchmarks in results['scales'].items():
+        base_benchmarks = baseline.get('scales', {}).get(scale)
+        if base_benchmarks is None:
+            continue
+        for bench, stats in benchmarks.items():
+            base = base_benchmarks.get(bench)
+            if bench == 'params' or base is None:
+                continue
+            old, new = base['min_s'], stats['min_s']
+            if new > old * (1 + tolerance) and new - old > min_seconds:
+                regressions.append(f"{scale}/{bench}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+            old, new = base['peak_bytes'], stats['peak_bytes']
+            if new > old * (1 + tolerance) and new - old > 64 * 1024:
+                regressions.append(f"{scale}/{bench}: peak memory {old // 1024} KiB -> {new // 1024} KiB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the draw, email rendering and summary on synthetic configs.")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium', 'large'],
+                        help="Preset sizes to run.")
+    parser.add_argument('--participants', type=int, help="Run one custom scale with this many participants.")
+    parser.add_argument('--rounds', type=int, default=3, help="Rounds of the custom scale.")
+    parser.add_argument('--exclusion_density', type=float, default=0.0, help="Exclusion density of the custom scale.")
+    parser.add_argument('--overlap', type=float, default=1.0, help="Round overlap of the custom scale.")
+    parser.add_argument('--allow_reciprocal', action='store_true', help="Allow reciprocal pairs in the custom scale.")
+    parser.add_argument('--solver', choices=['restart', 'backjump'], default='restart', help="Matcher solver.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the configs and draws.")
+    parser.add_argument('--output', '-o', type=str, help="Write the results as JSON to this file.")
+    parser.add_argument('--compare', type=str, help="Baseline JSON to check the results against.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before flagging.")
+    args = parser.parse_args()
+
+    if args.participants:
+        scales = {'custom': (args.participants, args.rounds, args.exclusion_density, args.overlap,
+                             not args.allow_reciprocal)}
+    else:
+        scales = {name: SCALES[name] for name in args.scales}
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'scales': {},
+    }
+    for name, params in scales.items():
+        result = run_scale(name, *params, repeat=args.repeat, seed=args.seed, solver=args.solver)
+        results['scales'][name] = result
+        print(f"{name} ({params[0]} participants, {params[1]} rounds)")
+        for bench in ('generate_pairings', 'generate_emails', 'generate_summary'):
+            stats = result[bench]
+            print(f"  {bench:<18} min {stats['min_s'] * 1000:9.2f} ms  median {stats['median_s'] * 1000:9.2f} ms  "
+                  f"peak {stats['peak_bytes'] // 1024:8d} KiB")
+        print(f"  attempts: {result['generate_pairings']['attempts']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against", args.compare)
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against", args.compare)
+
+if __name__ == "__main__":
+    main()
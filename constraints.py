@@ -0,0 +1,253 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+
+if hasattr(int, 'bit_count'):
+    def popcount(mask):
+        """Number of set bits in a mask"""
+        return mask.bit_count()
+else:
+    def popcount(mask):
+        """Number of set bits in a mask (int.bit_count needs Python 3.10)"""
+        return bin(mask).count("1")
+
+
+def iter_bits(mask):
+    """Yields the ids of the set bits in a mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def bit_list(mask):
+    """
+    Ids of the set bits of a mask, lowest first. Scans the binary string, so
+    it beats iter_bits on masks with many set bits.
+    """
+    text = bin(mask)[:1:-1]  # lowest bit first, without the '0b'
+    ids = []
+    position = text.find('1')
+    while position >= 0:
+        ids.append(position)
+        position = text.find('1', position + 1)
+    return ids
+
+
+def strongly_connected_components(ids, allowed):
+    """
+    Splits a round into the strongly connected components of its allowed
+    giver -> receiver graph, each returned as a mask of ids.
+
+    Every pairing is a set of gift cycles and a cycle never leaves a
+    component, so edges between components can never be used and each
+    component can be drawn on its own. Uses forward/backward reachability on
+    the masks, so a well connected round costs a few passes over its givers.
+    """
+    members = 0
+    for pid in ids:
+        members |= 1 << pid
+    components = []
+    pending = [members]
+    while pending:
+        subset = pending.pop()
+        if not subset:
+            continue
+        pivot = (subset & -subset).bit_length() - 1
+        forward = _reach_forward(pivot, allowed, subset)
+        # Whatever reaches the pivot from inside forward is its component;
+        # nothing outside forward shares a component with anything inside
+        component = _reach_backward(pivot, allowed, forward)
+        components.append(component)
+        pending += [forward & ~component, subset & ~forward]
+    return components
+
+
+def _reach_forward(start, allowed, subset):
+    """Mask of ids in subset reachable from start"""
+    unseen = subset & ~(1 << start)
+    frontier = [start]
+    while frontier and unseen:
+        new = allowed[frontier.pop()] & unseen
+        if new:
+            unseen ^= new
+            frontier.extend(bit_list(new))
+    return subset & ~unseen
+
+
+def _reach_backward(start, allowed, subset):
+    """Mask of ids in subset that can reach start"""
+    seen = 1 << start
+    remaining = bit_list(subset & ~seen)
+    while remaining:
+        hits = []
+        misses = []
+        for pid in remaining:
+            (hits if allowed[pid] & seen else misses).append(pid)
+        if not hits:
+            break
+        seen |= mask_of(hits)
+        remaining = misses
+    return seen
+
+
+def mask_of(ids):
+    """Mask with the bits of the given ids set, built in one go for long id lists"""
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for pid in ids:
+        data[pid >> 3] |= 1 << (pid & 7)
+    return int.from_bytes(data, 'little')
+
+
+class ParticipantIndex:
+    """Interns participant names to small integer ids, which double as bit positions"""
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        """Returns the id of a name, assigning the next free one if it is new"""
+        pid = self.ids.get(name)
+        if pid is None:
+            pid = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return pid
+
+    def mask(self, names):
+        """Returns the bitmask of a collection of names"""
+        mask = 0
+        for name in names:
+            mask |= 1 << self.intern(name)
+        return mask
+
+    def exclusion_masks(self, exclusions):
+        """Returns a symmetric id -> excluded ids mask map for a round's exclusions"""
+        masks = {}
+        if exclusions:
+            for giver, excluded in exclusions.items():
+                gid = self.intern(giver)
+                for receiver in excluded:
+                    rid = self.intern(receiver)
+                    masks[gid] = masks.get(gid, 0) | (1 << rid)
+                    masks[rid] = masks.get(rid, 0) | (1 << gid)
+        return masks
+
+
+class DrawState:
+    """
+    History of a draw as bitmasks per participant id.
+
+    given[g] holds every receiver g already gave to, received[r] every giver
+    that already gave to r. Both are plain dicts of ints, so copying the state
+    for a retry is cheap.
+    """
+    __slots__ = ('given', 'received')
+
+    def __init__(self, given=None, received=None):
+        self.given = dict(given) if given else {}
+        self.received = dict(received) if received else {}
+
+    def copy(self):
+        return DrawState(self.given, self.received)
+
+    def record(self, pairs):
+        """Adds (giver id, receiver id) pairs to the history"""
+        for giver, receiver in pairs:
+            self.given[giver] = self.given.get(giver, 0) | (1 << receiver)
+            self.received[receiver] = self.received.get(receiver, 0) | (1 << giver)
+
+    def blocked(self, giver, prevent_reciprocal_pairs):
+        """Receivers the history rules out for a giver"""
+        mask = self.given.get(giver, 0)
+        if prevent_reciprocal_pairs:
+            mask |= self.received.get(giver, 0)  # whoever gave to giver cannot get one back
+        return mask
+
+
+CompiledRound = namedtuple('CompiledRound', ['participants', 'ids', 'exclusions', 'static', 'budget'])
+CompiledRound.__doc__ = """
+One round with its static constraints resolved to ids.
+
+exclusions and static are tuples aligned with ids: the symmetric mask of
+excluded ids per giver, and the mask of receivers allowed before any
+history (round members except the giver and the excluded ones).
+"""
+
+
+class ConstraintPlan(namedtuple('ConstraintPlan', ['names', 'ids', 'rounds', 'prevent_reciprocal_pairs', 'problems'])):
+    """
+    Immutable result of compile_rounds, shared by every attempt and draw.
+
+    names/ids are the participant index over all rounds (ids is a read-only
+    mapping), rounds the CompiledRound per round and problems the
+    feasibility.analyze_plan result. Plans can be pickled, e.g. to ship
+    them to worker processes once.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (_restore_plan, (self.names, self.rounds, self.prevent_reciprocal_pairs, self.problems))
+
+
+def _restore_plan(names, rounds, prevent_reciprocal_pairs, problems):
+    ids = MappingProxyType({name: pid for pid, name in enumerate(names)})
+    return ConstraintPlan(names, ids, rounds, prevent_reciprocal_pairs, problems)
+
+
+def compile_round(index, participants, exclusions=None, budget=None, past=None):
+    """
+    Resolves a round's static constraints against a ParticipantIndex.
+
+    ``past`` maps giver ids to the mask of receivers they must not get again
+    (see compile_rounds); it only narrows static, exclusions stay as given.
+    """
+    ids = tuple(index.intern(name) for name in participants)
+    members = 0
+    for pid in ids:
+        members |= 1 << pid
+    excluded = index.exclusion_masks(exclusions)
+    excluded = tuple(excluded.get(giver, 0) for giver in ids)
+    past = past or {}
+    static = tuple(members & ~((1 << giver) | mask | past.get(giver, 0)) for giver, mask in zip(ids, excluded))
+    return CompiledRound(tuple(participants), ids, excluded, static, budget)
+
+
+def compile_rounds(rounds, prevent_reciprocal_pairs=False, past_receivers=None):
+    """
+    Compiles config rounds into a ConstraintPlan.
+
+    Everything that does not depend on the drawn history (participant ids,
+    symmetric exclusions, allowed receivers per giver and the feasibility
+    analysis) is computed once here. Draws then only combine these masks
+    with their own history.
+
+    ``past_receivers`` maps giver names to receivers they had in earlier
+    draws (e.g. HistoryStore.past_receivers); each giver is kept from
+    drawing them again in every round.
+    """
+    index = ParticipantIndex()
+    for round_config in rounds:
+        for name in round_config['participants']:
+            index.intern(name)
+    ids = index.ids
+    past = {
+        ids[giver]: mask_of([ids[receiver] for receiver in receivers if receiver in ids])
+        for giver, receivers in (past_receivers or {}).items() if giver in ids
+    }
+    compiled = tuple(
+        compile_round(index, round_config['participants'], round_config.get('exclusions'),
+                      round_config.get('budget'), past)
+        for round_config in rounds
+    )
+    from feasibility import analyze_plan  # feasibility builds on this module
+    names = tuple(index.names)
+    return _restore_plan(
+        names,
+        compiled,
+        prevent_reciprocal_pairs,
+        tuple(analyze_plan(names, compiled, prevent_reciprocal_pairs, past)),
+    )
@@ -0,0 +1,242 @@
+import functools
+import itertools
+import math
+import random
+from constraints import popcount, iter_bits
+
+# Rounds up to this size are counted and sampled exactly. The subset DP visits
+# up to 2^n states: counting a round where everyone may give to everyone takes
+# about a second at 18 (4 s at 20), building the UniformPairingSampler table
+# about 1.5 s (27 MiB). Counting with prevent_reciprocal_pairs carries a second
+# mask and takes about a second at 14.
+EXACT_LIMIT = 18
+EXACT_LIMIT_RECIPROCAL = 14
+
+# Completion tables kept per process by uniform_sampler
+SAMPLER_CACHE_SIZE = 4
+
+
+def exact_limit(prevent_reciprocal_pairs=False):
+    """Largest round size counted exactly by count_valid_pairings"""
+    return EXACT_LIMIT_RECIPROCAL if prevent_reciprocal_pairs else EXACT_LIMIT
+
+
+def local_masks(ids, allowed):
+    """
+    Re-indexes a round's allowed masks from participant ids to positions
+    0..n-1 in ids, so the counting tables only need n bits.
+    """
+    position = {pid: i for i, pid in enumerate(ids)}
+    masks = []
+    for giver in ids:
+        mask = 0
+        for receiver in iter_bits(allowed[giver]):
+            i = position.get(receiver)
+            if i is not None:
+                mask |= 1 << i
+        masks.append(mask)
+    return masks
+
+
+def count_pairings(masks, prevent_reciprocal_pairs=False):
+    """
+    Exact number of valid pairings of a round.
+
+    masks[i] is the mask of positions giver i may give to. Without
+    prevent_reciprocal_pairs this is the permanent of the allowed-edge
+    matrix, computed by a DP over the set of receivers already taken by the
+    first k givers (O(2^n * n) instead of O(n!)). With it, pairings that give
+    both ways inside the round are subtracted by inclusion-exclusion over
+    forced two-person swaps, which the same DP carries as a second mask of
+    givers already settled by such a swap.
+    """
+    n = len(masks)
+    if not prevent_reciprocal_pairs:
+        order = sorted(range(n), key=lambda i: popcount(masks[i]))
+        level = {0: 1}
+        for giver in order:
+            options = masks[giver]
+            following = {}
+            for used, ways in level.items():
+                for receiver in iter_bits(options & ~used):
+                    key = used | (1 << receiver)
+                    following[key] = following.get(key, 0) + ways
+            level = following
+            if not level:
+                return 0
+        return sum(level.values())
+
+    level = {(0, 0): 1}  # (receivers used, later givers settled by a swap) -> signed ways
+    for giver in range(n):
+        bit = 1 << giver
+        options = masks[giver]
+        following = {}
+        for (used, settled), ways in level.items():
+            if settled & bit:
+                key = (used, settled & ~bit)
+                following[key] = following.get(key, 0) + ways
+                continue
+            free = options & ~used
+            for receiver in iter_bits(free):
+                key = (used | (1 << receiver), settled)
+                following[key] = following.get(key, 0) + ways
+                # Force giver <-> receiver as a swap, counted negatively
+                if receiver > giver and not used & bit and masks[receiver] & bit:
+                    key = (used | (1 << receiver) | bit, settled | (1 << receiver))
+                    following[key] = following.get(key, 0) - ways
+        level = {key: ways for key, ways in following.items() if ways}
+        if not level:
+            return 0
+    return sum(level.values())
+
+
+def estimate_pairings(masks, prevent_reciprocal_pairs=False, samples=1000, rng=random):
+    """
+    Unbiased estimate of the number of valid pairings for rounds too large to
+    count exactly (sequential importance sampling).
+
+    Each sample assigns the givers one by one to a random still possible
+    receiver and weighs the result with the product of the number of choices
+    it had (0 at a dead end). The mean weight over the samples is the count.
+
+    Returns:
+        tuple: (estimated count as int, relative standard error as float,
+            inf if no sample reached a full pairing)
+    """
+    n = len(masks)
+    order = sorted(range(n), key=lambda i: popcount(masks[i]))
+    total = 0
+    total_squares = 0
+    for _ in range(samples):
+        used = 0
+        owner = {}  # receiver -> giver, for reciprocity inside the round
+        weight = 1
+        for giver in order:
+            options = masks[giver] & ~used
+            if prevent_reciprocal_pairs and giver in owner:
+                options &= ~(1 << owner[giver])
+            count = popcount(options)
+            if not count:
+                weight = 0
+                break
+            weight *= count
+            receiver = _random_bit(options, count, n, rng)
+            used |= 1 << receiver
+            owner[receiver] = giver
+        total += weight
+        total_squares += weight * weight
+    if not total:
+        return 0, math.inf
+    estimate = total // samples
+    if samples < 2:
+        return estimate, math.inf
+    spread = _isqrt(max(0, samples * total_squares - total * total) // (samples - 1))
+    return estimate, spread / total
+
+
+def _isqrt(value):
+    """Integer square root of a non-negative int, math.isqrt on Python 3.8+"""
+    if hasattr(math, 'isqrt'):
+        return math.isqrt(value)
+    if value < 2:
+        return value
+    # Newton's method from a power of two above the root
+    root = 1 << ((value.bit_length() + 1) // 2)
+    while True:
+        smaller = (root + value // root) // 2
+        if smaller >= root:
+            return root
+        root = smaller
+
+
+def _random_bit(mask, count, n, rng):
+    """Uniformly random set bit of a mask of n bits holding count set bits"""
+    if 4 * count >= n:
+        while True:
+            bit = rng.randrange(n)
+            if mask >> bit & 1:
+                return bit
+    return list(iter_bits(mask))[rng.randrange(count)]
+
+
+class UniformPairingSampler:
+    """
+    Draws valid pairings of one round exactly uniformly.
+
+    The completion table holds, for every set of receivers the first k givers
+    can have taken, the number of ways to finish the pairing. A pairing is
+    sampled giver by giver, picking each receiver with probability
+    proportional to the completions it leaves. With prevent_reciprocal_pairs,
+    pairings that give both ways inside the round are rejected and redrawn,
+    which keeps the result uniform over the valid ones.
+    """
+    def __init__(self, masks, prevent_reciprocal_pairs=False):
+        self.masks = masks
+        self.prevent_reciprocal_pairs = prevent_reciprocal_pairs
+        self.order = sorted(range(len(masks)), key=lambda i: popcount(masks[i]))
+        self.completions = self._completions()
+        self._count = None
+
+    @property
+    def count(self):
+        """Number of valid pairings, computed on first use"""
+        if self._count is None:
+            self._count = self.completions[0].get(0, 0)
+            if self.prevent_reciprocal_pairs and self._count:
+                self._count = count_pairings(self.masks, True)
+        return self._count
+
+    def _completions(self):
+        levels = [{0}]  # receiver sets the first k givers can have taken
+        for giver in self.order:
+            options = self.masks[giver]
+            following = set()
+            for used in levels[-1]:
+                for receiver in iter_bits(options & ~used):
+                    following.add(used | (1 << receiver))
+            levels.append(following)
+        full = (1 << len(self.masks)) - 1
+        completions = [None] * len(levels)
+        completions[-1] = {full: 1} if full in levels[-1] or not self.masks else {}
+        for k in range(len(self.order) - 1, -1, -1):
+            options = self.masks[self.order[k]]
+            after = completions[k + 1]
+            table = {}
+            for used in levels[k]:
+                ways = sum(after.get(used | (1 << receiver), 0) for receiver in iter_bits(options & ~used))
+                if ways:
+                    table[used] = ways
+            completions[k] = table
+        return completions
+
+    def sample(self, rng=random):
+        """Returns a uniformly random valid pairing as a list of (giver, receiver) positions, or None"""
+        if not self.completions[0].get(0, 0):
+            return None
+        for tries in itertools.count(1):
+            # Only pairings with swaps may exist, make sure before rejecting forever
+            if tries % 64 == 0 and not self.count:
+                return None
+            used = 0
+            assignment = {}
+            for k, giver in enumerate(self.order):
+                after = self.completions[k + 1]
+                pick = rng.randrange(self.completions[k][used])
+                for receiver in iter_bits(self.masks[giver] & ~used):
+                    pick -= after.get(used | (1 << receiver), 0)
+                    if pick < 0:
+                        break
+                assignment[giver] = receiver
+                used |= 1 << receiver
+            if not self.prevent_reciprocal_pairs or all(
+                    assignment[receiver] != giver for giver, receiver in assignment.items()):
+                return sorted(assignment.items())
+
+
+@functools.lru_cache(maxsize=SAMPLER_CACHE_SIZE)
+def uniform_sampler(masks, prevent_reciprocal_pairs=False):
+    """
+    The UniformPairingSampler of a round's local masks (a tuple), built once
+    and reused by every attempt that sees the same round and history.
+    """
+    return UniformPairingSampler(list(masks), prevent_reciprocal_pairs)
@@ -0,0 +1,211 @@
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+import json
+import os
+import smtplib
+import threading
+import time
+from metrics import metrics
+
+# Errors that will not go away by sending again
+PERMANENT_ERRORS = (
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+)
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        """
+        Thread-safe token bucket limiting how many mails go out per second.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Burst size, defaults to one second worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class SessionPool:
+    def __init__(self):
+        """
+        Idle SMTPSessions kept open between deliveries.
+
+        Sessions are keyed by server and login, so the mails of many draws
+        (e.g. a batch of groups sharing one sender account) reuse the same
+        few connections instead of logging in again per draw. Thread-safe;
+        a session is only handed to one thread at a time.
+        """
+        self.idle = {}  # (host, port, security, login) -> [SMTPSession]
+        self.sessions = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def acquire(self, email_handler, sender_email, app_password):
+        """Returns an idle session for the handler's server, or opens a new one"""
+        key = email_handler.smtp_server() + (sender_email,)
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop()
+        session = email_handler.session(sender_email, app_password)
+        with self.lock:
+            self.sessions.append(session)
+        return session
+
+    def release(self, session):
+        """Hands a session back for the next mail"""
+        key = (session.host, session.port, session.security, session.sender_email)
+        with self.lock:
+            self.idle.setdefault(key, []).append(session)
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions, self.idle = self.sessions, [], {}
+        for session in sessions:
+            session.close()
+
+class DeliveryJournal:
+    def __init__(self, folder, draw_id):
+        """
+        On-disk record of one draw, stored in ``folder/draw_id``:
+        - draw.json holds the pairings so the same draw can be resumed
+        - delivered.jsonl gets one line per delivered mail, appended and
+          flushed right after the server accepted it
+        """
+        self.draw_id = draw_id
+        self.path = os.path.join(folder, draw_id)
+        self.draw_file = os.path.join(self.path, 'draw.json')
+        self.delivered_file = os.path.join(self.path, 'delivered.jsonl')
+        self.lock = threading.Lock()
+
+    def save_draw(self, all_pairings, num_attempt):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.draw_file, 'w') as f:
+            json.dump({'draw_id': self.draw_id, 'attempts': num_attempt, 'rounds': all_pairings}, f)
+
+    def load_draw(self):
+        """Returns (all_pairings, num_attempt) of the journaled draw"""
+        with open(self.draw_file, 'r') as f:
+            draw = json.load(f)
+        return draw['rounds'], draw['attempts']
+
+    def delivered(self):
+        """Names of all participants whose mail was already delivered"""
+        if not os.path.exists(self.delivered_file):
+            return set()
+        names = set()
+        with open(self.delivered_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    names.add(json.loads(line)['name'])
+        return names
+
+    def forget(self, names):
+        """Drops names from the delivered list, e.g. when their assignment changed"""
+        names = set(names)
+        with self.lock:
+            if not names or not os.path.exists(self.delivered_file):
+                return
+            with open(self.delivered_file, 'r') as f:
+                lines = [line for line in f if line.strip() and json.loads(line)['name'] not in names]
+            with open(self.delivered_file, 'w') as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record(self, name, recipient_email):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.delivered_file, 'a') as f:
+                f.write(json.dumps({'name': name, 'email': recipient_email, 'time': time.time()}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+def deliver(email_handler, sender_email, app_password, outbox, journal=None, workers=4, rate=None,
+            retries=3, backoff=1.0, sessions=None):
+    """
+    Sends all mails of a draw concurrently.
+
+    Each worker thread sends over an SMTPSession of its own. Sending is limited to
+    ``rate`` mails per second over all workers, and transient SMTP errors are
+    retried up to ``retries`` times with exponential backoff. Participants
+    the journal lists as delivered are skipped, and every delivery is
+    journaled at once, so rerunning after a crash only sends the rest.
+
+    Args:
+        outbox (dict): name -> (recipient email, html body or an already
+            built message, e.g. from a spool)
+        sessions (SessionPool): Pool to take the SMTP sessions from and
+            leave them open in; by default they are closed at the end.
+
+    Returns:
+        dict: 'sent' and 'skipped' lists of names, 'failed' name -> error message.
+    """
+    done = journal.delivered() if journal else set()
+    report = {'sent': [], 'skipped': sorted(name for name in outbox if name in done), 'failed': {}}
+    pending = [(name, recipient, body) for name, (recipient, body) in outbox.items() if name not in done]
+    bucket = TokenBucket(rate) if rate else None
+    pool = sessions or SessionPool()
+    report_lock = threading.Lock()
+
+    def send(name, recipient, body):
+        msg = body if isinstance(body, Message) else email_handler.build_message(recipient, body)
+        session = pool.acquire(email_handler, sender_email, app_password)
+        try:
+            for attempt in range(retries + 1):
+                if bucket:
+                    bucket.acquire()
+                try:
+                    with metrics.timer('email.send'):
+                        session.send_message(msg)
+                    break
+                except PERMANENT_ERRORS as error:
+                    with report_lock:
+                        report['failed'][name] = repr(error)
+                    return
+                except (smtplib.SMTPException, OSError) as error:
+                    metrics.count('email.transient_errors')
+                    if attempt == retries:
+                        with report_lock:
+                            report['failed'][name] = repr(error)
+                        return
+                    session.close()
+                    time.sleep(backoff * 2 ** attempt)
+        finally:
+            pool.release(session)
+        if journal:
+            journal.record(name, recipient)
+        with report_lock:
+            report['sent'].append(name)
+        print(f"Email sent to {recipient}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool_threads:
+            for future in [pool_threads.submit(send, *mail) for mail in pending]:
+                future.result()
+    finally:
+        if sessions is None:
+            pool.close()
+    return report
@@ -6,7 +6,14 @@ import json
 import argparse
 from collections import defaultdict
 from matcher import SecretSantaMatcher
+from constraints import compile_rounds
+from delivery import DeliveryJournal, deliver
+from export import export_draw, format_of, iter_assignments, iter_text_table
+from history_store import HistoryStore
+from spool import send_spool, write_spool
 from mail_utils import EmailHandler
+from metrics import metrics
+from optimizer import DEFAULT_SHORT_CYCLE_LENGTH, Objective
 
 def load_config(yaml_path):
     """Load configuration from YAML file"""
@@ -18,9 +25,9 @@ def load_mail_contacts(filename):
     with open(filename, 'r') as file:
         return json.load(file)
 
-def generate_emails(all_pairings, config, draw_id):
+def generate_emails(all_pairings, config, draw_id, email_handler=None):
     """Generate emails for all participants"""
-    email_handler = EmailHandler(config)
+    email_handler = email_handler or EmailHandler(config)
     emails = defaultdict(list)
     total_rounds = len(all_pairings)
     
@@ -32,52 +39,142 @@ def generate_emails(all_pairings, config, draw_id):
             )
             emails[giver].append(assignment)
     
-    # Generate complete emails
-    return {
-        name: email_handler.generate_email(name, assignments, draw_id)
-        for name, assignments in emails.items()
-    }
-
-def generate_summary(all_pairings, num_attempt, config):
-    """Thank you perplexity for the help"""
-    lines = []
-    # Summary header: number of rounds, unique participants and reciprocal-pair setting
-    num_rounds = len(all_pairings)
+    # Generate complete emails in one batch
+    return email_handler.generate_emails(emails, draw_id)
+
+def history_path(config, config_folder):
+    """Path of the history database set under 'history' (relative to the config folder), or None"""
+    path = config.get('history', {}).get('path')
+    return os.path.join(config_folder, path) if path else None
+
+def record_history(config, config_folder, draw_id, all_pairings):
+    """
+    Stores a draw in the configured history, if any. Only called once its
+    mails went out or were spooled, so aborted draws never count as past
+    receivers.
+    """
+    path = history_path(config, config_folder)
+    if path:
+        with HistoryStore(path) as store:
+            store.record_draw(config['year'], draw_id, all_pairings)
+
+def build_outbox(emails, contacts):
+    """name -> (address, mail html); raises ValueError naming everyone without an address"""
+    missing = sorted(set(emails) - set(contacts))
+    if missing:
+        raise ValueError(f"No e-mail address for {', '.join(missing)} in the contact information.")
+    return {name: (contacts[name], content) for name, content in emails.items()}
+
+def load_past_receivers(config, config_folder):
+    """Receivers every participant had in the configured look-back window"""
+    path = history_path(config, config_folder)
+    if not path:
+        return {}
+    givers = {name for round_config in config['rounds'] for name in round_config['participants']}
+    with metrics.timer('history.load'), HistoryStore(path) as store:
+        return store.past_receivers(givers, config['year'], config['history'].get('lookback_years', 1))
+
+def optimize_settings(config):
+    """The 'matching.optimize' section as a dict ('optimize: true' uses the defaults), or None"""
+    settings = config.get('matching', {}).get('optimize')
+    if not settings:
+        return None
+    return {} if settings is True else settings
+
+def load_objective(config, config_folder):
+    """optimizer.Objective set under 'matching.optimize', or None if the draw is not optimized"""
+    settings = optimize_settings(config)
+    if settings is None:
+        return None
+    past_receivers = {}
+    path = history_path(config, config_folder)
+    lookback_years = settings.get('repeat_lookback_years', 5)
+    if path:
+        givers = {name for round_config in config['rounds'] for name in round_config['participants']}
+        with metrics.timer('history.load'), HistoryStore(path) as store:
+            past_receivers = store.past_receivers(givers, config['year'], lookback_years)
+    return Objective(
+        settings.get('weights'), config.get('departments'), past_receivers,
+        settings.get('short_cycle_length', DEFAULT_SHORT_CYCLE_LENGTH)
+    )
+
+def create_matcher(config):
+    """SecretSantaMatcher set up from the config's 'matching' section"""
+    matching = config.get('matching', {})
+    return SecretSantaMatcher(
+        prevent_reciprocal_pairs=matching.get('prevent_reciprocal_pairs', True),
+        strategy=matching.get('strategy', 'sample'),
+        solver=matching.get('solver', 'restart'),
+    )
+
+def compile_plan(config, config_folder, prevent_reciprocal_pairs):
+    """ConstraintPlan of a config's rounds, with the configured history"""
+    past_receivers = load_past_receivers(config, config_folder)
+    with metrics.timer('draw.compile'):
+        return compile_rounds(config['rounds'], prevent_reciprocal_pairs, past_receivers)
+
+def draw_pairings(config, config_folder, matcher=None, seed=None, workers=1, component_workers=1, replay_attempt=None):
+    """
+    Draws all rounds of a config, respecting the configured history, and
+    improves the draw with the optimizer if 'matching.optimize' is set.
+    With ``replay_attempt``, only that attempt of the master ``seed`` is run
+    (see SecretSantaMatcher.replay_attempt).
+
+    Returns:
+        tuple: (all_pairings, num_attempt, seed used or None, optimizer
+            score or None)
+    """
+    matcher = matcher or create_matcher(config)
+    plan = compile_plan(config, config_folder, matcher.prevent_reciprocal_pairs)
+    objective = load_objective(config, config_folder)
+    return draw_plan(config, plan, matcher, objective, seed, workers, component_workers, replay_attempt)
+
+def draw_plan(config, plan, matcher, objective=None, seed=None, workers=1, component_workers=1, replay_attempt=None):
+    """draw_pairings for an already compiled plan and optimizer objective of config"""
+    matching = config.get('matching', {})
+    with metrics.timer('draw.generate_pairings'):
+        if replay_attempt is not None:
+            all_pairings = matcher.replay_attempt(
+                plan, seed, replay_attempt, max_candidates=matching.get('max_candidates')
+            )
+            num_attempt = replay_attempt
+        else:
+            all_pairings, num_attempt = matcher.generate_pairings(
+                plan, max_attempts=matching.get('max_attempts', 50), max_candidates=matching.get('max_candidates'),
+                seed=seed, workers=workers, component_workers=component_workers
+            )
+    metrics.count('draw.attempts_needed', num_attempt)
+    seed, score = matcher.seed, None
+    if objective is not None:
+        time_budget = optimize_settings(config).get('time_budget', 1.0)
+        all_pairings, score = matcher.optimize_pairings(plan, all_pairings, objective, time_budget)
+    return all_pairings, num_attempt, seed, score
+
+def summary_header(all_pairings, num_attempt, config, score=None):
+    """
+    First line of the summary: number of rounds, unique participants,
+    reciprocal-pair setting and, for optimized draws, the optimizer score
+    """
     participants = set()
     for round_data in all_pairings:
-        participants.update(round_data['pairing'].keys())
-    num_participants = len(participants)
+        participants.update(round_data['pairing'])
     prevent_reciprocal = config.get('matching', {}).get('prevent_reciprocal_pairs', True)
-    lines.append(f"Rounds: {num_rounds} | Participants: {num_participants} | Prevent reciprocal pairs: {prevent_reciprocal} | Attempts needed: {num_attempt}")
-    participants = sorted(participants)
-    
-    col_width = 20 
-    
-    header = f"{'Participant':<{col_width}}"
-    for round_num, round_data in enumerate(all_pairings, 1):
-        budget = round_data['budget']
-        header += f"Round {round_num} ({budget})".ljust(col_width)
-    lines.append(header)
-    lines.append("-" * len(header))
-    
-    # Prepare rows
-    for name in participants:
-        row = f"{name:<{col_width}}"
-        for round_num, round_data in enumerate(all_pairings, 1):
-            pairing = round_data['pairing']
-            if name in pairing:
-                val = pairing[name]
-            else:
-                val = "-"
-            row += f"{val:<{col_width}}"
-        lines.append(row)
-    
-    return "\n".join(lines)
+    header = (f"Rounds: {len(all_pairings)} | Participants: {len(participants)} | "
+              f"Prevent reciprocal pairs: {prevent_reciprocal} | Attempts needed: {num_attempt}")
+    if score is not None:
+        header += (f" | Score: {score['total']:g} (drawn: {score['initial']:g}; repeats: {score['repeat']}, "
+                   f"same department: {score['same_department']}, in short cycles: {score['short_cycle']})")
+    return header
+
+def generate_summary(all_pairings, num_attempt, config, score=None):
+    """Fixed-width summary table of a draw, the text renderer of export.py"""
+    header = summary_header(all_pairings, num_attempt, config, score)
+    return "\n".join(iter_text_table(iter_assignments(all_pairings), header))
 
 
 def run_draw():
     """Main function to run the Secret Santa draw"""
-    DRAW_ID = hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
+    DRAW_ID = args.resume or args.repair or hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
     SENDER_MAIL = args.gmail_sender
     SENDER_PW = args.gmail_password  #might have to be an "app password" for Gmail
     
@@ -85,15 +182,40 @@ def run_draw():
     config = load_config(os.path.join(args.config_folder, 'config.yaml'))
     mail_adresses = load_mail_contacts(os.path.join(args.config_folder, 'contact_information.json'))
     
+    for export_path in args.export:
+        format_of(export_path)
+    
     # Initialize handlers
-    prevent_reciprocal = config.get('matching', {}).get('prevent_reciprocal_pairs', True)
-    matcher = SecretSantaMatcher(prevent_reciprocal_pairs=prevent_reciprocal)
+    matcher = create_matcher(config)
     email_handler = EmailHandler(config)
     
-    # Generate pairings and emails
-    max_attempts = config.get('matching', {}).get('max_attempts', 50)
-    all_pairings, num_attempt = matcher.generate_pairings(config['rounds'], max_attempts=max_attempts)
-    emails = generate_emails(all_pairings, config, DRAW_ID)
+    journal = DeliveryJournal(args.journal_folder, DRAW_ID)
+    
+    # Generate pairings (or reload those of the draw being resumed or repaired) and emails
+    changed = score = None
+    if args.resume:
+        all_pairings, num_attempt = journal.load_draw()
+        print(f"Resuming draw {DRAW_ID}, already delivered: {len(journal.delivered())}")
+    elif args.repair:
+        previous_pairings, num_attempt = journal.load_draw()
+        plan = compile_plan(config, args.config_folder, matcher.prevent_reciprocal_pairs)
+        all_pairings, changed = matcher.repair_pairings(plan, previous_pairings)
+        print(f"Repaired draw {DRAW_ID}, new assignments for {len(changed)}: {', '.join(changed) or '-'}")
+    else:
+        all_pairings, num_attempt, seed, score = draw_pairings(
+            config, args.config_folder, matcher, seed=args.seed, workers=args.workers,
+            component_workers=args.component_workers, replay_attempt=args.replay_attempt
+        )
+        if seed is not None:
+            print(f"Seed: {seed} | Winning attempt: {num_attempt}")
+        if score is not None:
+            print(f"Optimizer score: {score['total']:g} (drawn: {score['initial']:g})")
+    with metrics.timer('email.generate'):
+        emails = generate_emails(all_pairings, config, DRAW_ID, email_handler)
+    for export_path in args.export:
+        with metrics.timer('draw.export'):
+            rows = export_draw(all_pairings, export_path, DRAW_ID, header=summary_header(all_pairings, num_attempt, config, score))
+        print(f"Exported {rows} rows to {export_path}")
     
     if args.debug:
         # Save all mails as HTML files in "debug" folder
@@ -108,29 +230,124 @@ def run_draw():
                 emails[args.debug_email_user]
             )
         # Save summary as text file
-        summary = generate_summary(all_pairings, num_attempt, config)
+        summary = generate_summary(all_pairings, num_attempt, config, score)
         with open("debug/summary.txt", "w") as f:
             f.write(summary)
         print(f"\nSummary Draw [{DRAW_ID}]:\n{summary}")
         print("\nDebug files created.")
     else:
         print("Draw ID:", DRAW_ID)
-        # Send all mails
-        for name, content in emails.items():
-            email_handler.send_email(
-                SENDER_MAIL, 
-                SENDER_PW, 
-                mail_adresses[name], 
-                content
+        # Addresses are checked before anything is stored
+        outbox = build_outbox(emails, mail_adresses)
+        if not args.resume:
+            journal.save_draw(all_pairings, num_attempt)
+            if changed is not None:
+                journal.forget(changed)  # only they get a new mail
+        if args.spool_folder:
+            spool = os.path.join(args.spool_folder, DRAW_ID)
+            with metrics.timer('email.spool'):
+                write_spool(spool, email_handler, outbox, DRAW_ID, args.journal_folder)
+            record_history(config, args.config_folder, DRAW_ID, all_pairings)
+            print(f"Mails spooled to {spool}, send with: python draw.py send {spool}")
+            return
+        # Send all mails concurrently, journaling every delivery
+        email_config = config['email']
+        with metrics.timer('email.deliver'):
+            report = deliver(
+                email_handler,
+                SENDER_MAIL,
+                SENDER_PW,
+                outbox,
+                journal=journal,
+                workers=email_config.get('send_workers', 4),
+                rate=email_config.get('send_rate'),
+                retries=email_config.get('send_retries', 3),
             )
+        if report['sent'] or report['skipped']:
+            # The draw is out (a --resume of it records it again, which replaces it)
+            record_history(config, args.config_folder, DRAW_ID, all_pairings)
+        print(f"Sent: {len(report['sent'])} | Already delivered: {len(report['skipped'])} | Failed: {len(report['failed'])}")
+        for name, error in report['failed'].items():
+            print(f"  {name}: {error}")
+        if report['failed']:
+            print(f"Resume with: python draw.py --config_folder {args.config_folder} --resume {DRAW_ID}")
+            return
     print("Draw completed.")
+
+def run_send():
+    """Sends the mails of a spool written with --spool_folder"""
+    report = send_spool(args.spool, args.gmail_sender, args.gmail_password, workers=args.send_workers,
+                        rate=args.send_rate)
+    print(f"Sent: {len(report['sent'])} | Already delivered: {len(report['skipped'])} | Failed: {len(report['failed'])}")
+    for name, error in report['failed'].items():
+        print(f"  {name}: {error}")
+    if report['failed']:
+        print(f"Retry with: python draw.py send {args.spool}")
+
+def main():
+    """Runs the send subcommand, the batch given by --batch, or else the single draw of --config_folder"""
+    if args.command == 'send':
+        run_send()
+    elif args.batch:
+        from batch import run_batch
+        run_batch(
+            args.batch, args.gmail_sender, args.gmail_password, workers=args.batch_workers, seed=args.seed,
+            debug=args.debug, journal_folder=args.journal_folder, spool_folder=args.spool_folder
+        )
+    else:
+        run_draw()
+
+def run_profiled():
+    """Runs the draw with metrics enabled and writes them to debug/metrics.json"""
+    os.makedirs("debug", exist_ok=True)
+    metrics.enable()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with metrics.timer('run_draw'):
+            main()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats("debug/profile.pstats")
+            print("cProfile stats written to debug/profile.pstats")
+        metrics.write("debug/metrics.json", config_folder=args.config_folder, workers=args.workers)
+        print("Metrics written to debug/metrics.json")
         
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the Secret Santa draw.")
     parser.add_argument('--config_folder','-cf', type=str, help="Path to configuration folder", default="example_config")
+    parser.add_argument('--batch', type=str, help="Folder tree of group configs or a multi-group YAML file; draws every group in one run.", default=None)
+    parser.add_argument('--batch_workers', type=int, help="Number of processes drawing the groups of a batch.", default=1)
     parser.add_argument('--debug', action='store_true', help="Run in debug mode.")
     parser.add_argument('--debug_email_user', type=str, help="Debug Mail. Enter User Mail shall be sent to.", default=None)
+    parser.add_argument('--workers', type=int, help="Number of processes running draw attempts in parallel.", default=1)
+    parser.add_argument('--component_workers', type=int, help="Number of processes drawing large independent groups of a round.", default=1)
+    parser.add_argument('--seed', type=int, help="Master seed to make the draw reproducible.", default=None)
+    parser.add_argument('--replay_attempt', type=int, help="With --seed, rerun only this attempt, e.g. the printed winning one.", default=None)
+    parser.add_argument('--resume', type=str, help="Draw ID of an interrupted draw; sends only the undelivered mails.", default=None)
+    parser.add_argument('--repair', type=str, help="Draw ID of a sent draw to adapt to the changed config; only givers with a new assignment are mailed.", default=None)
+    parser.add_argument('--export', type=str, nargs='+', help="Write the draw to these files; the format (.jsonl, .csv, .parquet, .txt) follows the extension.", default=[])
+    parser.add_argument('--journal_folder', type=str, help="Folder for the per-draw delivery journals.", default="journal")
+    parser.add_argument('--spool_folder', type=str, help="Render the mails into this folder (one subfolder per draw) instead of sending them.", default=None)
     parser.add_argument('--gmail_sender', type=str, help="Gmail Sender Mail.", default=os.getenv("SECRET_SANTA_SENDER_MAIL"))
     parser.add_argument('--gmail_password', type=str, help="Gmail Sender Password.", default=os.getenv("SECRET_SANTA_SENDER_PW"))
+    parser.add_argument('--profile', action='store_true', help="Record timers and counters to debug/metrics.json.")
+    parser.add_argument('--cprofile', action='store_true', help="With --profile, also write cProfile stats to debug/profile.pstats.")
+    subparsers = parser.add_subparsers(dest='command')
+    send_parser = subparsers.add_parser('send', help="Send the mails of a spooled draw.")
+    send_parser.add_argument('spool', type=str, help="Spool folder of the draw, e.g. spool/<Draw ID>.")
+    send_parser.add_argument('--send_workers', type=int, help="Parallel SMTP connections, overrides the spooled config.", default=None)
+    send_parser.add_argument('--send_rate', type=float, help="Maximum mails per second, overrides the spooled config.", default=None)
     args = parser.parse_args()
-    run_draw()
+    if args.replay_attempt is not None and args.seed is None:
+        parser.error("--replay_attempt needs the master --seed of the draw.")
+    if args.replay_attempt is not None and args.batch:
+        parser.error("--replay_attempt replays a single draw and cannot be used with --batch.")
+    if args.profile:
+        run_profiled()
+    else:
+        main()
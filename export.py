@@ -0,0 +1,163 @@
+import csv
+import importlib.util
+import json
+import os
+
+# Columns of an exported draw, one row per giver per round
+FIELDS = ('draw_id', 'round', 'budget', 'giver', 'receiver')
+
+# File extension -> format of export_draw
+FORMATS = {'.jsonl': 'jsonl', '.csv': 'csv', '.parquet': 'parquet', '.txt': 'text'}
+
+PARQUET_BATCH_ROWS = 10000
+
+def iter_assignments(all_pairings, draw_id=None):
+    """
+    Yields the rows of a draw as tuples in FIELDS order, round by round.
+
+    Nothing is copied, so writers consuming the rows one at a time need
+    constant memory however large the draw is.
+    """
+    for round_num, round_data in enumerate(all_pairings, 1):
+        budget = round_data['budget']
+        for giver, receiver in round_data['pairing'].items():
+            yield draw_id, round_num, budget, giver, receiver
+
+def write_jsonl(rows, f):
+    """
+    Writes one JSON object per row and line; returns the number of rows.
+
+    Draw ID, round and budget repeat for every giver of a round, so their
+    part of the line is encoded once per round, not once per row.
+    """
+    count = 0
+    encode = json.encoder.encode_basestring
+    prefixes = {}
+    for draw_id, round_num, budget, giver, receiver in rows:
+        prefix = prefixes.get((draw_id, round_num, budget))
+        if prefix is None:
+            prefix = prefixes[draw_id, round_num, budget] = (
+                f'{{"draw_id": {json.dumps(draw_id, ensure_ascii=False)}, "round": {json.dumps(round_num)}, '
+                f'"budget": {json.dumps(budget, ensure_ascii=False)}, "giver": '
+            )
+        f.write(f'{prefix}{encode(giver)}, "receiver": {encode(receiver)}}}\n')
+        count += 1
+    return count
+
+def write_csv(rows, f):
+    """Writes a header line and one CSV line per row; returns the number of rows"""
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_parquet(rows, path, batch_rows=PARQUET_BATCH_ROWS):
+    """
+    Writes the rows as a Parquet file in row groups of ``batch_rows``, so
+    only one batch is held in memory. Needs the optional pyarrow package.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("The parquet export needs pyarrow (pip install pyarrow).") from None
+    schema = pyarrow.schema([
+        ('draw_id', pyarrow.string()),
+        ('round', pyarrow.int32()),
+        ('budget', pyarrow.string()),
+        ('giver', pyarrow.string()),
+        ('receiver', pyarrow.string()),
+    ])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_rows:
+                writer.write_batch(_parquet_batch(pyarrow, schema, batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_parquet_batch(pyarrow, schema, batch))
+            count += len(batch)
+    return count
+
+def _parquet_batch(pyarrow, schema, batch):
+    columns = list(zip(*batch))
+    columns[2] = [None if budget is None else str(budget) for budget in columns[2]]
+    return pyarrow.RecordBatch.from_arrays([pyarrow.array(column) for column in columns], schema=schema)
+
+def iter_text_table(rows, header=None, col_width=20):
+    """
+    Yields the lines of the fixed-width summary table: one line per
+    participant (sorted) with their receiver per round, '-' where they did
+    not take part.
+
+    Unlike the other writers the table needs every row before its first
+    line, as each line spans all rounds.
+    """
+    columns = {}  # round -> (budget, {giver: receiver})
+    column = current_round = None
+    for _, round_num, budget, giver, receiver in rows:
+        if round_num != current_round:
+            current_round = round_num
+            column = columns.setdefault(round_num, (budget, {}))[1]
+        column[giver] = receiver
+    rounds = sorted(columns)
+    participants = set()
+    for _, column in columns.values():
+        participants.update(column)
+    if header is not None:
+        yield header
+    title = f"{'Participant':<{col_width}}" + "".join(
+        f"Round {round_num} ({columns[round_num][0]})".ljust(col_width) for round_num in rounds
+    )
+    yield title
+    yield "-" * len(title)
+    columns = [columns[round_num][1] for round_num in rounds]
+    for name in sorted(participants):
+        yield f"{name:<{col_width}}" + "".join(f"{column.get(name, '-'):<{col_width}}" for column in columns)
+
+def write_text(rows, f, header=None):
+    """Writes the summary table; returns the number of lines"""
+    count = 0
+    for count, line in enumerate(iter_text_table(rows, header), 1):
+        if count > 1:
+            f.write("\n")
+        f.write(line)
+    return count
+
+def format_of(path):
+    """
+    Export format of a file name, checked before drawing so a wrong
+    extension or a missing pyarrow does not fail after the draw.
+    """
+    export_format = FORMATS.get(os.path.splitext(path)[1].lower())
+    if export_format is None:
+        raise ValueError(f"Export format of '{path}' is not supported. Available: {sorted(FORMATS)}")
+    if export_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError("The parquet export needs pyarrow (pip install pyarrow).")
+    return export_format
+
+def export_draw(all_pairings, path, draw_id=None, export_format=None, header=None):
+    """
+    Writes a draw to ``path`` as 'jsonl', 'csv', 'parquet' or 'text' (the
+    summary table, with ``header`` as its first line). The format is taken
+    from the file extension unless given.
+
+    Returns:
+        int: Rows (lines for 'text') written.
+    """
+    export_format = export_format or format_of(path)
+    rows = iter_assignments(all_pairings, draw_id)
+    if export_format == 'parquet':
+        return write_parquet(rows, path)
+    with open(path, 'w', newline='' if export_format == 'csv' else None, encoding='utf-8') as f:
+        if export_format == 'jsonl':
+            return write_jsonl(rows, f)
+        if export_format == 'csv':
+            return write_csv(rows, f)
+        return write_text(rows, f, header)
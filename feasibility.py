@@ -0,0 +1,249 @@
+from constraints import compile_rounds, iter_bits, popcount
+
+
+class InfeasibleConfigError(ValueError):
+    """Raised when a config can be proven impossible before drawing"""
+    def __init__(self, problems):
+        self.problems = problems
+        lines = ["The configured rounds cannot be drawn:"]
+        lines += [f"  {problem}" for problem in problems]
+        lines.append("Relax the exclusions or add participants to the affected rounds.")
+        super().__init__("\n".join(lines))
+
+
+def check_rounds(rounds, prevent_reciprocal_pairs=False, past_receivers=None):
+    """Raises InfeasibleConfigError if analyze_rounds finds any problem"""
+    problems = analyze_rounds(rounds, prevent_reciprocal_pairs, past_receivers)
+    if problems:
+        raise InfeasibleConfigError(problems)
+
+
+def analyze_rounds(rounds, prevent_reciprocal_pairs=False, past_receivers=None):
+    """
+    Checks config rounds for contradictions without drawing anything.
+
+    ``past_receivers`` maps givers to receivers they must not get again (e.g.
+    from earlier years); unlike exclusions these only forbid that direction.
+
+    Returns:
+        list: Human readable problems, empty if no contradiction was found
+            (see analyze_plan).
+    """
+    return list(compile_rounds(rounds, prevent_reciprocal_pairs, past_receivers).problems)
+
+
+def analyze_plan(names, rounds, prevent_reciprocal_pairs=False, past=None):
+    """
+    Checks compiled rounds (constraints.CompiledRound) for contradictions.
+
+    Every check is a bipartite matching on the rounds' id masks, so this
+    runs in polynomial time and never builds per-giver sets:
+    - each round needs a perfect giver -> receiver matching that respects
+      self and exclusion rules
+    - each participant needs a different receiver in every round they are in
+    - with prevent_reciprocal_pairs, each pair of people can only be used
+      once over all rounds, so a participant needs two new partners (one to
+      give to, one to receive from) per round
+
+    If a matching is incomplete, a small Hall violator is reported, i.e. a set
+    of givers (or rounds) that together have fewer options than members.
+
+    ``past`` maps giver ids to the mask of receivers they must not get again,
+    as passed to constraints.compile_round.
+
+    Returns:
+        list: Human readable problems, empty if no contradiction was found.
+    """
+    problems = []
+    past = past or {}
+    # Receiver id -> mask of givers that had them before, the direction static does not hold
+    past_givers = {}
+    for giver, receivers in past.items():
+        for receiver in iter_bits(receivers):
+            past_givers[receiver] = past_givers.get(receiver, 0) | (1 << giver)
+    # person id -> [(round_num, fewest options of anyone in the round, receivers mask, givers mask)]
+    rounds_of = {}
+
+    for round_num, compiled in enumerate(rounds, 1):
+        ids = compiled.ids
+        members = 0
+        for pid in ids:
+            members |= 1 << pid
+        giving = dict(zip(ids, compiled.static))
+        receiving = giving  # exclusions are symmetric, only past receivers make them differ
+        if past_givers:
+            receiving = {
+                pid: members & ~((1 << pid) | excluded | past_givers.get(pid, 0))
+                for pid, excluded in zip(ids, compiled.exclusions)
+            }
+        fewest = min((popcount(mask) for mask in giving.values()), default=0)
+        if receiving is not giving:
+            fewest = min(fewest, min(popcount(mask) for mask in receiving.values()))
+        for pid in ids:
+            rounds_of.setdefault(pid, []).append((round_num, fewest, giving[pid], receiving[pid]))
+
+        if prevent_reciprocal_pairs and len(ids) == 2:
+            problems.append(
+                f"Round {round_num}: {names[ids[0]]} and {names[ids[1]]} could only give to each other, "
+                "which prevent_reciprocal_pairs forbids"
+            )
+            continue
+
+        # At least n/2 options for every giver and every receiver guarantees
+        # a perfect matching
+        if 2 * (len(ids) - fewest) <= len(ids):
+            continue
+        violator = smallest_hall_violator(giving, receiving)
+        if violator:
+            side, group, options = violator
+            group = [names[pid] for pid in group]
+            options = [names[pid] for pid in iter_bits(options)]
+            if side == 'left':
+                problems.append(
+                    f"Round {round_num}: these {len(group)} givers only have {len(options)} possible receivers: "
+                    f"{_names(group)} -> {_names(options)}"
+                )
+            else:
+                problems.append(
+                    f"Round {round_num}: these {len(group)} receivers only have {len(options)} possible givers: "
+                    f"{_names(group)} <- {_names(options)}"
+                )
+
+    # Across rounds every participant needs distinct partners, one slot per
+    # round (two with prevent_reciprocal_pairs: one to give to, one to receive from)
+    slots_per_round = 2 if prevent_reciprocal_pairs else 1
+    for person, memberships in rounds_of.items():
+        needed = slots_per_round * len(memberships)
+        if needed <= 1:
+            continue
+        # Hall holds trivially when every slot has at least as many options as
+        # there are slots, which the rounds' fewest options mostly settle
+        # without counting this person's own
+        if all(fewest >= needed for _, fewest, _, _ in memberships):
+            continue
+        if all(popcount(gives) >= needed and popcount(receives) >= needed
+               for _, _, gives, receives in memberships):
+            continue
+        slots = {}
+        for round_num, _, gives, receives in memberships:
+            slots[(round_num, 0)] = gives
+            if slots_per_round == 2:
+                slots[(round_num, 1)] = receives
+        violator = _hall_violator(slots)
+        if violator:
+            slot_keys, options = violator
+            round_nums = sorted({round_num for round_num, _ in slot_keys})
+            options = [names[pid] for pid in iter_bits(options)]
+            problems.append(
+                f"{names[person]} needs {len(slot_keys)} different partners in rounds "
+                f"{', '.join(map(str, round_nums))} but only {len(options)} are possible: {_names(options)}"
+            )
+
+    return problems
+
+
+def smallest_hall_violator(allowed, reverse):
+    """
+    Returns the smaller Hall violator of a square bipartite graph, or None if
+    a perfect matching exists.
+
+    Args:
+        allowed (dict): giver id -> mask of allowed receiver ids, givers and
+            receivers being the same people.
+        reverse (dict): receiver id -> mask of the givers allowed to give to
+            them (the transpose of allowed).
+
+    Returns:
+        tuple: ('left', giver ids, receivers mask) or ('right', receiver ids,
+            givers mask) where the members have fewer options than there are
+            members.
+    """
+    candidates = []
+    violator = _hall_violator(allowed)
+    if violator:
+        candidates.append(('left',) + violator)
+    violator = _hall_violator(reverse)
+    if violator:
+        candidates.append(('right',) + violator)
+    if not candidates:
+        return None
+    return min(candidates, key=lambda candidate: len(candidate[1]))
+
+
+def _hall_violator(adjacency):
+    """
+    Returns (set of left vertices, mask of their neighbours) with fewer
+    neighbours than members, or None if every left vertex can be matched.
+
+    The left vertices reachable by alternating paths from an unmatched left
+    vertex only reach matched right vertices, one fewer than themselves
+    (König). The smallest such set over all unmatched vertices is returned.
+    """
+    match_right = _max_matching(adjacency)
+    matched_left = set(match_right.values())
+    best = None
+    for start in adjacency:
+        if start in matched_left:
+            continue
+        left_seen = {start}
+        right_seen = 0
+        queue = [start]
+        while queue:
+            new = adjacency[queue.pop()] & ~right_seen
+            right_seen |= new
+            for right in iter_bits(new):
+                partner = match_right[right]  # always matched, else it would augment
+                if partner not in left_seen:
+                    left_seen.add(partner)
+                    queue.append(partner)
+        if best is None or len(left_seen) < len(best[0]):
+            best = (left_seen, right_seen)
+    return best
+
+
+def _max_matching(adjacency):
+    """
+    Maximum matching of left vertices to right ids (adjacency: left -> mask
+    of right ids): greedy start plus augmenting paths by iterative DFS. Each
+    step picks the next right vertex with a mask operation, so a search costs
+    one pass over the rights. Returns right id -> left.
+    """
+    match_right = {}
+    matched = 0
+    unmatched = []
+    for left, rights in adjacency.items():
+        free = rights & ~matched
+        if free:
+            right = (free & -free).bit_length() - 1
+            match_right[right] = left
+            matched |= 1 << right
+        else:
+            unmatched.append(left)
+
+    for start in unmatched:
+        visited = 0
+        lefts = [start]
+        rights = []  # rights[i] is matched to lefts[i + 1] along the alternating path
+        while lefts:
+            options = adjacency[lefts[-1]] & ~visited
+            if not options:
+                lefts.pop()
+                if rights:
+                    rights.pop()
+                continue
+            free = options & ~matched
+            if free:
+                right = (free & -free).bit_length() - 1
+                for left, taken in zip(lefts, rights + [right]):
+                    match_right[taken] = left
+                matched |= 1 << right
+                break
+            right = (options & -options).bit_length() - 1
+            visited |= 1 << right
+            rights.append(right)
+            lefts.append(match_right[right])
+    return match_right
+
+
+def _names(people):
+    return ", ".join(sorted(map(str, people)))
@@ -0,0 +1,91 @@
+import sqlite3
+import time
+
+
+class HistoryStore:
+    def __init__(self, path):
+        """
+        On-disk history of past draws in an SQLite database.
+
+        Every pair of a draw is stored with its year and draw ID. Pairs are
+        indexed by giver and year, so the receivers of one giver within a
+        range of years are a single index lookup.
+
+        Args:
+            path (str): Database file, created if missing.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS draws (
+                draw_id TEXT PRIMARY KEY,
+                year INTEGER NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pairs (
+                draw_id TEXT NOT NULL REFERENCES draws (draw_id),
+                year INTEGER NOT NULL,
+                round INTEGER NOT NULL,
+                giver TEXT NOT NULL,
+                receiver TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pairs_by_giver ON pairs (giver, year, receiver);
+            CREATE INDEX IF NOT EXISTS pairs_by_draw ON pairs (draw_id);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def record_draw(self, year, draw_id, all_pairings):
+        """Stores (or replaces) the pairings of a draw in one transaction"""
+        with self.connection:
+            self.connection.execute("DELETE FROM pairs WHERE draw_id = ?", (draw_id,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO draws (draw_id, year, created) VALUES (?, ?, ?)",
+                (draw_id, year, time.time()),
+            )
+            self.connection.executemany(
+                "INSERT INTO pairs (draw_id, year, round, giver, receiver) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (draw_id, year, round_num, giver, receiver)
+                    for round_num, round_data in enumerate(all_pairings, 1)
+                    for giver, receiver in round_data['pairing'].items()
+                ),
+            )
+
+    def draws(self):
+        """Returns (draw_id, year) of all stored draws, oldest first"""
+        return self.connection.execute("SELECT draw_id, year FROM draws ORDER BY year, created").fetchall()
+
+    def receivers_of(self, giver, first_year, last_year):
+        """Set of everyone giver gave to in the years first_year..last_year"""
+        rows = self.connection.execute(
+            "SELECT receiver FROM pairs WHERE giver = ? AND year BETWEEN ? AND ?",
+            (giver, first_year, last_year),
+        )
+        return {receiver for receiver, in rows}
+
+    def past_receivers(self, givers, year, lookback_years=1):
+        """
+        Receivers each giver had in the ``lookback_years`` years before
+        ``year`` (earlier draws of ``year`` itself are not counted, so a draw
+        can be redone). Givers without history are left out.
+
+        Returns:
+            dict: giver -> set of receivers, ready for compile_rounds.
+        """
+        past = {}
+        if lookback_years < 1:
+            return past
+        first_year, last_year = year - lookback_years, year - 1
+        for giver in givers:
+            receivers = self.receivers_of(giver, first_year, last_year)
+            if receivers:
+                past[giver] = receivers
+        return past
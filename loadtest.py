@@ -0,0 +1,128 @@
+import argparse
+import http.client
+import json
+import statistics
+import sys
+import threading
+import time
+from contextlib import closing
+from service import DrawService, UnixHTTPConnection, create_server
+
+ENDPOINTS = ('check', 'draw', 'preview', 'summary')
+
+def connect(host='127.0.0.1', port=None, socket_path=None, timeout=30):
+    """A keep-alive connection to a running service, on a Unix socket if socket_path is given"""
+    if socket_path:
+        return UnixHTTPConnection(socket_path, timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+def call(connection, endpoint, payload=None):
+    """POSTs payload to /endpoint (GET without payload); returns (status, decoded JSON body)"""
+    if payload is None:
+        connection.request('GET', f"/{endpoint}")
+    else:
+        body = json.dumps(payload).encode('utf-8')
+        connection.request('POST', f"/{endpoint}", body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+def _percentile(times, share):
+    return times[min(len(times) - 1, int(share * len(times)))]
+
+def run_load(connect_args, group, endpoint, requests, concurrency):
+    """
+    Sends ``requests`` requests to one endpoint from ``concurrency`` threads,
+    each on its own keep-alive connection, and returns the latency stats.
+    """
+    with closing(connect(**connect_args)) as connection:
+        status, drawn = call(connection, 'draw', {'group': group, 'seed': 0})
+    if status != 200:
+        raise ValueError(f"Draw of group {group} failed: {drawn['error']}")
+    payload = {'group': group}
+    if endpoint == 'preview':
+        payload.update(rounds=drawn['rounds'], draw_id=drawn['draw_id'])
+    elif endpoint == 'summary':
+        payload.update(rounds=drawn['rounds'], attempts=drawn['attempts'], score=drawn['score'])
+    times, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        with closing(connect(**connect_args)) as connection:
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                start = time.perf_counter()
+                status, body = call(connection, endpoint, payload)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    times.append(elapsed)
+                    if status != 200:
+                        errors.append(body.get('error'))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    times.sort()
+    return {
+        'requests': len(times),
+        'errors': len(errors),
+        'throughput_rps': len(times) / wall,
+        'p50_ms': _percentile(times, 0.5) * 1000,
+        'p95_ms': _percentile(times, 0.95) * 1000,
+        'p99_ms': _percentile(times, 0.99) * 1000,
+        'mean_ms': statistics.mean(times) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the draw service endpoints and report latencies.")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Host of a running service.")
+    parser.add_argument('--port', type=int, help="Port of a running service.")
+    parser.add_argument('--socket', type=str, help="Unix socket of a running service.")
+    parser.add_argument('--config_folder', '-cf', type=str, default="example_config",
+                        help="Without --port or --socket, serve this config in-process on a free port.")
+    parser.add_argument('--group', type=str, help="Group to test (default: the only or first group).")
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS),
+                        help="Endpoints to test.")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Parallel clients.")
+    parser.add_argument('--output', '-o', type=str, help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    server = None
+    if args.port or args.socket:
+        connect_args = {'host': args.host, 'port': args.port, 'socket_path': args.socket}
+    else:
+        server = create_server(DrawService(args.config_folder), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        connect_args = {'host': '127.0.0.1', 'port': server.server_address[1]}
+    try:
+        with closing(connect(**connect_args)) as connection:
+            status, health = call(connection, 'health')
+        group = args.group or health['groups'][0]
+        results = {'group': group, 'requests': args.requests, 'concurrency': args.concurrency, 'endpoints': {}}
+        print(f"Group {group}, {args.requests} requests per endpoint, {args.concurrency} clients")
+        for endpoint in args.endpoints:
+            stats = run_load(connect_args, group, endpoint, args.requests, args.concurrency)
+            results['endpoints'][endpoint] = stats
+            print(f"  {endpoint:<8} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  {stats['throughput_rps']:8.1f} req/s  errors {stats['errors']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if any(stats['errors'] for stats in results['endpoints'].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -17,12 +17,21 @@ class Translations:
             'footer': 'Beste automatisierte Grüße',
         }
     }
+    _instances = {}  # language -> shared instance, see for_language
     
     def __init__(self, language='en'):
         self.language = language
         if language not in self.TRANSLATIONS:
             raise ValueError(f"Language '{language}' is not supported. Available languages: {list(self.TRANSLATIONS.keys())}")
         self.texts = self.TRANSLATIONS[language]
+
+    @classmethod
+    def for_language(cls, language='en'):
+        """Returns a shared Translations instance per language"""
+        instance = cls._instances.get(language)
+        if instance is None:
+            instance = cls._instances[language] = cls(language)
+        return instance
     
     def get_assignment_text(self, is_singular):
         """Get the appropriate assignment text based on count"""
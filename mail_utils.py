@@ -1,16 +1,146 @@
 from email.mime.text import MIMEText
 from email.policy import SMTP
+import os
 import smtplib
+import string
+import threading
+import time
 from localization import Translations
+from metrics import metrics
+
+SMTP_SECURITY = ('ssl', 'starttls', 'none')
+
+class CompiledTemplate:
+    def __init__(self, text):
+        """
+        A str.format template split once into static chunks and placeholders.
+
+        chunks holds the literal text with an empty slot per placeholder, and
+        fields the (slot, name, conversion, format spec) of each placeholder,
+        so rendering only fills the slots and joins.
+        """
+        self.chunks = []
+        self.fields = []
+        for literal, name, spec, conversion in string.Formatter().parse(text):
+            if literal:
+                self.chunks.append(literal)
+            if name is not None:
+                self.fields.append((len(self.chunks), name, conversion, spec))
+                self.chunks.append('')
+
+    def render(self, values):
+        """Same result as text.format(**values) for plain named placeholders"""
+        parts = self.chunks[:]
+        for slot, name, conversion, spec in self.fields:
+            value = values[name]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            parts[slot] = format(value, spec) if spec or not isinstance(value, str) else value
+        return ''.join(parts)
+
+_templates = {}  # path -> (mtime, CompiledTemplate), shared by all handlers
+_templates_lock = threading.Lock()
+
+def load_compiled_template(template_path):
+    """
+    Returns the CompiledTemplate of a file, read and split only once per
+    process and again when the file's mtime changes.
+    """
+    mtime = os.stat(template_path).st_mtime_ns
+    cached = _templates.get(template_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(template_path, "r", encoding="utf-8") as f:
+        template = CompiledTemplate(f.read())
+    with _templates_lock:
+        _templates[template_path] = (mtime, template)
+    return template
+
+class SMTPSession:
+    def __init__(self, sender_email, app_password, host='smtp.gmail.com', port=465, security='ssl',
+                 timeout=30, max_reconnects=2):
+        """
+        An authenticated SMTP connection reused for many messages.
+
+        Opens lazily on the first send, reconnects (and logs in again) when the
+        server drops the connection, and closes when used as a context manager.
+
+        Args:
+            sender_email (str): Login user, skipped together with the password if empty.
+            app_password (str): Login password.
+            host (str), port (int): SMTP server, e.g. a local stand-in for tests.
+            security (str): 'ssl' (SMTP over TLS), 'starttls' or 'none'.
+            timeout (float): Socket timeout in seconds.
+            max_reconnects (int): Reconnects tried per message before giving up.
+        """
+        if security not in SMTP_SECURITY:
+            raise ValueError(f"SMTP security '{security}' is not supported. Available: {list(SMTP_SECURITY)}")
+        self.sender_email = sender_email
+        self.app_password = app_password
+        self.host = host
+        self.port = port
+        self.security = security
+        self.timeout = timeout
+        self.max_reconnects = max_reconnects
+        self.server = None
+        self.connections = 0  # How many connections were opened, for diagnostics
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """Opens and authenticates a new connection"""
+        self.close()
+        if self.security == 'ssl':
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == 'starttls':
+                server.starttls()
+        if self.sender_email:
+            server.login(self.sender_email, self.app_password)
+        self.server = server
+        self.connections += 1
+        return server
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass  # already gone
+        self.server = None
+
+    def send_message(self, msg):
+        """Sends a message, reconnecting if the connection was dropped"""
+        for attempt in range(self.max_reconnects + 1):
+            if self.server is None:
+                self.connect()
+            try:
+                return self.server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.server = None
+                if attempt == self.max_reconnects:
+                    raise
 
 class EmailHandler:
     def __init__(self, config):
         self.config = config
-        self.translator = Translations(config['email'].get('language', 'en'))
+        self.translator = Translations.for_language(config['email'].get('language', 'en'))
         
     def load_template(self, template_path):
         with open(template_path, "r", encoding="utf-8") as f:
             return f.read()
+
+    def compiled_template(self):
+        """The cached CompiledTemplate for the configured language"""
+        return load_compiled_template(f"templates/{self.translator.language}.tmpl")
     
     def format_assignment(self, recipient, round_num, total_rounds, budget):
         """Formats a single assignment line"""
@@ -25,27 +155,76 @@ class EmailHandler:
     
     def generate_email(self, name, assignments, draw_id):
         """Generates complete email HTML for a participant"""
-        template_path = f"templates/{self.translator.language}.tmpl"
-        template = self.load_template(template_path)
-        assignments_html = ''.join(f'<li>🎁 {assignment}</li>' for assignment in assignments)
-        
-        return template.format(
-            name=name,
-            year=self.config['year'],
-            assignments=assignments_html,
-            sender=self.config['email']['sender'],
-            draw_id=draw_id,
-            assignment_text=self.translator.get_assignment_text(len(assignments) == 1)
-        )
+        return self.generate_emails({name: assignments}, draw_id)[name]
+
+    def generate_emails(self, assignments_by_name, draw_id):
+        """
+        Generates the email HTML of many participants at once.
+
+        The template is looked up once for the whole batch and everything
+        that is the same for all mails is prepared once, so each mail is a
+        single join.
+
+        Args:
+            assignments_by_name (dict): name -> list of assignment texts
+
+        Returns:
+            dict: name -> email HTML
+        """
+        start = time.perf_counter() if metrics.enabled else None
+        template = self.compiled_template()
+        values = {
+            'year': self.config['year'],
+            'sender': self.config['email']['sender'],
+            'draw_id': draw_id,
+        }
+        assignment_texts = {
+            True: self.translator.get_assignment_text(True),
+            False: self.translator.get_assignment_text(False),
+        }
+        emails = {}
+        for name, assignments in assignments_by_name.items():
+            values['name'] = name
+            values['assignments'] = ''.join(f'<li>🎁 {assignment}</li>' for assignment in assignments)
+            values['assignment_text'] = assignment_texts[len(assignments) == 1]
+            emails[name] = template.render(values)
+        if start is not None:
+            metrics.add_time('email.render', time.perf_counter() - start, calls=max(1, len(emails)))
+        return emails
     
-    def send_email(self, sender_email, app_password, recipient_email, html_body):
-        """Sends an email using SMTP"""
+    def build_message(self, recipient_email, html_body):
+        """Builds the MIME message for one recipient"""
         msg = MIMEText(html_body, 'html', policy=SMTP)
         msg['Subject'] = self.config['email']['subject']
         msg['From'] = self.config['email']['sender']
         msg['To'] = recipient_email
+        return msg
+
+    def session(self, sender_email, app_password):
+        """
+        Returns an SMTPSession for the server configured under 'email'
+        (smtp_host, smtp_port, smtp_security), Gmail over SSL by default.
+        Use it as a context manager and pass it to send_email.
+        """
+        host, port, security = self.smtp_server()
+        return SMTPSession(sender_email, app_password, host=host, port=port, security=security)
+
+    def smtp_server(self):
+        """(host, port, security) of the configured SMTP server"""
+        email_config = self.config['email']
+        return (
+            email_config.get('smtp_host', 'smtp.gmail.com'),
+            email_config.get('smtp_port', 465),
+            email_config.get('smtp_security', 'ssl'),
+        )
 
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(sender_email, app_password)
-            server.send_message(msg)
-            print(f"Email sent to {recipient_email}")
\ No newline at end of file
+    def send_email(self, sender_email, app_password, recipient_email, html_body, session=None):
+        """Sends an email using SMTP, over ``session`` if given, else on its own connection"""
+        msg = self.build_message(recipient_email, html_body)
+        with metrics.timer('email.send'):
+            if session is not None:
+                session.send_message(msg)
+            else:
+                with self.session(sender_email, app_password) as own_session:
+                    own_session.send_message(msg)
+        print(f"Email sent to {recipient_email}")
\ No newline at end of file
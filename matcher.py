@@ -1,9 +1,38 @@
 from collections import defaultdict
-from itertools import permutations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import multiprocessing
 import random
+import time
+from feasibility import InfeasibleConfigError
+from metrics import metrics, new_round_stats
+from optimizer import RoundSearch
+from counting import (
+    EXACT_LIMIT, count_pairings, estimate_pairings, exact_limit, local_masks, uniform_sampler
+)
+from constraints import (
+    ParticipantIndex, DrawState, ConstraintPlan, compile_round, compile_rounds, popcount, iter_bits,
+    strongly_connected_components
+)
+
+STRATEGIES = ('sample', 'enumerate', 'uniform')
+SOLVERS = ('restart', 'backjump')
+# Smallest round component worth shipping to a component worker process
+PARALLEL_COMPONENT_SIZE = 500
+# Chain samplings repair_pairings tries before releasing more kept pairs
+SPLICE_TRIES = 8
+# Single kept pairs repair_pairings tries to release before releasing random groups
+SINGLE_RELEASE_TRIES = 64
+# Round repairs per round before repair_pairings gives up on rounds blocking each other
+REPAIR_PASSES = 8
+
+def attempt_seed(master_seed, attempt):
+    """Derives the seed of one attempt from the master seed, stable across processes"""
+    digest = hashlib.sha256(f"{master_seed}:{attempt}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
 
 class SecretSantaMatcher:
-    def __init__(self, prevent_reciprocal_pairs=False):
+    def __init__(self, prevent_reciprocal_pairs=False, strategy='sample', solver='restart'):
         """
         Initialize the Secret Santa matcher.
         
@@ -12,10 +41,42 @@ class SecretSantaMatcher:
                 For example, if Alex gives to Beth, Beth cannot give to Alex.
                 This can help make the gift exchange more interesting by ensuring
                 wider interaction between participants across rounds.
+            strategy (str): How a round is drawn. 'sample' (default) builds one
+                random valid pairing directly and scales to large rounds.
+                'enumerate' lists every valid pairing and picks one; it is kept
+                as a reference mode for small rounds only (O(n!)). 'uniform'
+                picks exactly uniformly among all valid pairings using a
+                counting table, for rounds of up to counting.EXACT_LIMIT people.
+            solver (str): How rounds are combined. 'restart' (default) redraws
+                every round when one fails. 'backjump' only redraws the earlier
+                rounds whose history blocked the failing round.
         """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Strategy '{strategy}' is not supported. Available strategies: {list(STRATEGIES)}")
+        if solver not in SOLVERS:
+            raise ValueError(f"Solver '{solver}' is not supported. Available solvers: {list(SOLVERS)}")
         self.prevent_reciprocal_pairs = prevent_reciprocal_pairs
-        self.history = defaultdict(set)  # Tracks who has given to whom across rounds
-        self.pair_history = set()  # Tracks all giver-receiver pairs for reciprocal prevention
+        self.strategy = strategy
+        self.solver = solver
+        self.rng = random  # Replaced by a seeded random.Random per attempt when a seed is given
+        self.seed = None  # Master seed of the last seeded draw
+        self.index = ParticipantIndex()  # Interns names to ids used as bit positions
+        self.state = DrawState()  # Tracks who has given to whom across rounds, as bitmasks
+        self.component_pool = None  # Process pool for large round components during generate_pairings
+
+    @property
+    def history(self):
+        """Receivers per giver drawn so far, by name (decoded from the bitmask state)"""
+        names = self.index.names
+        history = defaultdict(set)
+        for giver, mask in self.state.given.items():
+            history[names[giver]] = {names[receiver] for receiver in iter_bits(mask)}
+        return history
+
+    @property
+    def pair_history(self):
+        """All (giver, receiver) pairs drawn so far, by name"""
+        return {(giver, receiver) for giver, receivers in self.history.items() for receiver in receivers}
         
     def validate_round(self, participants, exclusions=None):
         """
@@ -26,97 +87,825 @@ class SecretSantaMatcher:
         - Respects provided exclusions (e.g., family members)
         - No one gives to the same person twice across rounds
         - If prevent_reciprocal_pairs is True, prevents mutual gift-giving
+
+        This materializes every valid pairing; prefer iter_valid_pairings or
+        select_pairing when only a few of them are needed.
         """
-        exclusion_map = defaultdict(set)
-        
-        if exclusions:
-            for giver, excluded in exclusions.items():
-                for receiver in excluded:
-                    exclusion_map[giver].add(receiver)
-                    exclusion_map[receiver].add(giver)
-        
-        valid = []
-        for perm in permutations(participants):
-            valid_pairing = True
-            pairing = list(zip(participants, perm))
-            pairing_set = set(pairing)
-
-            for giver, receiver in pairing:
-                # Check all pairing rules
-                # Also check for reciprocal pairs inside the same candidate pairing
-                reciprocal_in_current = (receiver, giver) in pairing_set
-                reciprocal_in_history = (receiver, giver) in self.pair_history
-
-                is_invalid = (
-                    giver == receiver or                     # Can't give to self
-                    receiver in exclusion_map[giver] or      # Respect exclusions
-                    receiver in self.history[giver] or       # No repeat receivers across rounds
-                    (self.prevent_reciprocal_pairs and      # Optional: prevent reciprocal pairs
-                     (reciprocal_in_current or reciprocal_in_history))
-                )
+        if not metrics.enabled:
+            return list(self.iter_valid_pairings(participants, exclusions))
+        with metrics.timer('validate_round'):
+            compiled = self._compile(participants, exclusions)
+            stats = new_round_stats()
+            pairings = [self._to_names(pairing)
+                        for pairing in self._iter_pairings(compiled.ids, self._allowed(compiled), stats)]
+        metrics.count_round('validate_round', **stats)
+        return pairings
+
+    def iter_valid_pairings(self, participants, exclusions=None):
+        """
+        Lazily yields every valid pairing for a round as a list of (giver, receiver).
+
+        Pairings come in the same order as filtering itertools.permutations,
+        but partial pairings that already break a rule are pruned instead of
+        being expanded, and nothing but the current pairing is kept in memory.
+        """
+        compiled = self._compile(participants, exclusions)
+        pairings = self._iter_pairings(compiled.ids, self._allowed(compiled))
+        return (self._to_names(pairing) for pairing in pairings)
+
+    def select_pairing(self, participants, exclusions=None, max_candidates=None):
+        """
+        Picks one valid pairing uniformly at random with reservoir sampling.
+
+        Only the current pick is kept, so memory stays O(n) however many valid
+        pairings exist. With max_candidates, enumeration stops after that many
+        candidates and the pick is uniform among those seen (which are the
+        first ones in enumeration order, not a random subset).
+
+        Returns:
+            tuple: (pairing or None, number of candidates seen)
+        """
+        compiled = self._compile(participants, exclusions)
+        chosen, seen = self._select(compiled.ids, self._allowed(compiled), max_candidates)
+        return self._to_names(chosen), seen
+
+    def sample_round(self, participants, exclusions=None, max_repair_steps=None):
+        """
+        Returns one random valid pairing for a round, or None if there is none.
+
+        Uses the same rules as validate_round without enumerating permutations.
+        A random permutation is repaired by swapping receivers between givers,
+        which settles sparse constraints in roughly linear time. If that runs
+        out of steps, an exhaustive randomized backtracking search takes over,
+        so None means the round really has no valid pairing.
+        """
+        compiled = self._compile(participants, exclusions)
+        return self._to_names(self._sample(compiled.ids, self._allowed(compiled), max_repair_steps))
+
+    def count_valid_pairings(self, participants, exclusions=None, samples=1000):
+        """
+        Returns the number of valid pairings of a round under the current
+        history, without enumerating them.
+
+        Rounds up to counting.exact_limit() people are counted exactly with a
+        subset DP; larger ones are estimated from ``samples`` random pairings.
+
+        Returns:
+            tuple: (count, relative standard error), the error being 0.0 for
+                exact counts
+        """
+        compiled = self._compile(participants, exclusions)
+        return self._count(compiled, samples)
+
+    def count_rounds(self, rounds, all_pairings=None, samples=1000):
+        """
+        Counts the valid pairings of every round (see count_valid_pairings).
+
+        With ``all_pairings`` from generate_pairings, each round is counted
+        given the history of the rounds drawn before it, i.e. how much choice
+        that round actually had; without, every round is counted on its own.
+
+        Returns:
+            list: (count, relative standard error) per round
+        """
+        plan = self._plan(rounds)
+        self.state = DrawState()
+        counts = []
+        for number, compiled in enumerate(plan.rounds):
+            counts.append(self._count(compiled, samples))
+            if all_pairings is not None:
+                self._record(all_pairings[number]['pairing'].items())
+        return counts
+
+    def _count(self, compiled, samples):
+        masks = local_masks(compiled.ids, self._allowed(compiled))
+        if len(masks) <= exact_limit(self.prevent_reciprocal_pairs):
+            return count_pairings(masks, self.prevent_reciprocal_pairs), 0.0
+        return estimate_pairings(masks, self.prevent_reciprocal_pairs, samples, self.rng)
+
+    def _compile(self, participants, exclusions):
+        """Compiles an ad hoc round against the matcher's own index"""
+        return compile_round(self.index, participants, exclusions)
+
+    def _allowed(self, compiled):
+        """
+        Layers the history on a compiled round: each giver id maps to the mask
+        of receivers that are static-allowed (not themselves, not excluded),
+        not already given to in an earlier round and, if
+        prevent_reciprocal_pairs, not someone who already gave to them. Only
+        reciprocity inside the round itself is left to the caller.
+        """
+        state = self.state
+        prevent = self.prevent_reciprocal_pairs
+        return {
+            giver: mask & ~state.blocked(giver, prevent)
+            for giver, mask in zip(compiled.ids, compiled.static)
+        }
+
+    def _to_names(self, pairing):
+        if pairing is None:
+            return None
+        names = self.index.names
+        return [(names[giver], names[receiver]) for giver, receiver in pairing]
+
+    def _iter_pairings(self, ids, allowed, stats=None):
+        """
+        Depth-first enumeration over ids, yields lists of (giver id, receiver id).
+
+        If a stats dict is given, every receiver considered for a giver counts
+        as examined, every one ruled out as pruned and every complete pairing
+        as accepted.
+        """
+        assignment = {}
 
-                if is_invalid:
-                    valid_pairing = False
+        def extend(position, used):
+            if position == len(ids):
+                if stats is not None:
+                    stats['accepted'] += 1
+                yield [(giver, assignment[giver]) for giver in ids]
+                return
+            giver = ids[position]
+            options = allowed[giver] & ~used
+            if stats is not None:
+                stats['examined'] += len(ids)
+                stats['pruned'] += len(ids) - popcount(options)
+            for receiver in ids:
+                if not options >> receiver & 1:
+                    continue
+                # Reciprocal pair inside the same candidate pairing
+                if self.prevent_reciprocal_pairs and assignment.get(receiver) == giver:
+                    if stats is not None:
+                        stats['pruned'] += 1
+                    continue
+                assignment[giver] = receiver
+                yield from extend(position + 1, used | (1 << receiver))
+                del assignment[giver]
+
+        return extend(0, 0)
+
+    def _select(self, ids, allowed, max_candidates=None, stats=None):
+        """Reservoir sampling over _iter_pairings, returns (id pairing or None, seen)"""
+        chosen = None
+        seen = 0
+        for pairing in self._iter_pairings(ids, allowed, stats):
+            seen += 1
+            if self.rng.randrange(seen) == 0:
+                chosen = pairing
+            if max_candidates and seen >= max_candidates:
+                break
+        return chosen, seen
+
+    def _sample(self, ids, allowed, max_repair_steps=None, stats=None, prevent_reciprocal_pairs=None):
+        """
+        Repair sampling with backtracking fallback, returns an id pairing or None.
+
+        If a stats dict is given, repair swaps and backtracking assignments
+        count as examined, reverted swaps and dead ends as pruned.
+        ``prevent_reciprocal_pairs`` overrides the matcher's setting, e.g. for
+        ids that are not people.
+        """
+        if not ids:
+            return []
+        if prevent_reciprocal_pairs is None:
+            prevent_reciprocal_pairs = self.prevent_reciprocal_pairs
+
+        def is_allowed(giver, receiver):
+            return allowed[giver] >> receiver & 1
+
+        if max_repair_steps is None:
+            max_repair_steps = 20 * len(ids) + 100
+        pairing = self._repair_sample(list(ids), is_allowed, max_repair_steps, prevent_reciprocal_pairs, stats)
+        if pairing is None:
+            pairing = self._backtrack_sample(ids, allowed, prevent_reciprocal_pairs, stats)
+        if stats is not None and pairing is not None:
+            stats['accepted'] += 1
+        return pairing
+
+    def _repair_sample(self, participants, is_allowed, max_steps, prevent_reciprocal_pairs, stats=None):
+        """Min-conflict repair of a random permutation, None if the step budget runs out"""
+        receivers = participants[:]
+        self.rng.shuffle(receivers)
+        assignment = dict(zip(participants, receivers))
+        owner = {receiver: giver for giver, receiver in assignment.items()}
+
+        def conflicting(giver):
+            receiver = assignment[giver]
+            return not is_allowed(giver, receiver) or (
+                prevent_reciprocal_pairs and assignment[receiver] == giver
+            )
+
+        conflicts = {giver for giver in participants if conflicting(giver)}
+        queue = list(conflicts)  # may hold stale entries, conflicts is authoritative
+        swaps = reverted = 0
+        for _ in range(max_steps):
+            if not conflicts:
+                break
+            idx = self.rng.randrange(len(queue))
+            giver = queue[idx]
+            if giver not in conflicts:
+                queue[idx] = queue[-1]
+                queue.pop()
+                continue
+            other = self.rng.choice(participants)
+            if other == giver:
+                continue
+
+            # A swap only changes the receivers of giver/other and the reciprocal
+            # status of whoever gives to them
+            affected = {giver, other, owner[giver], owner[other]}
+            before = sum(1 for p in affected if p in conflicts)
+            self._swap(assignment, owner, giver, other)
+            swaps += 1
+            now_conflicting = {p for p in affected if conflicting(p)}
+            if len(now_conflicting) > before:
+                self._swap(assignment, owner, giver, other)
+                reverted += 1
+                continue
+            for p in affected:
+                if p in now_conflicting:
+                    if p not in conflicts:
+                        conflicts.add(p)
+                        queue.append(p)
+                else:
+                    conflicts.discard(p)
+
+        if stats is not None:
+            stats['examined'] += swaps
+            stats['pruned'] += reverted
+        if not conflicts:
+            return [(giver, assignment[giver]) for giver in participants]
+        return None
+
+    @staticmethod
+    def _swap(assignment, owner, giver, other):
+        receiver, other_receiver = assignment[giver], assignment[other]
+        assignment[giver], assignment[other] = other_receiver, receiver
+        owner[other_receiver], owner[receiver] = giver, other
+
+    def _backtrack_sample(self, participants, allowed, prevent_reciprocal_pairs, stats=None):
+        """Exhaustive randomized backtracking, most constrained giver first"""
+        assignment = {}
+        stack = []  # (giver, untried receivers) per decision level
+        tried = dead_ends = 0
+        while len(assignment) < len(participants):
+            giver, options = self._most_constrained(participants, allowed, assignment, prevent_reciprocal_pairs)
+            if options:
+                stack.append((giver, options))
+            else:
+                dead_ends += 1
+            # Take the next untried option of the deepest open decision
+            while True:
+                if not stack:
                     break
+                giver, options = stack[-1]
+                assignment.pop(giver, None)
+                if options:
+                    assignment[giver] = options.pop()
+                    tried += 1
+                    break
+                stack.pop()
+            if not stack:
+                break
+        if stats is not None:
+            stats['examined'] += tried
+            stats['pruned'] += dead_ends
+        if len(assignment) < len(participants):
+            return None
+        return [(giver, assignment[giver]) for giver in participants]
 
-            if valid_pairing:
-                valid.append(pairing)
-        
-        return valid
+    def _most_constrained(self, participants, allowed, assignment, prevent_reciprocal_pairs):
+        """Returns the unassigned giver with the fewest remaining options (shuffled)"""
+        used = 0
+        owner = {}
+        for giver, receiver in assignment.items():
+            used |= 1 << receiver
+            owner[receiver] = giver
+        best = None
+        best_count = None
+        for giver in participants:
+            if giver in assignment:
+                continue
+            options = allowed[giver] & ~used
+            if prevent_reciprocal_pairs and giver in owner:
+                options &= ~(1 << owner[giver])
+            count = popcount(options)
+            if best is None or count < best_count:
+                best, best_count = (giver, options), count
+                if not count:
+                    break
+        giver, options = best
+        options = list(iter_bits(options))
+        self.rng.shuffle(options)
+        return giver, options
+
+    def _draw_round(self, strategy, compiled, max_candidates=None, round_num=None):
+        """Draws one pairing for a compiled round, returns (pairing or None, candidate count)"""
+        if metrics.enabled:
+            return self._measured_draw_round(strategy, compiled, max_candidates, round_num)
+        allowed = self._allowed(compiled)
+        if strategy == 'enumerate':
+            chosen, seen = self._select(compiled.ids, allowed, max_candidates)
+            return self._to_names(chosen), seen
+        chosen = self._solve_components(strategy, compiled.ids, allowed)
+        return self._to_names(chosen), int(chosen is not None)
+
+    def _solve_components(self, strategy, ids, allowed, stats=None):
+        """
+        Draws a round ('sample' or 'uniform') one strongly connected component
+        at a time and merges the pairings.
+
+        A gift cycle never leaves a component, so components are independent:
+        several small searches replace one large one, a component of one
+        person proves the round impossible at once, and 'uniform' only needs
+        each component to be within its size limit. Each decomposed component
+        draws from its own seed taken from self.rng, so the result does not
+        depend on whether large components run in self.component_pool.
+        """
+        components = strongly_connected_components(ids, allowed)
+        if len(components) == 1:
+            if strategy == 'uniform':
+                return self._uniform_sample(ids, allowed, stats)
+            return self._sample(ids, allowed, stats=stats)
+        metrics.count('draw.components', len(components))
+        if any(popcount(component) == 1 for component in components):
+            return None  # someone could only give to people who cannot give back into their cycle
+        pool = self.component_pool
+        pairings = []
+        futures = []
+        for component in components:
+            component_ids = tuple(iter_bits(component))
+            task = (self.prevent_reciprocal_pairs, strategy, component_ids,
+                    {giver: allowed[giver] & component for giver in component_ids}, self.rng.getrandbits(64))
+            if pool is not None and len(component_ids) >= PARALLEL_COMPONENT_SIZE:
+                futures.append(pool.submit(_solve_component, *task))
+            else:
+                pairings.append(_solve_component(*task, stats=stats))
+        pairings += [future.result() for future in futures]
+        if any(pairing is None for pairing in pairings):
+            return None
+        merged = {}
+        for pairing in pairings:
+            merged.update(pairing)
+        return [(giver, merged[giver]) for giver in ids]
+
+    def _uniform_sample(self, ids, allowed, stats=None):
+        """Exactly uniform id pairing from the counting table, or None"""
+        if len(ids) > EXACT_LIMIT:
+            raise ValueError(
+                f"Strategy 'uniform' supports rounds of up to {EXACT_LIMIT} participants, "
+                f"this round has {len(ids)}. Use strategy 'sample' for large rounds."
+            )
+        pairing = uniform_sampler(tuple(local_masks(ids, allowed)), self.prevent_reciprocal_pairs).sample(self.rng)
+        if pairing is None:
+            return None
+        if stats is not None:
+            stats['accepted'] += 1
+        return [(ids[giver], ids[receiver]) for giver, receiver in pairing]
+
+    def _measured_draw_round(self, strategy, compiled, max_candidates, round_num):
+        """_draw_round with its time and search statistics recorded in metrics"""
+        stats = new_round_stats()
+        with metrics.timer('draw.round'):
+            allowed = self._allowed(compiled)
+            if strategy == 'enumerate':
+                chosen, seen = self._select(compiled.ids, allowed, max_candidates, stats)
+            else:
+                chosen = self._solve_components(strategy, compiled.ids, allowed, stats)
+                seen = int(chosen is not None)
+        metrics.count_round(round_num, **stats)
+        return self._to_names(chosen), seen
     
-    def generate_pairings(self, rounds, max_attempts=50):
+    def generate_pairings(self, rounds, max_attempts=50, strategy=None, max_candidates=None,
+                          solver=None, check_feasibility=True, seed=None, workers=1, component_workers=1):
         """Generates pairings for all rounds.
 
         This method will attempt up to ``max_attempts`` independent draws.
         Each attempt restarts history and makes random choices per round. If an
         attempt reaches a round with zero valid pairings, it is abandoned and
         retried. If all attempts fail, a ValueError with diagnostics is raised.
-        """
-        attempt_diagnostics = []
 
-        for attempt in range(1, max_attempts + 1):
-            # reset state for this attempt
-            self.history.clear()
-            self.pair_history.clear()
-            all_pairings = []
-            success = True
-            per_round_candidate_counts = []
-
-            for round_num, round_config in enumerate(rounds, 1):
-                valid = self.validate_round(
-                    round_config['participants'],
-                    round_config.get('exclusions', {})
-                )
+        With ``solver='backjump'`` (or the matcher's solver) a failing round
+        does not restart the draw; see _solve_backjump. There, every backjump
+        counts as one attempt.
 
-                per_round_candidate_counts.append((round_num, len(valid)))
+        ``rounds`` is either the config's list of rounds or a ConstraintPlan
+        from constraints.compile_rounds; passing a plan skips recompiling the
+        static constraints when drawing the same config repeatedly.
 
-                if not valid:
-                    success = False
-                    break
+        Unless ``check_feasibility`` is False, a config that the plan's
+        feasibility analysis proves impossible raises InfeasibleConfigError
+        (a ValueError) before any drawing.
 
-                chosen = random.choice(valid)
-                all_pairings.append({
-                    'pairing': dict(chosen),
-                    'budget': round_config.get('budget')
-                })
+        ``strategy`` overrides the matcher's strategy for this call. With
+        'sample' and 'uniform' the per-round diagnostics count the pairings
+        found (0 or 1; count_rounds gives the real sizes),
+        with 'enumerate' they count the valid pairings seen, which is capped
+        by ``max_candidates`` if given.
+
+        With a ``seed``, attempt k draws from random.Random(attempt_seed(seed, k)),
+        so the master seed and the returned attempt number reproduce a draw
+        (see replay_attempt). With ``workers`` > 1 the attempts of the restart
+        solver run in a process pool; the first successful one wins, the
+        pending ones are cancelled and the running ones stop at their next
+        round. A master seed is picked if none is given.
+        The seed used is kept in ``self.seed``.
+
+        Rounds are drawn per strongly connected component (see
+        _solve_components). With ``component_workers`` > 1, components of at
+        least PARALLEL_COMPONENT_SIZE people are drawn in a process pool of
+        that size; this applies to draws in this process, not to the workers
+        of parallel attempts.
+        """
+        strategy = strategy or self.strategy
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Strategy '{strategy}' is not supported. Available strategies: {list(STRATEGIES)}")
+        solver = solver or self.solver
+        if solver not in SOLVERS:
+            raise ValueError(f"Solver '{solver}' is not supported. Available solvers: {list(SOLVERS)}")
+        if workers > 1 and solver != 'restart':
+            raise ValueError("Parallel attempts (workers > 1) are only supported by the 'restart' solver.")
+        plan = self._plan(rounds)
+        if check_feasibility and plan.problems:
+            raise InfeasibleConfigError(list(plan.problems))
+        if seed is None and workers > 1:
+            seed = random.getrandbits(32)
+        self.seed = seed
+
+        if component_workers > 1:
+            self.component_pool = ProcessPoolExecutor(max_workers=component_workers)
+            try:
+                return self._generate(plan, max_attempts, strategy, max_candidates, solver, seed, workers)
+            finally:
+                self.component_pool.shutdown(wait=True)
+                self.component_pool = None
+        return self._generate(plan, max_attempts, strategy, max_candidates, solver, seed, workers)
 
-                # Update history
-                for giver, receiver in chosen:
-                    self.history[giver].add(receiver)
-                    self.pair_history.add((giver, receiver))
+    def _generate(self, plan, max_attempts, strategy, max_candidates, solver, seed, workers):
+        """Runs the chosen solver for generate_pairings"""
+        if solver == 'backjump':
+            if seed is not None:
+                self.rng = random.Random(attempt_seed(seed, 1))
+            with metrics.timer('draw.backjump'):
+                return self._solve_backjump(plan.rounds, max_attempts, strategy, max_candidates)
 
-            if success:
+        if workers > 1:
+            with metrics.timer('draw.parallel_attempts'):
+                return self._parallel_attempts(plan, max_attempts, strategy, max_candidates, seed, workers)
+
+        attempt_diagnostics = []
+        for attempt in range(1, max_attempts + 1):
+            if seed is not None:
+                self.rng = random.Random(attempt_seed(seed, attempt))
+            with metrics.timer('draw.attempt'):
+                all_pairings, per_round_candidate_counts = self._attempt(plan, strategy, max_candidates)
+            if all_pairings is not None:
                 return all_pairings, attempt
 
             attempt_diagnostics.append({
                 'attempt': attempt,
                 'per_round_candidate_counts': per_round_candidate_counts,
             })
+        raise self._attempts_error(max_attempts, strategy, attempt_diagnostics)
+
+    def replay_attempt(self, rounds, seed, attempt, strategy=None, max_candidates=None):
+        """
+        Re-runs one seeded attempt of the restart solver and returns its
+        pairings, e.g. to reproduce a parallel draw from its master seed and
+        attempt number. Raises ValueError if that attempt did not succeed.
+        """
+        plan = self._plan(rounds)
+        self.seed = seed
+        self.rng = random.Random(attempt_seed(seed, attempt))
+        all_pairings, per_round_candidate_counts = self._attempt(plan, strategy or self.strategy, max_candidates)
+        if all_pairings is None:
+            raise self._attempts_error(1, strategy or self.strategy, [{
+                'attempt': attempt, 'per_round_candidate_counts': per_round_candidate_counts
+            }])
+        return all_pairings
+
+    def repair_pairings(self, rounds, previous_pairings):
+        """
+        Adapts an earlier draw to changed rounds instead of drawing again.
+
+        ``rounds`` (config rounds or a ConstraintPlan) are the rounds as they
+        are now, e.g. with participants added or removed, and
+        ``previous_pairings`` the result of the earlier draw for the same
+        number of rounds. Every pair that is still allowed is kept. Only the
+        givers left without a receiver (their receiver left, they joined, or
+        their pair broke a new rule) are matched again, by splicing them into
+        the existing gift chains, which are checked against exclusions, the
+        other rounds and reciprocity like a fresh draw. If the chains cannot be
+        closed, single kept pairs are released one at a time, then random
+        groups of 2, 4, ... up to redrawing the whole round. So when releasing
+        one pair per round suffices (the common case), at most one giver per
+        round changes beyond the ones left without a receiver.
+
+        If the other rounds leave a round no valid pairing, random pairs of
+        theirs among the round's members are released (1, 2, 4, ...) and those
+        rounds are repaired again in turn. Configs the feasibility analysis
+        proves impossible raise InfeasibleConfigError.
+
+        Returns:
+            tuple: (all_pairings, sorted names of givers still in some round
+                whose receiver was added, changed or removed in any round,
+                i.e. who need a new mail)
+        """
+        plan = self._plan(rounds)
+        if len(previous_pairings) != len(plan.rounds):
+            raise ValueError(
+                f"The earlier draw has {len(previous_pairings)} rounds but the config has {len(plan.rounds)}; "
+                "repair only works on the same rounds."
+            )
+        if plan.problems:
+            raise InfeasibleConfigError(list(plan.problems))
+        ids = plan.ids
+        current = []
+        for compiled, round_data in zip(plan.rounds, previous_pairings):
+            members = set(compiled.participants)
+            current.append({
+                ids[giver]: ids[receiver] for giver, receiver in round_data['pairing'].items()
+                if giver in members and receiver in members
+            })
 
-        # All attempts failed — build a helpful error message
+        pending = list(range(len(plan.rounds)))
+        passes = REPAIR_PASSES * len(plan.rounds)
+        while pending:
+            number = pending.pop(0)
+            passes -= 1
+            pairing, released = self._repair_blocked(plan.rounds, current, number)
+            if pairing is None or passes < 0:
+                raise ValueError(
+                    f"Round {number + 1} cannot be repaired: it has no valid pairing next to the other rounds, "
+                    "even after releasing pairs of theirs.\nRun a fresh draw instead."
+                )
+            current[number] = pairing
+            pending.extend(other for other in sorted(released) if other not in pending)
+
+        names = self.index.names
+        all_pairings = [
+            {'pairing': {names[giver]: names[pairing[giver]] for giver in compiled.ids}, 'budget': compiled.budget}
+            for compiled, pairing in zip(plan.rounds, current)
+        ]
+        # Compared on the unfiltered earlier draw, so a giver who left some
+        # rounds but not all of them is mailed again as well
+        remaining = {name for compiled in plan.rounds for name in compiled.participants}
+        changed = set()
+        for before, after in zip(previous_pairings, all_pairings):
+            before, after = before['pairing'], after['pairing']
+            changed.update(giver for giver in set(before) | set(after)
+                           if giver in remaining and before.get(giver) != after.get(giver))
+        return all_pairings, sorted(changed)
+
+    def _repair_blocked(self, compiled_rounds, current, number):
+        """
+        Repairs round ``number`` with every other round of ``current`` as
+        history, so it cannot clash with any of them. While that fails, random
+        pairs of the other rounds between members of this round (1, 2, 4, ...)
+        are removed from ``current``. Returns (pairing or None, numbers of the
+        rounds that lost pairs).
+        """
+        compiled = compiled_rounds[number]
+        members = 0
+        for pid in compiled.ids:
+            members |= 1 << pid
+        released = set()
+        release = 1
+        while True:
+            self.state = DrawState()
+            for other, pairing in enumerate(current):
+                if other != number:
+                    self.state.record(pairing.items())
+            pairing = self._repair_round(compiled, current[number])
+            if pairing is not None:
+                return pairing, released
+            blocking = [
+                (other, giver) for other, pairing in enumerate(current) if other != number
+                for giver, receiver in pairing.items() if members >> giver & 1 and members >> receiver & 1
+            ]
+            if not blocking:
+                return None, released
+            for other, giver in self.rng.sample(blocking, min(release, len(blocking))):
+                del current[other][giver]
+                released.add(other)
+            release *= 2
+
+    def _repair_round(self, compiled, pairing):
+        """
+        Keeps the allowed pairs of a round and rematches the rest, releasing
+        single kept pairs (see _release_one), then random groups of kept pairs
+        (2, 4, ...) while the rest cannot be matched. Returns the full id
+        pairing as a dict, or None.
+        """
+        allowed = self._allowed(compiled)
+        kept = {giver: receiver for giver, receiver in pairing.items() if allowed[giver] >> receiver & 1}
+        if self.prevent_reciprocal_pairs:
+            kept = {giver: receiver for giver, receiver in kept.items() if kept.get(receiver) != giver}
+        release = 1
+        while True:
+            if len(kept) == len(compiled.ids):
+                return kept
+            if not kept:
+                chosen = self._sample(compiled.ids, allowed)
+                return dict(chosen) if chosen is not None else None
+            new_pairs = self._splice(compiled.ids, kept, allowed)
+            if new_pairs is not None:
+                kept.update(new_pairs)
+                return kept
+            if release == 1:
+                repaired = self._release_one(compiled.ids, kept, allowed)
+                if repaired is not None:
+                    return repaired
+                release = 2
+            for giver in self.rng.sample(sorted(kept), min(release, len(kept))):
+                del kept[giver]
+            release *= 2
+
+    def _release_one(self, ids, kept, allowed):
+        """
+        Tries to close the chains after releasing a single kept pair a -> b.
+        Only pairs where some chain end may give to b and a may give to some
+        chain start are tried, in random order and at most
+        SINGLE_RELEASE_TRIES of them. Returns the full id pairing, or None.
+        """
+        receiving = set(kept.values())
+        starts = 0
+        for pid in ids:
+            if pid not in receiving:
+                starts |= 1 << pid
+        reach = 0
+        for pid in ids:
+            if pid not in kept:
+                reach |= allowed[pid]
+        candidates = [
+            giver for giver, receiver in kept.items() if reach >> receiver & 1 and allowed[giver] & starts
+        ]
+        for giver in self.rng.sample(candidates, min(SINGLE_RELEASE_TRIES, len(candidates))):
+            trial = dict(kept)
+            del trial[giver]
+            new_pairs = self._splice(ids, trial, allowed)
+            if new_pairs is not None:
+                trial.update(new_pairs)
+                return trial
+        return None
+
+    def _splice(self, ids, kept, allowed):
+        """
+        Closes the open gift chains of a round into cycles.
+
+        The kept pairs form chains from a receiver nobody gives to (start) to
+        a giver without a receiver (end). Linking the end of one chain to the
+        start of another is a permutation over chains, so the chains are drawn
+        with _sample like the participants of a tiny round. Returns the new
+        (giver id, receiver id) pairs, or None.
+        """
+        receiving = set(kept.values())
+        chains = []  # (start, end, length)
+        for start in ids:
+            if start in receiving:
+                continue
+            end, length = start, 1
+            while end in kept:
+                end, length = kept[end], length + 1
+            chains.append((start, end, length))
+        chain_allowed = {}
+        for position, (_, end, length) in enumerate(chains):
+            mask = 0
+            for other, (start, _, _) in enumerate(chains):
+                if not allowed[end] >> start & 1:
+                    continue
+                if other == position and self.prevent_reciprocal_pairs and length == 2:
+                    continue  # closing a two-person chain would give back
+                mask |= 1 << other
+            chain_allowed[position] = mask
+        # Two chains linked both ways form one longer cycle, that is only a
+        # reciprocal pair if both chains are single people
+        for _ in range(SPLICE_TRIES):
+            links = self._sample(list(range(len(chains))), chain_allowed, prevent_reciprocal_pairs=False)
+            if links is None:
+                return None
+            links = dict(links)
+            if not self.prevent_reciprocal_pairs or not any(
+                    links[other] == position and chains[position][2] == chains[other][2] == 1
+                    for position, other in links.items() if other != position):
+                return {chains[position][1]: chains[other][0] for position, other in links.items()}
+        return None
+
+    def optimize_pairings(self, rounds, all_pairings, objective, time_budget=1.0):
+        """
+        Improves a valid draw under an optimizer.Objective by local search.
+
+        Each round in turn runs a RoundSearch with every other round as
+        history, so the rules between rounds keep holding, on an equal share
+        of the ``time_budget`` seconds left (a round that reaches cost 0
+        early leaves its time to the next ones).
+
+        Returns:
+            tuple: (all_pairings, score dict of objective.score with the
+                'initial' total before optimizing)
+        """
+        deadline = time.perf_counter() + time_budget
+        plan = self._plan(rounds)
+        if len(all_pairings) != len(plan.rounds):
+            raise ValueError(f"The draw has {len(all_pairings)} rounds but the config has {len(plan.rounds)}.")
+        initial = objective.score(all_pairings)['total']
+        ids = plan.ids
+        current = [
+            {ids[giver]: ids[receiver] for giver, receiver in round_data['pairing'].items()}
+            for round_data in all_pairings
+        ]
+        pair_cost = objective.pair_costs(plan.names)
+        for number, compiled in enumerate(plan.rounds):
+            self.state = DrawState()
+            for other, pairing in enumerate(current):
+                if other != number:
+                    self.state.record(pairing.items())
+            search = RoundSearch(
+                current[number], self._allowed(compiled), pair_cost, objective.weights['short_cycle'],
+                objective.short_cycle_length, self.prevent_reciprocal_pairs, self.rng
+            )
+            now = time.perf_counter()
+            with metrics.timer('draw.optimize'):
+                current[number] = search.run(now + max(0.0, deadline - now) / (len(plan.rounds) - number))
+            metrics.count('draw.optimize_moves', search.moves)
+
+        names = self.index.names
+        all_pairings = [
+            {'pairing': {names[giver]: names[pairing[giver]] for giver in compiled.ids}, 'budget': compiled.budget}
+            for compiled, pairing in zip(plan.rounds, current)
+        ]
+        score = objective.score(all_pairings)
+        score['initial'] = initial
+        return all_pairings, score
+
+    def _attempt(self, plan, strategy, max_candidates, stop=None):
+        """
+        One restart-solver attempt, returns (pairings or None, per round
+        candidate counts). A set ``stop`` event (see _parallel_attempts) ends
+        the attempt unsuccessfully before its next round.
+        """
+        # reset state for this attempt
+        self.state = DrawState()
+        all_pairings = []
+        per_round_candidate_counts = []
+
+        for round_num, compiled in enumerate(plan.rounds, 1):
+            if stop is not None and stop.is_set():
+                return None, per_round_candidate_counts
+            chosen, candidate_count = self._draw_round(strategy, compiled, max_candidates, round_num)
+
+            per_round_candidate_counts.append((round_num, candidate_count))
+
+            if chosen is None:
+                return None, per_round_candidate_counts
+
+            all_pairings.append({
+                'pairing': dict(chosen),
+                'budget': compiled.budget
+            })
+
+            self._record(chosen)
+
+        return all_pairings, per_round_candidate_counts
+
+    def _parallel_attempts(self, plan, max_attempts, strategy, max_candidates, seed, workers):
+        """
+        Fans the attempts out over a process pool, the first success wins.
+        Then the pending attempts are cancelled and the running ones stop at
+        their next round through a shared event, so the pool shuts down
+        without finishing them.
+        """
+        attempt_diagnostics = []
+        stop = multiprocessing.Event()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.prevent_reciprocal_pairs, plan, strategy, max_candidates, seed, stop),
+        )
+        futures = []
+        try:
+            futures = [pool.submit(_run_worker_attempt, attempt) for attempt in range(1, max_attempts + 1)]
+            for future in as_completed(futures):
+                attempt, all_pairings, per_round_candidate_counts = future.result()
+                if all_pairings is not None:
+                    return all_pairings, attempt
+                attempt_diagnostics.append({
+                    'attempt': attempt,
+                    'per_round_candidate_counts': per_round_candidate_counts,
+                })
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+        attempt_diagnostics.sort(key=lambda diag: diag['attempt'])
+        raise self._attempts_error(max_attempts, strategy, attempt_diagnostics)
+
+    def _attempts_error(self, max_attempts, strategy, attempt_diagnostics):
+        """Builds the ValueError raised when all attempts failed"""
         msg_lines = [
             f"No valid full pairing found after {max_attempts} attempts.",
-            "Per-attempt diagnostics (round: candidate_count):"
+            f"Per-attempt diagnostics (round: candidate_count, strategy '{strategy}'):"
         ]
         for diag in attempt_diagnostics[-5:]:  # show last few attempts
             parts = [f"Attempt {diag['attempt']}: "]
@@ -126,5 +915,177 @@ class SecretSantaMatcher:
         msg_lines.append(
             "Possible causes: overly strict exclusions/history or small participant sets."
         )
-        msg_lines.append("Consider increasing 'matching.max_attempts' in config or enabling backtracking.")
-        raise ValueError("\n".join(msg_lines))
\ No newline at end of file
+        msg_lines.append(
+            "Consider increasing 'matching.max_attempts' in config or setting 'matching.solver: backjump'."
+        )
+        return ValueError("\n".join(msg_lines))
+
+    def _plan(self, rounds):
+        """Returns the ConstraintPlan for rounds and adopts its participant index"""
+        if isinstance(rounds, ConstraintPlan):
+            plan = rounds
+            if plan.prevent_reciprocal_pairs != self.prevent_reciprocal_pairs:
+                raise ValueError("The plan was compiled with a different prevent_reciprocal_pairs setting.")
+        else:
+            plan = compile_rounds(rounds, self.prevent_reciprocal_pairs)
+        self.index = ParticipantIndex(plan.names)
+        return plan
+
+    def _record(self, pairing):
+        """Adds a drawn pairing to the history"""
+        intern = self.index.intern
+        self.state.record((intern(giver), intern(receiver)) for giver, receiver in pairing)
+
+    def _solve_backjump(self, rounds, max_attempts, strategy, max_candidates,
+                        max_redraws=3, max_tries=20):
+        """
+        Draws rounds in order with conflict-directed backjumping.
+
+        Earlier rounds only constrain a later round through the history they
+        add. When a round has no valid pairing, its conflict set is shrunk to
+        the earlier rounds that are actually needed to block it (latest ones
+        are dropped first), and the solver jumps back to the latest culprit.
+        Every round before it is kept as drawn. The culprit is redrawn until
+        the failed round is drawable again on top of it (a nogood), and
+        inherits the remaining culprits so that after ``max_redraws`` blames
+        it can pass the failure further back. An empty conflict set means the
+        round is impossible on its own. A full restart every few backjumps
+        keeps an unlucky early choice from trapping the search.
+        """
+        chosen = [None] * len(rounds)
+        conflicts = [set() for _ in rounds]  # culprit rounds inherited from later failures
+        nogoods = [[] for _ in rounds]  # (failed round, other culprits) to resolve per round
+        prefix_states = [DrawState()] + [None] * len(rounds)  # history before each round
+        backjumps = 0
+        restart_every = 4 * len(rounds)  # cuts off the heavy tail of unlucky searches
+        index = 0
+
+        while index < len(rounds):
+            compiled = rounds[index]
+            pairing = None
+            # Give up on a round after max_redraws blames, unless nothing earlier could be revised
+            exhausted = bool(conflicts[index]) and len(nogoods[index]) >= max_redraws
+            if not exhausted:
+                for _ in range(max_tries):
+                    self.state = prefix_states[index].copy()
+                    candidate, _ = self._draw_round(strategy, compiled, max_candidates, index + 1)
+                    if candidate is None:
+                        break
+                    if all(self._unblocks(rounds[failed], [chosen[r] for r in others] + [candidate])
+                           for failed, others in nogoods[index]):
+                        pairing = candidate
+                        break
+                else:
+                    exhausted = True  # only pairings that keep a later round blocked came up
+
+            if pairing is not None:
+                chosen[index] = pairing
+                self.state = prefix_states[index].copy()
+                self._record(pairing)
+                prefix_states[index + 1] = self.state
+                index += 1
+                continue
+
+            if backjumps + 1 >= max_attempts:
+                raise ValueError(
+                    f"No valid full pairing found after {max_attempts} attempts (backjumps).\n"
+                    f"Round {index + 1} stayed blocked, last culprits: "
+                    f"{sorted(r + 1 for r in conflicts[index]) or 'none'}.\n"
+                    "Consider increasing 'matching.max_attempts' in config."
+                )
+            backjumps += 1
+            metrics.count('draw.backjumps')
+            if backjumps % restart_every == 0:
+                chosen = [None] * len(rounds)
+                conflicts = [set() for _ in rounds]
+                nogoods = [[] for _ in rounds]
+                index = 0
+                continue
+
+            if exhausted:
+                # The round itself is drawable, only the later rounds it was
+                # blamed for failed; blame whatever they blamed besides it
+                culprits = set(conflicts[index])
+                if not culprits:
+                    continue  # nothing earlier to revise, keep drawing this round
+            else:
+                blocking = self._blocking_rounds(chosen, index, compiled)
+                if not blocking:
+                    raise ValueError(
+                        f"Round {index + 1} has no valid pairing even without history from other rounds.\n"
+                        "Possible causes: overly strict exclusions or small participant sets."
+                    )
+                culprits = conflicts[index] | blocking
+
+            target = max(culprits)
+            conflicts[target] |= culprits - {target}
+            if not exhausted:
+                nogoods[target].append((index, tuple(culprits - {target})))
+            for later in range(target + 1, len(rounds)):
+                chosen[later] = None
+                conflicts[later] = set()
+                nogoods[later] = []
+            index = target
+
+        all_pairings = [
+            {'pairing': dict(pairing), 'budget': compiled.budget}
+            for pairing, compiled in zip(chosen, rounds)
+        ]
+        return all_pairings, backjumps + 1
+
+    def _unblocks(self, compiled, pairings):
+        """True if the round has a valid pairing on top of the given history"""
+        self._set_history(pairings)
+        return self._sample(compiled.ids, self._allowed(compiled)) is not None
+
+    def _set_history(self, pairings):
+        """Replaces the history with the given pairings"""
+        self.state = DrawState()
+        for pairing in pairings:
+            self._record(pairing)
+
+    def _blocking_rounds(self, chosen, index, compiled):
+        """
+        Returns earlier rounds whose history is needed to leave round ``index``
+        without a valid pairing (a deletion filter, latest rounds first).
+        """
+        group = set(compiled.participants)
+        culprits = {earlier for earlier in range(index) if self._edges_within(chosen[earlier], group)}
+        for earlier in sorted(culprits, reverse=True):
+            if not self._unblocks(compiled, [chosen[r] for r in culprits if r != earlier]):
+                culprits.discard(earlier)
+        return culprits
+
+    @staticmethod
+    def _edges_within(pairing, group):
+        """Edges of a pairing with both ends in group, the only ones that constrain that group"""
+        return frozenset((giver, receiver) for giver, receiver in pairing
+                         if giver in group and receiver in group)
+
+
+# Per-process state of the parallel attempt workers, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(prevent_reciprocal_pairs, plan, strategy, max_candidates, seed, stop):
+    matcher = SecretSantaMatcher(prevent_reciprocal_pairs=prevent_reciprocal_pairs, strategy=strategy)
+    matcher._plan(plan)
+    _worker.update(matcher=matcher, plan=plan, strategy=strategy, max_candidates=max_candidates, seed=seed, stop=stop)
+
+
+def _run_worker_attempt(attempt):
+    matcher = _worker['matcher']
+    matcher.rng = random.Random(attempt_seed(_worker['seed'], attempt))
+    all_pairings, per_round_candidate_counts = matcher._attempt(
+        _worker['plan'], _worker['strategy'], _worker['max_candidates'], _worker['stop']
+    )
+    return attempt, all_pairings, per_round_candidate_counts
+
+
+def _solve_component(prevent_reciprocal_pairs, strategy, ids, allowed, seed, stats=None):
+    """Draws one round component with its own seeded matcher, returns an id pairing or None"""
+    matcher = SecretSantaMatcher(prevent_reciprocal_pairs=prevent_reciprocal_pairs)
+    matcher.rng = random.Random(seed)
+    if strategy == 'uniform':
+        return matcher._uniform_sample(ids, allowed, stats)
+    return matcher._sample(ids, allowed, stats=stats)
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+
+
+class _Timer:
+    """Context manager adding its elapsed time to a Metrics timer"""
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    """Shared do-nothing timer handed out while metrics are disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Timers and counters for the hot paths of a draw.
+
+    Disabled by default: timer() then returns a shared no-op context manager
+    and callers check ``enabled`` before collecting anything, so the
+    instrumented code pays one attribute lookup per call. Thread-safe, but
+    only the current process is measured (parallel draw attempts run in
+    worker processes and only show up as the timer around them).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.timers = {}  # name -> [calls, total seconds, max seconds]
+        self.counters = {}  # name -> int
+        self.rounds = {}  # round label -> {'examined', 'pruned', 'accepted', 'draws'}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def timer(self, name):
+        """Context manager timing a block under ``name``"""
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def add_time(self, name, seconds, calls=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [calls, seconds, seconds / calls]
+            else:
+                timer[0] += calls
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds / calls)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_round(self, label, examined=0, pruned=0, accepted=0):
+        """Adds the search statistics of one round draw"""
+        if not self.enabled:
+            return
+        with self.lock:
+            stats = self.rounds.setdefault(label, {'examined': 0, 'pruned': 0, 'accepted': 0, 'draws': 0})
+            stats['examined'] += examined
+            stats['pruned'] += pruned
+            stats['accepted'] += accepted
+            stats['draws'] += 1
+
+    def snapshot(self):
+        """Returns everything recorded so far as a JSON-serializable dict"""
+        with self.lock:
+            return {
+                'timers': {
+                    name: {'calls': calls, 'total_s': total, 'mean_s': total / calls, 'max_s': longest}
+                    for name, (calls, total, longest) in sorted(self.timers.items())
+                },
+                'counters': dict(sorted(self.counters.items())),
+                'rounds': {str(label): dict(stats) for label, stats in self.rounds.items()},
+            }
+
+    def write(self, path, **extra):
+        """Writes the snapshot (plus any extra top-level fields) as JSON"""
+        data = dict(extra)
+        data.update(self.snapshot())
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def new_round_stats():
+    """Counters a round draw fills in while metrics are enabled"""
+    return {'examined': 0, 'pruned': 0, 'accepted': 0}
+
+
+# Process-wide instance used by the matcher, the email handler and draw.py
+metrics = Metrics()
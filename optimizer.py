@@ -0,0 +1,230 @@
+import time
+
+# Penalty per unwanted feature of a pairing, see Objective
+DEFAULT_WEIGHTS = {
+    'repeat': 3.0,  # giver had this receiver in an earlier year
+    'same_department': 1.0,  # giver and receiver are in the same department
+    'short_cycle': 1.0,  # per person in a gift cycle of at most short_cycle_length people
+}
+DEFAULT_SHORT_CYCLE_LENGTH = 3
+
+# Iterations between two clock checks of RoundSearch.run
+CLOCK_INTERVAL = 256
+
+class Objective:
+    def __init__(self, weights=None, departments=None, past_receivers=None,
+                 short_cycle_length=DEFAULT_SHORT_CYCLE_LENGTH):
+        """
+        Penalty of a draw, lower is better.
+
+        Every pair costs ``weights['repeat']`` if the giver had the receiver
+        in an earlier year (``past_receivers``) and
+        ``weights['same_department']`` if both are in the same department,
+        and every person in a gift cycle of at most ``short_cycle_length``
+        people costs ``weights['short_cycle']``.
+
+        Args:
+            weights (dict): Overrides of DEFAULT_WEIGHTS.
+            departments (dict): name -> department; people without one never
+                share a department.
+            past_receivers (dict): giver name -> set of earlier receivers.
+        """
+        unknown = set(weights or {}) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown optimizer weights {sorted(unknown)}. Available: {list(DEFAULT_WEIGHTS)}")
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.departments = departments or {}
+        self.past_receivers = past_receivers or {}
+        self.short_cycle_length = short_cycle_length
+
+    def pair_costs(self, names):
+        """
+        The pair cost as a function of (giver id, receiver id) for a
+        participant index given by its ``names``.
+        """
+        ids = {name: pid for pid, name in enumerate(names)}
+        repeats = {}
+        for giver, receivers in self.past_receivers.items():
+            if giver in ids:
+                repeats[ids[giver]] = sum(1 << ids[receiver] for receiver in set(receivers) if receiver in ids)
+        department = [self.departments.get(name) for name in names]
+        repeat_weight = self.weights['repeat']
+        department_weight = self.weights['same_department']
+
+        def pair_cost(giver, receiver):
+            cost = 0.0
+            if repeats.get(giver, 0) >> receiver & 1:
+                cost += repeat_weight
+            if department[giver] is not None and department[giver] == department[receiver]:
+                cost += department_weight
+            return cost
+        return pair_cost
+
+    def score(self, all_pairings):
+        """
+        Scores a drawn config by name.
+
+        Returns:
+            dict: 'total' penalty plus the number of 'repeat' and
+                'same_department' pairs and of people in 'short_cycle's.
+        """
+        counts = {'repeat': 0, 'same_department': 0, 'short_cycle': 0}
+        for round_data in all_pairings:
+            pairing = round_data['pairing']
+            for giver, receiver in pairing.items():
+                if receiver in self.past_receivers.get(giver, ()):
+                    counts['repeat'] += 1
+                department = self.departments.get(giver)
+                if department is not None and department == self.departments.get(receiver):
+                    counts['same_department'] += 1
+                if _cycle_length(pairing, giver, self.short_cycle_length) <= self.short_cycle_length:
+                    counts['short_cycle'] += 1
+        counts['total'] = sum(self.weights[key] * count for key, count in counts.items())
+        return counts
+
+def _cycle_length(pairing, giver, limit):
+    """Length of the gift cycle through giver, or limit + 1 if it is longer than limit"""
+    current = pairing[giver]
+    for length in range(1, limit + 1):
+        if current == giver:
+            return length
+        current = pairing[current]
+    return limit + 1
+
+class RoundSearch:
+    def __init__(self, pairing, allowed, pair_cost, cycle_weight=0.0, short_cycle_length=0,
+                 prevent_reciprocal_pairs=False, rng=None):
+        """
+        Local search over the valid pairings of one round.
+
+        Starting from a valid ``pairing`` (giver id -> receiver id), moves
+        rotate the receivers of two givers (a swap) or three givers (a
+        3-cycle rotation). A move is only made if every new pair is in
+        ``allowed`` and, with prevent_reciprocal_pairs, gives nobody back,
+        so the pairing stays valid throughout. Moves that do not make the
+        cost worse are kept.
+
+        Each move is scored by its delta only: the pair costs of the two or
+        three changed givers, and the short-cycle status of the people who
+        reach a changed giver within short_cycle_length steps, which are
+        the only ones whose cycle can change.
+        """
+        self.pairing = dict(pairing)
+        self.owner = {receiver: giver for giver, receiver in self.pairing.items()}
+        self.allowed = allowed
+        self.pair_cost = pair_cost
+        self.cycle_weight = cycle_weight if short_cycle_length >= 2 else 0.0
+        self.short_cycle_length = short_cycle_length
+        self.prevent_reciprocal_pairs = prevent_reciprocal_pairs
+        self.rng = rng
+        self.givers = list(self.pairing)
+        self.short = {}
+        if self.cycle_weight:
+            self.short = {giver: self._is_short(giver) for giver in self.givers}
+        # Givers with a non-zero cost, as list plus position for O(1) random picks
+        self.costly = []
+        self.costly_at = {}
+        self.cost = 0.0
+        for giver in self.givers:
+            cost = self._giver_cost(giver)
+            self.cost += cost
+            self._mark(giver, cost)
+        self.moves = self.kept = 0
+
+    def _is_short(self, giver):
+        return _cycle_length(self.pairing, giver, self.short_cycle_length) <= self.short_cycle_length
+
+    def _giver_cost(self, giver):
+        cost = self.pair_cost(giver, self.pairing[giver])
+        if self.short.get(giver):
+            cost += self.cycle_weight
+        return cost
+
+    def _mark(self, giver, cost):
+        """Keeps the costly list in step with a giver's cost"""
+        if cost and giver not in self.costly_at:
+            self.costly_at[giver] = len(self.costly)
+            self.costly.append(giver)
+        elif not cost and giver in self.costly_at:
+            position = self.costly_at.pop(giver)
+            last = self.costly.pop()
+            if last != giver:
+                self.costly[position] = last
+                self.costly_at[last] = position
+
+    def _ancestors(self, givers):
+        """Givers reaching one of givers within short_cycle_length - 1 steps (themselves included)"""
+        found = set()
+        for giver in givers:
+            for _ in range(self.short_cycle_length):
+                if giver in found:
+                    break
+                found.add(giver)
+                giver = self.owner[giver]
+        return found
+
+    def _rotate(self, givers, receivers):
+        for giver, receiver in zip(givers, receivers):
+            self.pairing[giver] = receiver
+            self.owner[receiver] = giver
+
+    def try_move(self, givers):
+        """
+        Gives each of givers the receiver of the next one (the last gets
+        the first's) if that keeps the pairing valid and does not raise the
+        cost. Returns the cost delta, or None if the move was not made.
+        """
+        old = [self.pairing[giver] for giver in givers]
+        new = old[1:] + old[:1]
+        allowed = self.allowed
+        for giver, receiver in zip(givers, new):
+            if not allowed[giver] >> receiver & 1:
+                return None
+        affected = self._ancestors(givers) if self.cycle_weight else set(givers)
+        before = {giver: self._giver_cost(giver) for giver in affected}
+        self._rotate(givers, new)
+        if self.prevent_reciprocal_pairs and any(self.pairing[receiver] == giver for giver, receiver in zip(givers, new)):
+            self._rotate(givers, old)
+            return None
+        old_short = {}
+        if self.cycle_weight:
+            affected |= self._ancestors(givers)
+            for giver in affected:
+                if giver not in before:
+                    before[giver] = self._giver_cost(giver)
+                old_short[giver] = self.short[giver]
+                self.short[giver] = self._is_short(giver)
+        after = {giver: self._giver_cost(giver) for giver in affected}
+        delta = sum(after.values()) - sum(before.values())
+        if delta > 0:
+            self._rotate(givers, old)
+            self.short.update(old_short)
+            return None
+        self.cost += delta
+        for giver, cost in after.items():
+            self._mark(giver, cost)
+        return delta
+
+    def run(self, deadline):
+        """Tries random moves until the cost is 0 or time.perf_counter() passes deadline"""
+        rng = self.rng
+        givers = self.givers
+        if len(givers) < 3:
+            return self.pairing
+        while self.costly:
+            for _ in range(CLOCK_INTERVAL):
+                if not self.costly:
+                    break
+                # One giver that costs something, the others anywhere
+                first = self.costly[rng.randrange(len(self.costly))]
+                move = [first, rng.choice(givers)]
+                if rng.random() < 0.5:
+                    move.append(rng.choice(givers))
+                if len(set(move)) < len(move):
+                    continue
+                self.moves += 1
+                if self.try_move(move) is not None:
+                    self.kept += 1
+            if time.perf_counter() >= deadline:
+                break
+        return self.pairing
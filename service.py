@@ -0,0 +1,352 @@
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from batch import discover_groups
+from delivery import DeliveryJournal
+from draw import (
+    build_outbox, compile_plan, create_matcher, draw_plan, generate_emails, generate_summary, history_path,
+    load_objective, record_history
+)
+from mail_utils import EmailHandler
+from spool import write_spool
+
+DEFAULT_PORT = 8750
+
+class ServiceError(ValueError):
+    """A request the service rejects, with the HTTP status to answer with"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+JSON_TYPES = {str: 'a string', int: 'an integer', float: 'a number', bool: 'true or false', list: 'a list',
+              dict: 'an object'}
+SCORE_KEYS = ('total', 'initial', 'repeat', 'same_department', 'short_cycle')
+
+def _field(request, key, kinds, default=None):
+    """
+    request[key] (``default`` if missing or null) checked to be one of the
+    types in ``kinds``; raises ServiceError (400) otherwise.
+    """
+    value = request.get(key)
+    if value is None:
+        return default
+    if not isinstance(value, kinds) or isinstance(value, bool) and bool not in kinds:
+        raise ServiceError(f"'{key}' must be {' or '.join(JSON_TYPES[kind] for kind in kinds)}.")
+    return value
+
+def _names(request, key):
+    """A list of participant names, or None"""
+    names = _field(request, key, (list,))
+    if names is not None and not all(isinstance(name, str) for name in names):
+        raise ServiceError(f"'{key}' must be a list of names.")
+    return names
+
+def _rounds(request):
+    """The 'rounds' of a draw as returned by /draw, checked to have that shape, or None"""
+    rounds = _field(request, 'rounds', (list,))
+    for round_data in rounds or ():
+        if (not isinstance(round_data, dict) or 'budget' not in round_data
+                or not isinstance(round_data.get('pairing'), dict)
+                or not all(isinstance(receiver, str) for receiver in round_data['pairing'].values())):
+            raise ServiceError("'rounds' must be a list of {\"pairing\": {giver: receiver}, \"budget\": ...} "
+                               "as returned by /draw.")
+    return rounds
+
+def _score(request):
+    """The optimizer 'score' of a draw as returned by /draw, or None"""
+    score = _field(request, 'score', (dict,))
+    if score is not None and not all(
+            isinstance(score.get(key), (int, float)) and not isinstance(score[key], bool) for key in SCORE_KEYS):
+        raise ServiceError(f"'score' must be an object with the numbers {', '.join(SCORE_KEYS)} as returned by /draw.")
+    return score
+
+def _stamp(paths):
+    """Modification times of paths (None for missing ones), to notice edits"""
+    stamp = []
+    for path in paths:
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+class DrawService:
+    def __init__(self, path, journal_folder='journal', spool_folder='spool'):
+        """
+        Draws, checks and renders the groups under ``path`` (a config folder,
+        a folder tree or a multi-group file, see batch.discover_groups) for
+        many requests in one process.
+
+        Per group, the parsed config and contacts, the compiled
+        ConstraintPlan, the optimizer objective and the EmailHandler are
+        kept and only rebuilt when one of the group's files or its history
+        database changes. Templates and translations stay in their module
+        caches. Every request gets its own SecretSantaMatcher, so requests
+        can run concurrently on the shared, read-only plans.
+        """
+        self.path = path
+        self.journal_folder = journal_folder
+        self.spool_folder = spool_folder
+        self.lock = threading.Lock()
+        self.groups = {}  # name -> group dict of discover_groups
+        self.warm = {}  # name -> (stamp, prepared group)
+        self.discover()
+
+    def discover(self):
+        """(Re)reads the groups from disk and drops everything cached"""
+        groups = {group['name']: group for group in discover_groups(self.path)}
+        with self.lock:
+            self.groups = groups
+            self.warm = {}
+        return sorted(groups)
+
+    def group(self, name=None):
+        """
+        The prepared group ``name`` (optional if there is only one): a dict
+        with 'config', 'contacts', 'folder', 'plan', 'objective' and
+        'email_handler'. Raises ServiceError (404) for unknown groups.
+        """
+        if name is None:
+            if len(self.groups) != 1:
+                raise ServiceError(f"Pass a group, one of: {', '.join(sorted(self.groups))}")
+            name = next(iter(self.groups))
+        group = self.groups.get(name)
+        if group is None:
+            raise ServiceError(f"Unknown group '{name}'", status=404)
+        store_path = history_path(group['config'], group['folder'])
+        stamp = _stamp(group['files'] + ([store_path] if store_path else []))
+        cached = self.warm.get(name)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        if cached is not None and stamp[:len(group['files'])] != cached[0][:len(group['files'])]:
+            self.discover()  # a config changed
+            return self.group(name)
+        config = group['config']
+        matcher = create_matcher(config)
+        prepared = {
+            'name': name,
+            'config': config,
+            'contacts': group['contacts'],
+            'folder': group['folder'],
+            'plan': compile_plan(config, group['folder'], matcher.prevent_reciprocal_pairs),
+            'objective': load_objective(config, group['folder']),
+            'email_handler': EmailHandler(config),
+        }
+        with self.lock:
+            self.warm[name] = (stamp, prepared)
+        return prepared
+
+    def health(self, request=None):
+        return {'status': 'ok', 'groups': sorted(self.groups), 'warm': sorted(self.warm)}
+
+    def reload(self, request=None):
+        return {'groups': self.discover()}
+
+    def check(self, request):
+        """Feasibility problems of a group's config, without drawing"""
+        group = self.group(_field(request, 'group', (str,)))
+        problems = list(group['plan'].problems)
+        return {'group': group['name'], 'feasible': not problems, 'problems': problems}
+
+    def draw(self, request):
+        """
+        Draws a group. With 'commit', the draw is journaled, stored in the
+        history and its mails are rendered to the spool folder for
+        'python draw.py send'; otherwise nothing is written.
+        """
+        group = self.group(_field(request, 'group', (str,)))
+        config = group['config']
+        matcher = create_matcher(config)
+        all_pairings, num_attempt, seed, score = draw_plan(
+            config, group['plan'], matcher, group['objective'], seed=_field(request, 'seed', (int,))
+        )
+        draw_id = hashlib.md5(f"{time.time()}/{group['name']}/{id(matcher)}".encode()).hexdigest()[:8]
+        response = {
+            'group': group['name'], 'draw_id': draw_id, 'attempts': num_attempt, 'seed': seed, 'score': score,
+            'rounds': all_pairings,
+        }
+        if _field(request, 'commit', (bool,)):
+            response['spool'] = self._commit(group, draw_id, all_pairings, num_attempt)
+        return response
+
+    def _commit(self, group, draw_id, all_pairings, num_attempt):
+        config = group['config']
+        emails = generate_emails(all_pairings, config, draw_id, group['email_handler'])
+        outbox = build_outbox(emails, group['contacts'])
+        journal_folder = os.path.join(self.journal_folder, group['name'])
+        DeliveryJournal(journal_folder, draw_id).save_draw(all_pairings, num_attempt)
+        spool = os.path.join(self.spool_folder, group['name'], draw_id)
+        write_spool(spool, group['email_handler'], outbox, draw_id, journal_folder)
+        record_history(config, group['folder'], draw_id, all_pairings)
+        return spool
+
+    def preview(self, request):
+        """
+        Renders the mails of a draw ('rounds' as returned by draw, or a
+        fresh uncommitted draw) for the participants in 'names' (default:
+        all) without sending anything.
+        """
+        group = self.group(_field(request, 'group', (str,)))
+        all_pairings = _rounds(request) or self.draw({'group': group['name']})['rounds']
+        names = _names(request, 'names')
+        if names is not None:
+            names = set(names)
+            all_pairings = [
+                dict(round_data, pairing={giver: receiver for giver, receiver in round_data['pairing'].items()
+                                          if giver in names})
+                for round_data in all_pairings
+            ]
+        emails = generate_emails(all_pairings, group['config'], _field(request, 'draw_id', (str,), 'preview'),
+                                 group['email_handler'])
+        return {'group': group['name'], 'emails': emails}
+
+    def summary(self, request):
+        """The text summary of a draw ('rounds', 'attempts' and 'score' as returned by draw)"""
+        group = self.group(_field(request, 'group', (str,)))
+        rounds = _rounds(request)
+        if not rounds:
+            raise ServiceError("Pass the 'rounds' of a draw.")
+        text = generate_summary(rounds, _field(request, 'attempts', (int,), 1), group['config'], _score(request))
+        return {'group': group['name'], 'summary': text}
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP for a DrawService: GET /health, POST /check, /draw, /preview, /summary, /reload"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, so clients can reuse the connection
+    disable_nagle_algorithm = True  # headers and body are separate writes, don't hold the body back
+    # Errors http.server answers itself (e.g. an unknown method) in JSON as well
+    error_message_format = '{"error": "%(message)s"}'
+    error_content_type = 'application/json; charset=utf-8'
+    GET_ROUTES = {'/health': 'health'}
+    POST_ROUTES = {'/check': 'check', '/draw': 'draw', '/preview': 'preview', '/summary': 'summary',
+                   '/reload': 'reload'}
+
+    def do_GET(self):
+        self._dispatch(self.GET_ROUTES, {})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True  # the body's end is unknown, the stream cannot be reused
+            self._reply(400, {'error': "Invalid Content-Length."})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._reply(400, {'error': "The body is not valid JSON."})
+            return
+        if not isinstance(request, dict):
+            self._reply(400, {'error': "The body must be a JSON object."})
+            return
+        self._dispatch(self.POST_ROUTES, request)
+
+    def _dispatch(self, routes, request):
+        endpoint = routes.get(self.path.split('?', 1)[0])
+        if endpoint is None:
+            self._reply(404, {'error': f"No endpoint {self.command} {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            response = getattr(self.server.service, endpoint)(request)
+        except ServiceError as error:
+            self._reply(error.status, {'error': str(error)})
+            return
+        except (ValueError, KeyError) as error:
+            self._reply(400, {'error': str(error)})
+            return
+        except Exception as error:
+            # Always answer, a client must never see the connection just drop
+            traceback.print_exc()
+            self._reply(500, {'error': f"Internal error in {endpoint}: {error!r}"})
+            return
+        self._reply(200, response, time.perf_counter() - start)
+
+    def _reply(self, status, data, elapsed=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        if elapsed is not None:
+            self.send_header('X-Elapsed-Ms', f"{elapsed * 1000:.2f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix-socket'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class UnixServiceHandler(ServiceHandler):
+    disable_nagle_algorithm = False  # TCP only
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client connection over a Unix socket, for clients of a service started with --socket"""
+    def __init__(self, path, timeout=30):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def create_server(service, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None, verbose=False):
+    """
+    HTTP server for a DrawService on host:port (port 0 picks a free one)
+    or, with ``socket_path``, on a Unix socket. Call serve_forever on it.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, UnixServiceHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceHandler)
+        server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve draws, checks and previews over local HTTP.")
+    parser.add_argument('--config_folder', '-cf', type=str, default="example_config",
+                        help="Config folder, folder tree of groups or multi-group YAML file to serve.")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument('--socket', type=str, default=None, help="Listen on this Unix socket instead.")
+    parser.add_argument('--journal_folder', type=str, default="journal", help="Journals of committed draws.")
+    parser.add_argument('--spool_folder', type=str, default="spool", help="Spools of committed draws.")
+    parser.add_argument('--verbose', action='store_true', help="Log every request.")
+    args = parser.parse_args()
+
+    service = DrawService(args.config_folder, args.journal_folder, args.spool_folder)
+    for name in service.groups:
+        service.group(name)  # compile everything before the first request
+    server = create_server(service, args.host, args.port, args.socket, args.verbose)
+    where = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"Serving {len(service.groups)} groups from {args.config_folder} on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import email
+import json
+import os
+import time
+from email.policy import SMTP
+from delivery import DeliveryJournal, deliver
+from mail_utils import EmailHandler
+
+MANIFEST = 'manifest.json'
+
+# Settings of the config's 'email' section kept in the manifest; the spool
+# is sent without the config
+EMAIL_SETTINGS = ('subject', 'sender', 'language', 'smtp_host', 'smtp_port', 'smtp_security',
+                  'send_workers', 'send_rate', 'send_retries')
+
+def _write_atomic(path, data):
+    """Writes bytes to path via a temporary file, so readers never see half a file"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def write_spool(folder, email_handler, outbox, draw_id, journal_folder='journal'):
+    """
+    Renders every mail of a draw once into ``folder`` as a ready-to-send
+    .eml file (headers included) and writes the manifest last.
+
+    The manifest lists each participant's address and file together with
+    the draw ID, the draw's journal folder and the SMTP and sending
+    settings of the config, so send_spool needs nothing else. A spool
+    without manifest is incomplete. The journal folder is stored relative
+    to the spool folder, so sending works from any working directory.
+
+    Args:
+        outbox (dict): name -> (recipient email, html body)
+
+    Returns:
+        str: Path of the manifest.
+    """
+    os.makedirs(folder, exist_ok=True)
+    messages = []
+    for number, (name, (recipient, html)) in enumerate(sorted(outbox.items()), 1):
+        file_name = f"{number:05d}.eml"
+        _write_atomic(os.path.join(folder, file_name), email_handler.build_message(recipient, html).as_bytes())
+        messages.append({'name': name, 'email': recipient, 'file': file_name})
+    email_config = email_handler.config['email']
+    manifest = {
+        'draw_id': draw_id,
+        'journal_folder': _relative_to(journal_folder, folder),
+        'created': time.time(),
+        'email': {key: email_config[key] for key in EMAIL_SETTINGS if key in email_config},
+        'messages': messages,
+    }
+    manifest_path = os.path.join(folder, MANIFEST)
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8'))
+    return manifest_path
+
+def _relative_to(path, folder):
+    """path relative to folder, or absolute if there is no relative path (other drive)"""
+    path = os.path.abspath(path)
+    try:
+        return os.path.relpath(path, os.path.abspath(folder))
+    except ValueError:
+        return path
+
+def load_manifest(folder):
+    """Returns the manifest of a spool; raises ValueError if the spool is incomplete"""
+    path = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        raise ValueError(f"{folder} has no {MANIFEST}, the spool was not completely written.")
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def spool_journal(folder, manifest):
+    """The DeliveryJournal of a spooled draw, its folder resolved against the spool folder"""
+    journal_folder = os.path.normpath(os.path.join(folder, manifest['journal_folder']))
+    return DeliveryJournal(journal_folder, manifest['draw_id'])
+
+def load_message(folder, file_name):
+    """Parses a spooled .eml file back into a message"""
+    with open(os.path.join(folder, file_name), 'rb') as f:
+        return email.message_from_binary_file(f, policy=SMTP)
+
+def send_spool(folder, sender_email, app_password, workers=None, rate=None, retries=None, sessions=None):
+    """
+    Sends the mails of a spool written by write_spool.
+
+    Delivery works as for a direct send (see delivery.deliver) and uses the
+    draw's journal, so mails already delivered, by this or by an earlier
+    run or --resume, are skipped. ``workers``, ``rate`` and
+    ``retries`` override the settings stored in the manifest.
+
+    Returns:
+        dict: The delivery report.
+    """
+    manifest = load_manifest(folder)
+    email_config = manifest['email']
+    email_handler = EmailHandler({'email': email_config})
+    journal = spool_journal(folder, manifest)
+    done = journal.delivered()
+    outbox = {
+        entry['name']: (entry['email'], load_message(folder, entry['file']))
+        for entry in manifest['messages'] if entry['name'] not in done
+    }
+    report = deliver(
+        email_handler,
+        sender_email,
+        app_password,
+        outbox,
+        journal=journal,
+        workers=workers or email_config.get('send_workers', 4),
+        rate=rate or email_config.get('send_rate'),
+        retries=email_config.get('send_retries', 3) if retries is None else retries,
+        sessions=sessions,
+    )
+    report['skipped'] = sorted(done & {entry['name'] for entry in manifest['messages']})
+    return report
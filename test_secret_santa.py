@@ -1,7 +1,33 @@
+import math
+import random
+import smtplib
 import unittest
+from unittest import mock
 from matcher import SecretSantaMatcher
-from mail_utils import EmailHandler
+from mail_utils import EmailHandler, SMTPSession, load_compiled_template
+from delivery import DeliveryJournal, SessionPool, deliver
+from batch import discover_groups, run_batch
+from service import DrawService, UnixHTTPConnection, create_server
+from loadtest import call, connect, run_load
+from spool import load_manifest, load_message, send_spool, spool_journal, write_spool
+from history_store import HistoryStore
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
 from localization import Translations
+from feasibility import analyze_rounds, InfeasibleConfigError
+from metrics import metrics
+from counting import EXACT_LIMIT, UniformPairingSampler, _isqrt, uniform_sampler
+from benchmark import synthetic_config, compare
+from draw import draw_pairings, generate_summary, load_config
+from export import export_draw, iter_text_table, iter_assignments
+from optimizer import Objective, RoundSearch
+from constraints import (
+    ParticipantIndex, DrawState, iter_bits, bit_list, compile_rounds, strongly_connected_components
+)
 
 class TestSecretSantaMatcher(unittest.TestCase):
     def setUp(self):
@@ -19,7 +45,7 @@ class TestSecretSantaMatcher(unittest.TestCase):
         # Run multiple draws to catch flaky failures from randomness
         for _ in range(100):
             matcher = SecretSantaMatcher()
-            pairings = matcher.generate_pairings(self.basic_config['rounds'])
+            pairings, _ = matcher.generate_pairings(self.basic_config['rounds'])
             for round_data in pairings:
                 for giver, receiver in round_data['pairing'].items():
                     self.assertNotEqual(giver, receiver,
@@ -37,7 +63,7 @@ class TestSecretSantaMatcher(unittest.TestCase):
         # Run multiple draws to ensure exclusions are always respected
         for _ in range(250):
             matcher = SecretSantaMatcher()
-            pairings = matcher.generate_pairings(config['rounds'])
+            pairings, _ = matcher.generate_pairings(config['rounds'])
             # Check Alice isn't giving to Bob
             self.assertNotEqual(
                 pairings[0]['pairing'].get('Alice'), 
@@ -50,7 +76,7 @@ class TestSecretSantaMatcher(unittest.TestCase):
         # Run multiple draws to ensure reciprocal pairs are never produced
         for _ in range(250):
             matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
-            pairings = matcher.generate_pairings(self.basic_config['rounds'])
+            pairings, _ = matcher.generate_pairings(self.basic_config['rounds'])
             # Convert pairings to set of tuples for easier checking
             pairs = {(giver, receiver)
                     for round_data in pairings
@@ -62,6 +88,446 @@ class TestSecretSantaMatcher(unittest.TestCase):
                     f"Reciprocal pair found: {giver}->{receiver} and {receiver}->{giver}"
                 )
 
+class TestSamplingStrategy(unittest.TestCase):
+    def assert_valid_pairing(self, pairing, participants, exclusions):
+        self.assertEqual(sorted(pairing.keys()), sorted(participants))
+        self.assertEqual(sorted(pairing.values()), sorted(participants))
+        for giver, receiver in pairing.items():
+            self.assertNotEqual(giver, receiver)
+            self.assertNotIn(receiver, exclusions.get(giver, []))
+            self.assertNotIn(giver, exclusions.get(receiver, []))
+            self.assertNotEqual(pairing[receiver], giver, "Reciprocal pair in round")
+
+    def test_large_round(self):
+        """Test that a large round is drawn and satisfies all rules"""
+        participants = [f'P{i}' for i in range(1000)]
+        exclusions = {participants[i]: [participants[i + 1]] for i in range(0, 999, 2)}
+        rounds = [{'participants': participants, 'exclusions': exclusions, 'budget': '10'}] * 2
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        pairings, _ = matcher.generate_pairings(rounds)
+        for round_data in pairings:
+            self.assert_valid_pairing(round_data['pairing'], participants, exclusions)
+        self.assertTrue(all(
+            pairings[0]['pairing'][giver] != pairings[1]['pairing'][giver] for giver in participants
+        ))
+
+    def test_sample_matches_enumeration(self):
+        """Test that sampling only returns pairings the reference enumerator accepts"""
+        participants = ['Alice', 'Bob', 'Charlie', 'David', 'Emil']
+        exclusions = {'Alice': ['Bob']}
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        valid = {tuple(p) for p in matcher.validate_round(participants, exclusions)}
+        for max_repair_steps in (None, 0):  # 0 forces the backtracking fallback
+            for _ in range(100):
+                pairing = matcher.sample_round(participants, exclusions, max_repair_steps)
+                self.assertIn(tuple(pairing), valid)
+
+    def test_infeasible_round(self):
+        """Test that an impossible round yields None instead of a pairing"""
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        self.assertIsNone(matcher.sample_round(['Alice', 'Bob']))
+
+    def test_enumerate_strategy(self):
+        """Test the reference enumeration strategy still draws valid pairings"""
+        participants = ['Alice', 'Bob', 'Charlie', 'David']
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True, strategy='enumerate')
+        pairings, _ = matcher.generate_pairings([{'participants': participants, 'budget': '5'}])
+        self.assert_valid_pairing(pairings[0]['pairing'], participants, {})
+
+    def test_streaming_selection(self):
+        """Test reservoir selection stops early and picks from the enumerated pairings"""
+        participants = ['Alice', 'Bob', 'Charlie', 'David', 'Emil']
+        matcher = SecretSantaMatcher()
+        valid = matcher.validate_round(participants)
+        self.assertEqual(sum(1 for _ in matcher.iter_valid_pairings(participants)), len(valid))
+        chosen, seen = matcher.select_pairing(participants, max_candidates=3)
+        self.assertEqual(seen, 3)
+        self.assertIn(chosen, valid[:3])
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            SecretSantaMatcher(strategy='magic')
+
+class TestBackjumpSolver(unittest.TestCase):
+    def test_backjump_to_blocking_round(self):
+        """Test that a round blocked by round 1 is solved past unrelated rounds in between"""
+        family = ['Alice', 'Bob', 'Charlie', 'David', 'Emil', 'Florence']
+        # Round 3 only allows neighbours on a circle, round 1 must avoid all of them
+        neighbours = {name: {family[i - 1], family[(i + 1) % 6]} for i, name in enumerate(family)}
+        exclusions = {name: [other for other in family if other != name and other not in neighbours[name]]
+                      for name in family}
+        office = [f'P{i}' for i in range(20)]
+        rounds = [
+            {'participants': family, 'budget': '50'},
+            {'participants': office, 'budget': '10'},
+            {'participants': family, 'exclusions': exclusions, 'budget': '30'},
+        ]
+        for _ in range(10):
+            matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True, solver='backjump')
+            pairings, _ = matcher.generate_pairings(rounds, max_attempts=20)
+            for giver, receiver in pairings[2]['pairing'].items():
+                self.assertIn(receiver, neighbours[giver])
+                self.assertNotIn(pairings[0]['pairing'][giver], neighbours[giver])
+
+    def test_impossible_round_fails_fast(self):
+        """Test that a round impossible on its own is reported without retrying"""
+        rounds = [
+            {'participants': ['Alice', 'Bob', 'Charlie'], 'budget': '50'},
+            {'participants': ['Alice', 'Bob'], 'budget': '10'},
+        ]
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True, solver='backjump')
+        with self.assertRaisesRegex(ValueError, 'Round 2 has no valid pairing even without history'):
+            matcher.generate_pairings(rounds, max_attempts=1000, check_feasibility=False)
+
+class TestConstraintMasks(unittest.TestCase):
+    def test_history_roundtrip(self):
+        """Test that drawn pairs are stored as bitmasks and decoded back to names"""
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        matcher._record([('Alice', 'Bob'), ('Bob', 'Charlie'), ('Charlie', 'Alice')])
+        self.assertEqual(matcher.history['Alice'], {'Bob'})
+        self.assertIn(('Charlie', 'Alice'), matcher.pair_history)
+        allowed = matcher._allowed(matcher._compile(['Alice', 'Bob', 'Charlie', 'David'], {'Alice': ['David']}))
+        alice = matcher.index.ids['Alice']
+        # Not herself, not David (excluded), not Bob (history), not Charlie (reciprocal)
+        self.assertEqual(allowed[alice], 0)
+
+    def test_state_copy_is_independent(self):
+        index = ParticipantIndex(['Alice', 'Bob', 'Charlie'])
+        state = DrawState()
+        state.record([(0, 1)])
+        snapshot = state.copy()
+        state.record([(0, 2)])
+        self.assertEqual(list(iter_bits(snapshot.given[0])), [1])
+        self.assertEqual(list(iter_bits(state.given[0])), [1, 2])
+        self.assertEqual(index.mask(['Alice', 'Charlie']), 0b101)
+
+    def test_strongly_connected_components(self):
+        """Test a one-way bridge does not join two gift cycles"""
+        # 0 <-> 1 <-> 2 and 3 <-> 4, plus 2 -> 3 which no cycle can use
+        allowed = {0: 0b110, 1: 0b101, 2: 0b1011, 3: 0b10000, 4: 0b1000}
+        components = strongly_connected_components([0, 1, 2, 3, 4], allowed)
+        self.assertEqual(sorted(components), [0b111, 0b11000])
+        self.assertEqual(bit_list(0b100101), list(iter_bits(0b100101)))
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.folder.name, 'history.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        self.folder.cleanup()
+
+    def draw(self, *pairs):
+        return [{'pairing': dict(pairs), 'budget': None}]
+
+    def test_lookback_window(self):
+        """Test only the years inside the look-back window are returned"""
+        self.store.record_draw(2022, 'old', self.draw(('Alice', 'Bob')))
+        self.store.record_draw(2023, 'last', self.draw(('Alice', 'Charlie'), ('Bob', 'Alice')))
+        self.store.record_draw(2024, 'now', self.draw(('Alice', 'David')))
+        self.assertEqual(self.store.past_receivers(['Alice', 'Bob'], 2024), {'Alice': {'Charlie'}, 'Bob': {'Alice'}})
+        self.assertEqual(self.store.past_receivers(['Alice'], 2024, 2), {'Alice': {'Bob', 'Charlie'}})
+        self.assertEqual(self.store.past_receivers(['Alice'], 2024, 0), {})
+
+    def test_redraw_replaces_pairs(self):
+        """Test storing a draw ID again replaces its pairs"""
+        self.store.record_draw(2023, 'abc', self.draw(('Alice', 'Bob')))
+        self.store.record_draw(2023, 'abc', self.draw(('Alice', 'Charlie')))
+        self.assertEqual(self.store.receivers_of('Alice', 2023, 2023), {'Charlie'})
+        self.assertEqual(self.store.draws(), [('abc', 2023)])
+
+    def test_past_receivers_constrain_the_draw(self):
+        """Test last year's receivers are never drawn again"""
+        participants = ['Alice', 'Bob', 'Charlie', 'David']
+        self.store.record_draw(2023, 'last', self.draw(('Alice', 'Bob'), ('Bob', 'Charlie'), ('Charlie', 'Alice')))
+        past = self.store.past_receivers(participants, 2024)
+        plan = compile_rounds([{'participants': participants}], past_receivers=past)
+        for _ in range(30):
+            pairings, _ = SecretSantaMatcher().generate_pairings(plan)
+            for giver, receiver in pairings[0]['pairing'].items():
+                self.assertNotIn(receiver, past.get(giver, ()))
+
+    def test_past_receivers_in_feasibility(self):
+        """Test the analysis counts past receivers, in their direction only"""
+        rounds = [{'participants': ['Alice', 'Bob', 'Charlie']}]
+        self.assertEqual(analyze_rounds(rounds, past_receivers={'Alice': {'Bob'}}), [])
+        problems = analyze_rounds(rounds, past_receivers={'Alice': {'Bob', 'Charlie'}})
+        self.assertEqual(len(problems), 1)
+        self.assertIn("Alice", problems[0])
+
+class TestComponents(unittest.TestCase):
+    def setUp(self):
+        # Two departments that exclude each other, together too big for 'uniform'
+        self.size = EXACT_LIMIT // 2 + 2
+        self.left = [f"L{i}" for i in range(self.size)]
+        self.right = [f"R{i}" for i in range(self.size)]
+        self.rounds = [{
+            'participants': self.left + self.right,
+            'exclusions': {name: self.right for name in self.left},
+        }]
+
+    def assert_within_departments(self, pairings):
+        for giver, receiver in pairings[0]['pairing'].items():
+            self.assertEqual(giver[0], receiver[0])
+        self.assertEqual(len(pairings[0]['pairing']), 2 * self.size)
+
+    def test_departments_drawn_separately(self):
+        """Test a round split by exclusions is drawn per component"""
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        pairings, _ = matcher.generate_pairings(self.rounds)
+        self.assert_within_departments(pairings)
+
+    def test_uniform_strategy_per_component(self):
+        """Test the uniform size limit applies per component, not per round"""
+        matcher = SecretSantaMatcher(strategy='uniform')
+        pairings, _ = matcher.generate_pairings(self.rounds)
+        self.assert_within_departments(pairings)
+
+    def test_component_workers_match_serial_draw(self):
+        """Test drawing components in worker processes gives the seeded serial result"""
+        with mock.patch('matcher.PARALLEL_COMPONENT_SIZE', 2):
+            parallel, _ = SecretSantaMatcher().generate_pairings(self.rounds, seed=7, component_workers=2)
+        serial, _ = SecretSantaMatcher().generate_pairings(self.rounds, seed=7)
+        self.assertEqual(parallel, serial)
+        self.assert_within_departments(parallel)
+
+class TestOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.names = [f"P{i:02d}" for i in range(18)]
+        self.departments = {name: f"D{i % 3}" for i, name in enumerate(self.names)}
+        self.rounds = [{'participants': self.names, 'budget': '20'}, {'participants': self.names[:12], 'budget': '10'}]
+
+    def test_score_counts(self):
+        objective = Objective({'repeat': 5}, {'A': 'x', 'B': 'x'}, {'A': {'C'}}, short_cycle_length=3)
+        score = objective.score([{'pairing': {'A': 'B', 'B': 'C', 'C': 'A'}}, {'pairing': {'A': 'C', 'C': 'A'}}])
+        self.assertEqual(score, {'repeat': 1, 'same_department': 1, 'short_cycle': 5, 'total': 11.0})
+
+    def test_unknown_weight(self):
+        with self.assertRaises(ValueError):
+            Objective({'distance': 1})
+
+    def test_incremental_cost_matches_score(self):
+        """Test that the cost kept by the move deltas is the cost of the pairing"""
+        rng = random.Random(5)
+        past = {name: set(rng.sample(self.names, 4)) for name in self.names}
+        objective = Objective(departments=self.departments, past_receivers=past, short_cycle_length=4)
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        matcher.rng = rng
+        plan = compile_rounds(self.rounds[:1], True)
+        pairings, _ = matcher.generate_pairings(plan)
+        allowed = {pid: mask for pid, mask in zip(plan.rounds[0].ids, plan.rounds[0].static)}
+        search = RoundSearch({plan.ids[g]: plan.ids[r] for g, r in pairings[0]['pairing'].items()}, allowed,
+                             objective.pair_costs(plan.names), objective.weights['short_cycle'], 4, True, rng)
+        for _ in range(300):
+            search.try_move(rng.sample(sorted(search.pairing), rng.choice([2, 3])))
+            pairing = {plan.names[g]: plan.names[r] for g, r in search.pairing.items()}
+            self.assertAlmostEqual(search.cost, objective.score([{'pairing': pairing}])['total'])
+            self.assertTrue(all(pairing[pairing[giver]] != giver for giver in pairing))
+            self.assertEqual(sorted(pairing.values()), sorted(pairing))
+
+    def test_optimize_pairings(self):
+        """Test that optimizing keeps all rules and removes same-department pairs"""
+        objective = Objective(departments=self.departments)
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        pairings, _ = matcher.generate_pairings(self.rounds)
+        optimized, score = matcher.optimize_pairings(self.rounds, pairings, objective, time_budget=1.0)
+        self.assertEqual(score['total'], 0)
+        self.assertEqual(score['initial'], objective.score(pairings)['total'])
+        seen = set()
+        for round_config, round_data in zip(self.rounds, optimized):
+            pairing = round_data['pairing']
+            self.assertEqual(set(pairing.values()), set(round_config['participants']))
+            for giver, receiver in pairing.items():
+                self.assertNotEqual(self.departments[giver], self.departments[receiver])
+                self.assertNotIn((giver, receiver), seen)
+                self.assertNotIn((receiver, giver), seen)
+                seen.add((giver, receiver))
+
+class TestConstraintPlan(unittest.TestCase):
+    def test_plan_is_reused_across_draws(self):
+        """Test that one compiled plan serves repeated draws with fresh history"""
+        participants = ['Alice', 'Bob', 'Charlie', 'David']
+        rounds = [{'participants': participants, 'exclusions': {'Alice': ['Bob']}, 'budget': '50'}] * 2
+        plan = compile_rounds(rounds, prevent_reciprocal_pairs=False)
+        alice, bob = plan.ids['Alice'], plan.ids['Bob']
+        static = dict(zip(plan.rounds[0].ids, plan.rounds[0].static))
+        self.assertFalse(static[bob] >> alice & 1, "Exclusions must be symmetric")
+        with self.assertRaises(TypeError):
+            plan.ids['Emil'] = 4
+        for _ in range(50):
+            pairings, _ = SecretSantaMatcher().generate_pairings(plan)
+            self.assertEqual([round_data['budget'] for round_data in pairings], ['50', '50'])
+            for round_data in pairings:
+                self.assertNotEqual(round_data['pairing']['Alice'], 'Bob')
+                self.assertNotEqual(round_data['pairing']['Bob'], 'Alice')
+
+    def test_plan_setting_mismatch(self):
+        plan = compile_rounds([{'participants': ['Alice', 'Bob', 'Charlie']}], prevent_reciprocal_pairs=True)
+        with self.assertRaises(ValueError):
+            SecretSantaMatcher(prevent_reciprocal_pairs=False).generate_pairings(plan)
+
+class TestRepair(unittest.TestCase):
+    def setUp(self):
+        self.names = [f"P{i}" for i in range(12)]
+        self.rounds = [{'participants': self.names, 'budget': '20'}, {'participants': self.names[:8], 'budget': '10'}]
+        self.matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        self.pairings, _ = self.matcher.generate_pairings(self.rounds, seed=2025)
+
+    def assert_valid(self, rounds, pairings):
+        seen = set()
+        for round_config, round_data in zip(rounds, pairings):
+            pairing = round_data['pairing']
+            self.assertEqual(set(pairing), set(round_config['participants']))
+            self.assertEqual(set(pairing.values()), set(round_config['participants']))
+            for giver, receiver in pairing.items():
+                self.assertNotEqual(giver, receiver)
+                self.assertNotIn((giver, receiver), seen)
+                self.assertNotIn((receiver, giver), seen)
+                seen.add((giver, receiver))
+
+    def test_removed_participant(self):
+        """Test a drop-out only changes whoever gave to them"""
+        rounds = [dict(round_config, participants=[name for name in round_config['participants'] if name != 'P3'])
+                  for round_config in self.rounds]
+        givers_to_p3 = {giver for round_data in self.pairings
+                        for giver, receiver in round_data['pairing'].items() if receiver == 'P3'}
+        for _ in range(20):
+            repaired, changed = self.matcher.repair_pairings(rounds, self.pairings)
+            self.assert_valid(rounds, repaired)
+            self.assertTrue(givers_to_p3 <= set(changed))
+            # At most one released pair per round on top of P3's givers
+            self.assertLessEqual(len(changed), len(givers_to_p3) + len(rounds))
+
+    def test_removed_from_one_round(self):
+        """Test that leaving one round only gets the leaver a new mail too"""
+        rounds = [self.rounds[0], dict(self.rounds[1], participants=[name for name in self.names[:8] if name != 'P3'])]
+        giver_to_p3 = next(giver for giver, receiver in self.pairings[1]['pairing'].items() if receiver == 'P3')
+        repaired, changed = self.matcher.repair_pairings(rounds, self.pairings)
+        self.assert_valid(rounds, repaired)
+        self.assertNotIn('P3', repaired[1]['pairing'])
+        self.assertIn('P3', changed)
+        self.assertIn(giver_to_p3, changed)
+        self.assertEqual(repaired[0], self.pairings[0])
+
+    def test_repair_blocked_by_other_rounds(self):
+        """Test that pairs of other rounds are released when they leave a round no valid pairing"""
+        config_rounds = load_config('example_config/config.yaml')['rounds']
+        rounds = [dict(round_config, participants=[name for name in round_config['participants'] if name != 'Bob'])
+                  for round_config in config_rounds]
+        matcher = SecretSantaMatcher()
+        for seed in range(20):
+            pairings, _ = matcher.generate_pairings(config_rounds, seed=seed)
+            repaired, _ = matcher.repair_pairings(rounds, pairings)
+            given = set()
+            for round_config, round_data in zip(rounds, repaired):
+                self.assertEqual(set(round_data['pairing'].values()), set(round_config['participants']))
+                self.assertFalse(given & set(round_data['pairing'].items()))
+                given.update(round_data['pairing'].items())
+
+    def test_repair_of_infeasible_config(self):
+        """Test that a change leaving no valid draw at all is reported as such"""
+        rounds = [dict(round_config, participants=self.names[:3]) for round_config in self.rounds]
+        with self.assertRaises(InfeasibleConfigError):
+            self.matcher.repair_pairings(rounds, self.pairings)
+
+    def test_added_participant(self):
+        """Test a late joiner is spliced into the existing cycles"""
+        rounds = [dict(self.rounds[0], participants=self.names + ['New']), self.rounds[1]]
+        repaired, changed = self.matcher.repair_pairings(rounds, self.pairings)
+        self.assert_valid(rounds, repaired)
+        self.assertIn('New', changed)
+        self.assertLessEqual(len(changed), 3)
+        self.assertEqual(repaired[1], self.pairings[1])
+
+    def test_round_count_must_match(self):
+        with self.assertRaises(ValueError):
+            self.matcher.repair_pairings(self.rounds[:1], self.pairings)
+
+class TestSeededAttempts(unittest.TestCase):
+    def setUp(self):
+        participants = [f'P{i}' for i in range(8)]
+        self.plan = compile_rounds(
+            [{'participants': participants, 'budget': str(budget)} for budget in (50, 30, 10)],
+            prevent_reciprocal_pairs=True
+        )
+
+    def test_seeded_draw_is_reproducible(self):
+        """Test that the same master seed gives the same draw"""
+        first = SecretSantaMatcher(prevent_reciprocal_pairs=True).generate_pairings(self.plan, seed=2025)
+        second = SecretSantaMatcher(prevent_reciprocal_pairs=True).generate_pairings(self.plan, seed=2025)
+        self.assertEqual(first, second)
+
+    def test_parallel_draw_can_be_replayed(self):
+        """Test that master seed and winning attempt of a parallel draw reproduce it"""
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        pairings, attempt = matcher.generate_pairings(self.plan, workers=2)
+        self.assertIsNotNone(matcher.seed)
+        replayed = SecretSantaMatcher(prevent_reciprocal_pairs=True).replay_attempt(
+            self.plan, matcher.seed, attempt
+        )
+        self.assertEqual(replayed, pairings)
+
+    def test_stopped_attempt_gives_up(self):
+        """Test that an attempt ends before its next round once the stop event is set"""
+        stop = multiprocessing.Event()
+        stop.set()
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        matcher._plan(self.plan)
+        self.assertEqual(matcher._attempt(self.plan, 'sample', None, stop), (None, []))
+
+    def test_replay_attempt_of_config(self):
+        """Test that draw_pairings replays the winning attempt printed for a parallel draw"""
+        config = load_config('example_config/config.yaml')
+        pairings, attempt, seed, _ = draw_pairings(config, 'example_config', workers=2)
+        replayed, replayed_attempt, replayed_seed, _ = draw_pairings(
+            config, 'example_config', seed=seed, replay_attempt=attempt
+        )
+        self.assertEqual((replayed, replayed_attempt, replayed_seed), (pairings, attempt, seed))
+
+class TestFeasibility(unittest.TestCase):
+    def test_hall_violator_reported(self):
+        """Test that givers sharing too few receivers are named"""
+        participants = ['Alice', 'Bob', 'Charlie', 'David', 'Emil']
+        # Alice, Bob and Charlie may only give to David or Emil
+        rounds = [{'participants': participants, 'exclusions': {
+            'Alice': ['Bob', 'Charlie'], 'Bob': ['Charlie']}}]
+        problems = analyze_rounds(rounds)
+        self.assertEqual(problems, [
+            "Round 1: these 3 givers only have 2 possible receivers: Alice, Bob, Charlie -> David, Emil"
+        ])
+
+    def test_cumulative_history_reported(self):
+        """Test that a participant in more rounds than possible receivers is reported"""
+        rounds = [{'participants': ['Alice', 'Bob', 'Charlie']}] * 3
+        problems = analyze_rounds(rounds)
+        self.assertIn(
+            "Alice needs 3 different partners in rounds 1, 2, 3 but only 2 are possible: Bob, Charlie",
+            problems
+        )
+        self.assertEqual(analyze_rounds(rounds[:2]), [])
+
+    def test_large_split_round(self):
+        """Test rounds split into departments that may only give to the other one"""
+        def split_round(size_a, size_b):
+            names = [f"P{i}" for i in range(size_a + size_b)]
+            a, b = names[:size_a], names[size_a:]
+            exclusions = {person: a for person in a}
+            exclusions.update({person: b for person in b})
+            return [{'participants': names, 'exclusions': exclusions}]
+        self.assertEqual(analyze_rounds(split_round(300, 300), prevent_reciprocal_pairs=True), [])
+        problems = analyze_rounds(split_round(250, 350))
+        self.assertEqual(len(problems), 1)
+        self.assertRegex(problems[0], r"^Round 1: these 251 givers only have 250 possible receivers: P250, ")
+
+    def test_generate_pairings_fails_fast(self):
+        """Test that an impossible config raises before drawing"""
+        rounds = [{'participants': ['Alice', 'Bob', 'Charlie', 'David']}] * 4
+        matcher = SecretSantaMatcher()
+        with self.assertRaises(InfeasibleConfigError) as context:
+            matcher.generate_pairings(rounds, max_attempts=1000)
+        self.assertIn("David needs 4 different partners", str(context.exception))
+
 class TestEmailGeneration(unittest.TestCase):
     def setUp(self):
         self.config = {
@@ -88,6 +554,502 @@ class TestEmailGeneration(unittest.TestCase):
         self.assertIn('are your Secret Santa assignments', email,
             "Plural form not used for multiple assignments")
 
+    def test_compiled_template_matches_format(self):
+        """Test the pre-split template renders exactly like str.format"""
+        for language in Translations.TRANSLATIONS:
+            path = f"templates/{language}.tmpl"
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            values = {'name': 'Alice', 'year': 2025, 'assignments': '<li>x</li>', 'sender': 'Bot',
+                      'draw_id': 'abc', 'assignment_text': 'is {not} a placeholder'}
+            self.assertEqual(load_compiled_template(path).render(values), text.format(**values))
+
+    def test_batch_rendering_reads_template_once(self):
+        """Test rendering a batch does no file reads once the template is cached"""
+        self.email_handler.generate_email('Alice', ['<strong>Bob</strong>'], 'warmup')
+        batch = {f"P{i}": [f"<strong>P{i + 1}</strong>"] for i in range(50)}
+        with mock.patch('builtins.open', side_effect=AssertionError("template re-read")):
+            emails = self.email_handler.generate_emails(batch, 'test123')
+        self.assertEqual(len(emails), 50)
+        self.assertIn('Hello P7!', emails['P7'])
+        self.assertIn('<strong>P8</strong>', emails['P7'])
+
+    def test_template_cache_reloads_changed_file(self):
+        """Test a template is compiled again when its file changes"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'test.tmpl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('Hi {name}')
+            self.assertEqual(load_compiled_template(path).render({'name': 'Bob'}), 'Hi Bob')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('Bye {name}')
+            os.utime(path, ns=(0, 10 ** 9))
+            self.assertEqual(load_compiled_template(path).render({'name': 'Bob'}), 'Bye Bob')
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP/SMTP_SSL and records what happens"""
+    instances = []
+    drop_next_send = False
+    refused = set()
+    transient_failures = 0
+
+    def __init__(self, host, port, timeout=None):
+        self.host, self.port = host, port
+        self.logins = 0
+        self.sent = []
+        FakeSMTP.instances.append(self)
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def send_message(self, msg):
+        if FakeSMTP.drop_next_send:
+            FakeSMTP.drop_next_send = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        if FakeSMTP.transient_failures:
+            FakeSMTP.transient_failures -= 1
+            raise smtplib.SMTPDataError(451, b'Try again later')
+        if msg['To'] in FakeSMTP.refused:
+            raise smtplib.SMTPRecipientsRefused({msg['To']: (550, b'No such user')})
+        self.sent.append(msg['To'])
+
+    def quit(self):
+        pass
+
+class TestSMTPSession(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.instances = []
+        FakeSMTP.drop_next_send = False
+        self.config = {
+            'email': {'subject': 'Secret Santa 2025', 'sender': 'Secret Santa Bot', 'language': 'en',
+                      'smtp_host': 'localhost', 'smtp_port': 2525},
+            'year': 2025
+        }
+        self.email_handler = EmailHandler(self.config)
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_session_reuses_connection(self):
+        """Test that many mails share one connection and one login"""
+        with self.email_handler.session('bot@example.com', 'secret') as session:
+            for recipient in ['alice@example.com', 'bob@example.com', 'charlie@example.com']:
+                self.email_handler.send_email(None, None, recipient, '<p>Hi</p>', session=session)
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        server = FakeSMTP.instances[0]
+        self.assertEqual((server.host, server.port), ('localhost', 2525))
+        self.assertEqual(server.logins, 1)
+        self.assertEqual(len(server.sent), 3)
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_session_reconnects_after_drop(self):
+        """Test that a dropped connection is re-opened and the mail still sent"""
+        with SMTPSession('bot@example.com', 'secret', host='localhost', port=2525) as session:
+            session.send_message(self.email_handler.build_message('alice@example.com', '<p>Hi</p>'))
+            FakeSMTP.drop_next_send = True
+            session.send_message(self.email_handler.build_message('bob@example.com', '<p>Hi</p>'))
+        self.assertEqual(session.connections, 2)
+        self.assertEqual(FakeSMTP.instances[-1].sent, ['bob@example.com'])
+
+class TestDelivery(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.instances = []
+        FakeSMTP.refused = {'bob@example.com'}
+        self.email_handler = EmailHandler({
+            'email': {'subject': 'Secret Santa 2025', 'sender': 'Secret Santa Bot', 'language': 'en'},
+            'year': 2025
+        })
+        self.outbox = {name: (f'{name.lower()}@example.com', f'<p>{name}</p>')
+                       for name in ['Alice', 'Bob', 'Charlie', 'David']}
+
+    def tearDown(self):
+        FakeSMTP.refused = set()
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_resume_sends_only_undelivered(self):
+        """Test that a rerun with the journal skips everyone already notified"""
+        with tempfile.TemporaryDirectory() as folder:
+            journal = DeliveryJournal(folder, 'abc123')
+            journal.save_draw([{'pairing': {'Alice': 'Bob'}, 'budget': '50'}], 1)
+            report = deliver(self.email_handler, 'bot', 'pw', self.outbox, journal=journal, workers=3)
+            self.assertEqual(sorted(report['sent']), ['Alice', 'Charlie', 'David'])
+            self.assertEqual(list(report['failed']), ['Bob'])
+
+            FakeSMTP.refused = set()
+            resumed = DeliveryJournal(folder, 'abc123')
+            report = deliver(self.email_handler, 'bot', 'pw', self.outbox, journal=resumed, workers=3)
+            self.assertEqual(report['sent'], ['Bob'])
+            self.assertEqual(report['skipped'], ['Alice', 'Charlie', 'David'])
+            self.assertEqual(resumed.load_draw(), ([{'pairing': {'Alice': 'Bob'}, 'budget': '50'}], 1))
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_forgotten_names_are_sent_again(self):
+        """Test that a repaired draw only re-sends to the forgotten names"""
+        FakeSMTP.refused = set()
+        with tempfile.TemporaryDirectory() as folder:
+            journal = DeliveryJournal(folder, 'abc123')
+            deliver(self.email_handler, 'bot', 'pw', self.outbox, journal=journal, workers=1)
+            journal.forget(['Charlie'])
+            report = deliver(self.email_handler, 'bot', 'pw', self.outbox, journal=journal, workers=1)
+            self.assertEqual(report['sent'], ['Charlie'])
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_transient_errors_are_retried(self):
+        """Test that temporary SMTP errors are retried until the mail goes through"""
+        FakeSMTP.refused = set()
+        FakeSMTP.transient_failures = 2
+        report = deliver(self.email_handler, 'bot', 'pw', self.outbox, workers=1, retries=2, backoff=0, rate=1000)
+        self.assertEqual(sorted(report['sent']), sorted(self.outbox))
+        self.assertEqual(report['failed'], {})
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_session_pool_is_shared_between_deliveries(self):
+        """Test that deliveries with a shared pool reuse one connection"""
+        FakeSMTP.refused = set()
+        with SessionPool() as sessions:
+            for _ in range(3):
+                deliver(self.email_handler, 'bot', 'pw', self.outbox, workers=1, sessions=sessions)
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(FakeSMTP.instances[0].logins, 1)
+        self.assertEqual(len(FakeSMTP.instances[0].sent), 12)
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.instances = []
+        FakeSMTP.refused = {'bob@example.com'}
+        self.email_handler = EmailHandler({
+            'email': {'subject': 'Secret Santa 2025', 'sender': 'Secret Santa Bot', 'language': 'en',
+                      'smtp_host': 'localhost', 'smtp_port': 2525, 'send_workers': 2},
+            'year': 2025
+        })
+        self.outbox = {name: (f'{name.lower()}@example.com', f'<p>Hallo {name} 🎁</p>')
+                       for name in ['Alice', 'Bob', 'Charlie']}
+        self.folder = tempfile.TemporaryDirectory()
+        self.spool = os.path.join(self.folder.name, 'spool', 'abc123')
+        self.journal_folder = os.path.join(self.folder.name, 'journal')
+
+    def tearDown(self):
+        FakeSMTP.refused = set()
+        self.folder.cleanup()
+
+    def test_spool_holds_ready_messages(self):
+        write_spool(self.spool, self.email_handler, self.outbox, 'abc123', self.journal_folder)
+        manifest = load_manifest(self.spool)
+        self.assertEqual(manifest['draw_id'], 'abc123')
+        self.assertEqual(manifest['email']['smtp_port'], 2525)
+        self.assertEqual([entry['name'] for entry in manifest['messages']], ['Alice', 'Bob', 'Charlie'])
+        msg = load_message(self.spool, manifest['messages'][0]['file'])
+        self.assertEqual(msg['To'], 'alice@example.com')
+        self.assertEqual(msg['Subject'], 'Secret Santa 2025')
+        self.assertIn('Hallo Alice 🎁', msg.get_content())
+
+    def test_incomplete_spool(self):
+        os.makedirs(self.spool)
+        with self.assertRaises(ValueError):
+            load_manifest(self.spool)
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_send_spool_resumes_with_the_journal(self):
+        """Test that draining a spool twice only sends what failed the first time"""
+        write_spool(self.spool, self.email_handler, self.outbox, 'abc123', self.journal_folder)
+        report = send_spool(self.spool, 'bot', 'pw')
+        self.assertEqual(sorted(report['sent']), ['Alice', 'Charlie'])
+        self.assertEqual(list(report['failed']), ['Bob'])
+        self.assertEqual(FakeSMTP.instances[0].port, 2525)
+
+        FakeSMTP.refused = set()
+        report = send_spool(self.spool, 'bot', 'pw', workers=1)
+        self.assertEqual(report['sent'], ['Bob'])
+        self.assertEqual(report['skipped'], ['Alice', 'Charlie'])
+        self.assertEqual(DeliveryJournal(self.journal_folder, 'abc123').delivered(), {'Alice', 'Bob', 'Charlie'})
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_send_spool_from_another_directory(self):
+        """Test that a spool written with a relative journal folder finds its journal from any cwd"""
+        cwd = os.getcwd()
+        os.chdir(self.folder.name)
+        try:
+            write_spool(os.path.join('spool', 'abc123'), self.email_handler, self.outbox, 'abc123', 'journal')
+            send_spool(os.path.join('spool', 'abc123'), 'bot', 'pw')
+            os.chdir(os.path.join(self.folder.name, 'spool'))
+            FakeSMTP.refused = set()
+            report = send_spool('abc123', 'bot', 'pw', workers=1)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(report['sent'], ['Bob'])
+        self.assertEqual(report['skipped'], ['Alice', 'Charlie'])
+        self.assertEqual(DeliveryJournal(self.journal_folder, 'abc123').delivered(), {'Alice', 'Bob', 'Charlie'})
+
+class TestBatch(unittest.TestCase):
+    GROUPS = """
+email: {subject: Team Santa, sender: Bot, language: en, send_workers: 1}
+year: 2025
+matching: {prevent_reciprocal_pairs: false}
+groups:
+  red:
+    rounds:
+      - {participants: [A, B, C], budget: 10$}
+    contacts: {A: a@red, B: b@red, C: c@red}
+  blue:
+    rounds:
+      - {participants: [D, E], budget: 5$}
+    email: {subject: Blue Santa, sender: Blue Bot, language: de, send_workers: 1}
+    contacts: {D: d@blue, E: e@blue}
+  broken:
+    rounds:
+      - {participants: [F], budget: 5$}
+    contacts: {F: f@broken}
+"""
+
+    def setUp(self):
+        FakeSMTP.instances = []
+        FakeSMTP.refused = set()
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'groups.yaml')
+        with open(self.path, 'w') as f:
+            f.write(self.GROUPS)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_discover_groups_file(self):
+        groups = discover_groups(self.path)
+        self.assertEqual([group['name'] for group in groups], ['blue', 'broken', 'red'])
+        blue, red = groups[0], groups[2]
+        self.assertEqual(blue['config']['email']['language'], 'de')
+        self.assertEqual(red['config']['email']['language'], 'en')
+        self.assertEqual(red['config']['year'], 2025)
+        self.assertEqual(red['contacts'], {'A': 'a@red', 'B': 'b@red', 'C': 'c@red'})
+        self.assertNotIn('contacts', red['config'])
+
+    def test_discover_groups_folder(self):
+        for name in ['family', os.path.join('teams', 'dev')]:
+            shutil.copytree('example_config', os.path.join(self.folder.name, 'tree', name))
+        groups = discover_groups(os.path.join(self.folder.name, 'tree'))
+        self.assertEqual([group['name'] for group in groups], ['family', os.path.join('teams', 'dev')])
+        with open(os.path.join('example_config', 'contact_information.json')) as f:
+            self.assertEqual(groups[1]['contacts'], json.load(f))
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_run_batch_sends_every_group(self):
+        """Test that all groups are drawn and mailed over shared sessions, and failures stay per group"""
+        journal_folder = os.path.join(self.folder.name, 'journal')
+        results = run_batch(self.path, 'bot', 'pw', seed=1, journal_folder=journal_folder)
+        self.assertIn('error', results['broken'])
+        self.assertEqual(sorted(results['red']['sent']), ['A', 'B', 'C'])
+        self.assertEqual(sorted(results['blue']['sent']), ['D', 'E'])
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(sorted(FakeSMTP.instances[0].sent), ['a@red', 'b@red', 'c@red', 'd@blue', 'e@blue'])
+        journal = DeliveryJournal(os.path.join(journal_folder, 'red'), results['red']['draw_id'])
+        self.assertEqual(journal.delivered(), {'A', 'B', 'C'})
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_malformed_groups_are_reported_per_group(self):
+        """Test that malformed group configs fail on their own and the other groups still run"""
+        with open(self.path, 'w') as f:
+            f.write("""
+email: {subject: Team Santa, sender: Bot, language: en, send_workers: 1}
+year: 2025
+groups:
+  a:
+    rounds: [{participants: [A, B, C], budget: 10$}]
+    contacts: {A: a@a, B: b@a, C: c@a}
+  b:
+    round: [{participants: [D, E, F], budget: 10$}]
+  c:
+    rounds: [{participants: [G, H, I], budget: 10$}]
+    contacts: {G: g@c, H: h@c, I: i@c}
+  d:
+    rounds: [{participants: [J, K, L], budget: 10$}]
+    email: null
+  e: [J, K]
+""")
+        results = run_batch(self.path, 'bot', 'pw', seed=1, journal_folder=os.path.join(self.folder.name, 'journal'))
+        self.assertEqual(sorted(results['a']['sent']), ['A', 'B', 'C'])
+        self.assertEqual(sorted(results['c']['sent']), ['G', 'H', 'I'])
+        self.assertEqual(results['b'], {'error': "The group config has no 'rounds' list."})
+        self.assertEqual(results['d'], {'error': "The group config has no 'email' section."})
+        self.assertEqual(results['e'], {'error': "The group config is not a mapping."})
+
+    @mock.patch('smtplib.SMTP_SSL', FakeSMTP)
+    def test_failed_draws_stay_out_of_history(self):
+        """Test that a draw is only stored in the history once a mail of it went out"""
+        with open(self.path, 'w') as f:
+            f.write("""
+email: {subject: Team Santa, sender: Bot, language: en, send_workers: 1, send_retries: 0}
+year: 2025
+history: {path: history.sqlite}
+groups:
+  red:
+    rounds:
+      - {participants: [A, B, C], budget: 10$}
+    contacts: {A: a@red, B: b@red}
+  blue:
+    rounds:
+      - {participants: [D, E, F], budget: 5$}
+    contacts: {D: d@blue, E: e@blue, F: f@blue}
+""")
+        FakeSMTP.refused = {'d@blue', 'e@blue', 'f@blue'}
+        journal_folder = os.path.join(self.folder.name, 'journal')
+        results = run_batch(self.path, 'bot', 'pw', journal_folder=journal_folder)
+        self.assertIn('No e-mail address for C', results['red']['error'])
+        self.assertEqual(sorted(results['blue']['failed']), ['D', 'E', 'F'])
+        self.assertFalse(os.path.exists(os.path.join(journal_folder, 'red')))
+        with HistoryStore(os.path.join(self.folder.name, 'history.sqlite')) as store:
+            self.assertEqual(store.draws(), [])
+
+        FakeSMTP.refused = set()
+        results = run_batch(self.path, 'bot', 'pw', journal_folder=journal_folder)
+        with HistoryStore(os.path.join(self.folder.name, 'history.sqlite')) as store:
+            self.assertEqual(store.draws(), [(results['blue']['draw_id'], 2025)])
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'groups.yaml')
+        with open(self.path, 'w') as f:
+            f.write(TestBatch.GROUPS)
+        self.service = DrawService(self.path, os.path.join(self.folder.name, 'journal'),
+                                   os.path.join(self.folder.name, 'spool'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def serve(self, **kwargs):
+        server = create_server(self.service, port=0, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_endpoints(self):
+        """Test check, draw, preview and summary over HTTP on one keep-alive connection"""
+        server = self.serve()
+        connection = connect(port=server.server_address[1])
+        self.addCleanup(connection.close)
+        self.assertEqual(call(connection, 'check', {'group': 'red'}), (200, {'group': 'red', 'feasible': True, 'problems': []}))
+        status, checked = call(connection, 'check', {'group': 'broken'})
+        self.assertFalse(checked['feasible'])
+        self.assertTrue(checked['problems'])
+
+        status, drawn = call(connection, 'draw', {'group': 'red', 'seed': 3})
+        self.assertEqual(status, 200)
+        self.assertEqual(drawn['seed'], 3)
+        pairing = drawn['rounds'][0]['pairing']
+        self.assertEqual(sorted(pairing.values()), ['A', 'B', 'C'])
+        self.assertEqual(call(connection, 'draw', {'group': 'red', 'seed': 3})[1]['rounds'], drawn['rounds'])
+
+        status, preview = call(connection, 'preview', {'group': 'red', 'rounds': drawn['rounds'], 'names': ['A']})
+        self.assertEqual(list(preview['emails']), ['A'])
+        self.assertIn(pairing['A'], preview['emails']['A'])
+        status, summary = call(connection, 'summary', {'group': 'red', 'rounds': drawn['rounds']})
+        self.assertIn(f"A{' ' * 19}{pairing['A']}", summary['summary'])
+        self.assertFalse(os.path.exists(os.path.join(self.folder.name, 'journal')))
+
+    def test_errors(self):
+        server = self.serve()
+        connection = connect(port=server.server_address[1])
+        self.addCleanup(connection.close)
+        self.assertEqual(call(connection, 'draw', {'group': 'green'})[0], 404)
+        self.assertEqual(call(connection, 'nothing', {})[0], 404)
+        self.assertEqual(call(connection, 'draw', {})[0], 400)  # more than one group
+        status, error = call(connection, 'draw', {'group': 'broken'})
+        self.assertEqual(status, 400)
+        self.assertIn('cannot be drawn', error['error'])
+        self.assertEqual(call(connection, 'health')[0], 200)  # the connection survives errors
+
+    def test_malformed_requests(self):
+        """Test that every malformed body gets a 400 with a message and the server keeps answering"""
+        server = self.serve()
+        connection = connect(port=server.server_address[1])
+        self.addCleanup(connection.close)
+        rounds = self.service.draw({'group': 'red'})['rounds']
+        for endpoint, payload in [
+            ('summary', {'group': 'red', 'rounds': [1]}),
+            ('preview', {'group': 'red', 'rounds': [1]}),
+            ('summary', 'abc'),
+            ('preview', 'abc'),
+            ('preview', {'group': 'red', 'names': 5}),
+            ('preview', {'group': 'red', 'names': [1]}),
+            ('preview', {'group': 'red', 'rounds': [{'pairing': {'A': 'B'}}]}),
+            ('preview', {'group': 'red', 'rounds': [{'pairing': ['A'], 'budget': 1}]}),
+            ('preview', {'group': 'red', 'rounds': rounds, 'draw_id': 7}),
+            ('summary', {'group': 'red', 'rounds': rounds, 'attempts': 'x'}),
+            ('summary', {'group': 'red', 'rounds': rounds, 'score': {'total': 'x'}}),
+            ('draw', {'group': ['red']}),
+            ('draw', {'group': 'red', 'seed': 'x'}),
+            ('draw', {'group': 'red', 'seed': True}),
+            ('check', [1, 2]),
+        ]:
+            status, response = call(connection, endpoint, payload)
+            self.assertEqual(status, 400, (endpoint, payload, response))
+            self.assertTrue(response['error'])
+        self.assertEqual(call(connection, 'summary', {'group': 'red', 'rounds': rounds})[0], 200)
+        connection.putrequest('POST', '/check')
+        connection.putheader('Content-Length', 'x')
+        connection.endheaders(b'{')
+        response = connection.getresponse()
+        self.assertEqual((response.status, json.loads(response.read())), (400, {'error': "Invalid Content-Length."}))
+        connection.request('PUT', '/check')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 501)
+        self.assertIn('error', json.loads(response.read()))
+
+    def test_unexpected_errors_answer_500(self):
+        server = self.serve()
+        connection = connect(port=server.server_address[1])
+        self.addCleanup(connection.close)
+        with mock.patch.object(self.service, 'check', side_effect=RuntimeError('boom')), \
+                mock.patch('traceback.print_exc'):
+            status, response = call(connection, 'check', {'group': 'red'})
+        self.assertEqual(status, 500)
+        self.assertIn('boom', response['error'])
+        self.assertEqual(call(connection, 'check', {'group': 'red'})[0], 200)
+
+    def test_failed_commit_leaves_history_unchanged(self):
+        with open(self.path) as f:
+            groups = f.read().replace('B: b@red, C: c@red}', 'B: b@red}')
+        with open(self.path, 'w') as f:
+            f.write(groups.replace('year: 2025', 'year: 2025\nhistory: {path: history.sqlite}'))
+        self.service.discover()
+        with self.assertRaisesRegex(ValueError, 'No e-mail address for C'):
+            self.service.draw({'group': 'red', 'commit': True})
+        self.assertFalse(os.path.exists(os.path.join(self.folder.name, 'journal')))
+        self.service.draw({'group': 'blue', 'commit': True})
+        with HistoryStore(os.path.join(self.folder.name, 'history.sqlite')) as store:
+            self.assertEqual([year for _, year in store.draws()], [2025])
+            self.assertEqual(store.receivers_of('A', 2025, 2025), set())
+
+    def test_commit_spools_draw(self):
+        drawn = self.service.draw({'group': 'red', 'commit': True})
+        manifest = load_manifest(drawn['spool'])
+        self.assertEqual(manifest['draw_id'], drawn['draw_id'])
+        self.assertEqual(sorted(message['email'] for message in manifest['messages']), ['a@red', 'b@red', 'c@red'])
+        journal = spool_journal(drawn['spool'], manifest)
+        self.assertEqual(journal.load_draw()[0], drawn['rounds'])
+
+    def test_unix_socket(self):
+        socket_path = os.path.join(self.folder.name, 'service.sock')
+        self.serve(socket_path=socket_path)
+        connection = UnixHTTPConnection(socket_path)
+        self.addCleanup(connection.close)
+        status, health = call(connection, 'health')
+        self.assertEqual(health['groups'], ['blue', 'broken', 'red'])
+        stats = run_load({'socket_path': socket_path}, 'blue', 'draw', requests=20, concurrency=4)
+        self.assertEqual((stats['requests'], stats['errors']), (20, 0))
+
+    def test_plans_stay_warm_until_config_changes(self):
+        red = self.service.group('red')
+        self.assertIs(self.service.group('red'), red)
+        with open(self.path) as f:
+            groups = f.read().replace('[A, B, C]', '[A, B, C, D]').replace('C: c@red}', 'C: c@red, D: d@red}')
+        with open(self.path, 'w') as f:
+            f.write(groups)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        reloaded = self.service.group('red')
+        self.assertIsNot(reloaded, red)
+        self.assertEqual(list(reloaded['plan'].names), ['A', 'B', 'C', 'D'])
+        self.assertEqual(sorted(self.service.draw({'group': 'red'})['rounds'][0]['pairing']), ['A', 'B', 'C', 'D'])
+
 class TestLocalization(unittest.TestCase):
     def test_english_translations(self):
         """Test English translations are complete and accessible"""
@@ -134,7 +1096,7 @@ class TestDrawRandomness(unittest.TestCase):
         # Run the draw multiple times
         for _ in range(5):
             matcher = SecretSantaMatcher()  # Reset matcher state
-            pairings = matcher.generate_pairings(self.config['rounds'])
+            pairings, _ = matcher.generate_pairings(self.config['rounds'])
             # Store the sorted tuple of (giver, receiver) pairs for comparison
             draw_result = tuple(sorted(pairings[0]['pairing'].items()))
             draws.append(draw_result)
@@ -158,7 +1120,7 @@ class TestDrawRandomness(unittest.TestCase):
         # Run multiple times to reduce flakiness
         for _ in range(100):
             matcher = SecretSantaMatcher()
-            pairings = matcher.generate_pairings(config['rounds'])
+            pairings, _ = matcher.generate_pairings(config['rounds'])
             # Build mapping giver -> list of receivers across rounds
             receiver_history = {}
             for round_data in pairings:
@@ -171,5 +1133,164 @@ class TestDrawRandomness(unittest.TestCase):
                     f"Giver {giver} received the same recipient in multiple rounds: {receivers}"
                 )
 
+class TestCounting(unittest.TestCase):
+    def test_exact_count_matches_enumeration(self):
+        """Test the counting DP agrees with enumerating every valid pairing"""
+        participants = ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+        exclusions = {'A': ['B', 'C'], 'D': ['E']}
+        for prevent in (False, True):
+            matcher = SecretSantaMatcher(prevent_reciprocal_pairs=prevent)
+            matcher.generate_pairings([{'participants': participants, 'exclusions': exclusions}])
+            count, error = matcher.count_valid_pairings(participants, exclusions)
+            self.assertEqual(count, len(matcher.validate_round(participants, exclusions)))
+            self.assertEqual(error, 0.0)
+
+    def test_estimate_for_large_rounds(self):
+        """Test rounds beyond the exact limit get a close estimate"""
+        n = EXACT_LIMIT + 5
+        matcher = SecretSantaMatcher()
+        matcher.rng = random.Random(5)
+        count, error = matcher.count_valid_pairings([f"P{i}" for i in range(n)])
+        derangements = round(math.factorial(n) / math.e)
+        self.assertGreater(error, 0.0)
+        self.assertLess(abs(count - derangements) / derangements, 0.05)
+
+    def test_integer_square_root_without_math_isqrt(self):
+        """Test the Python 3.7 fallback of the estimate's integer square root"""
+        with mock.patch('counting.math', mock.Mock(spec=[])):
+            for value in [0, 1, 2, 3, 4, 15, 16, 17, 10 ** 40 + 1, math.factorial(60)]:
+                root = _isqrt(value)
+                self.assertTrue(root * root <= value < (root + 1) * (root + 1))
+
+    def test_count_rounds_with_history(self):
+        """Test later rounds are counted given the pairings drawn before them"""
+        rounds = [{'participants': ['A', 'B', 'C', 'D']}] * 2
+        matcher = SecretSantaMatcher()
+        pairings, _ = matcher.generate_pairings(rounds)
+        counts = matcher.count_rounds(rounds, pairings)
+        self.assertEqual(counts[0], (9, 0.0))  # derangements of 4
+        self.assertLess(counts[1][0], 9)
+
+    def test_uniform_strategy(self):
+        """Test the uniform strategy draws valid pairings and reaches all of them"""
+        participants = ['A', 'B', 'C', 'D', 'E']
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True, strategy='uniform')
+        seen = set()
+        for _ in range(300):
+            pairings, _ = matcher.generate_pairings([{'participants': participants}])
+            pairing = pairings[0]['pairing']
+            self.assertTrue(all(pairing[pairing[giver]] != giver and pairing[giver] != giver for giver in pairing))
+            seen.add(tuple(sorted(pairing.items())))
+        self.assertEqual(len(seen), SecretSantaMatcher(prevent_reciprocal_pairs=True).count_valid_pairings(participants)[0])
+
+    def test_uniform_table_built_once(self):
+        """Test the counting table of a round is reused by later attempts and draws"""
+        uniform_sampler.cache_clear()
+        matcher = SecretSantaMatcher(strategy='uniform')
+        rounds = [{'participants': ['A', 'B', 'C', 'D', 'E', 'F']}]
+        with mock.patch('counting.UniformPairingSampler', wraps=UniformPairingSampler) as sampler:
+            for _ in range(20):
+                matcher.generate_pairings(rounds)
+        self.assertEqual(sampler.call_count, 1)
+
+    def test_uniform_strategy_rejects_large_rounds(self):
+        """Test the uniform strategy refuses rounds it cannot count exactly"""
+        matcher = SecretSantaMatcher(strategy='uniform')
+        with self.assertRaises(ValueError):
+            matcher.generate_pairings([{'participants': [f"P{i}" for i in range(EXACT_LIMIT + 1)]}])
+
+class TestMetrics(unittest.TestCase):
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled_metrics_record_nothing(self):
+        """Test nothing is collected while metrics are disabled"""
+        matcher = SecretSantaMatcher()
+        matcher.generate_pairings([{'participants': ['A', 'B', 'C', 'D']}])
+        matcher.validate_round(['A', 'B', 'C'])
+        self.assertEqual(metrics.snapshot(), {'timers': {}, 'counters': {}, 'rounds': {}})
+
+    def test_round_statistics(self):
+        """Test timers and per round candidate counts of an enabled draw"""
+        metrics.enable()
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        pairings = matcher.validate_round(['A', 'B', 'C', 'D', 'E'], {'A': ['B']})
+        matcher.generate_pairings([{'participants': ['A', 'B', 'C', 'D', 'E']}] * 2, strategy='enumerate')
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['rounds']['validate_round']['accepted'], len(pairings))
+        self.assertGreater(snapshot['rounds']['validate_round']['pruned'], 0)
+        self.assertIn('1', snapshot['rounds'])
+        self.assertIn('2', snapshot['rounds'])
+        self.assertEqual(snapshot['timers']['validate_round']['calls'], 1)
+        self.assertGreaterEqual(snapshot['timers']['draw.attempt']['calls'], 1)
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_config_is_drawable(self):
+        """Test generated configs are reproducible and can be drawn"""
+        config = synthetic_config(60, 3, exclusion_density=0.1, overlap=0.5, seed=3)
+        self.assertEqual(config, synthetic_config(60, 3, exclusion_density=0.1, overlap=0.5, seed=3))
+        self.assertEqual(len(config['rounds']), 3)
+        for round_config in config['rounds']:
+            for giver, excluded in round_config['exclusions'].items():
+                self.assertNotIn(giver, excluded)
+        matcher = SecretSantaMatcher(prevent_reciprocal_pairs=True)
+        pairings, _ = matcher.generate_pairings(config['rounds'], max_attempts=200)
+        self.assertEqual(len(pairings), 3)
+
+    def test_compare_flags_regressions(self):
+        """Test compare reports slowdowns beyond the tolerance only"""
+        def results(seconds):
+            stats = {'min_s': seconds, 'median_s': seconds, 'peak_bytes': 1024}
+            return {'scales': {'large': {'params': {}, 'generate_pairings': stats}}}
+        self.assertEqual(compare(results(0.105), results(0.1)), [])
+        self.assertEqual(len(compare(results(0.2), results(0.1))), 1)
+        self.assertEqual(compare(results(0.2), {'scales': {}}), [])
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.pairings = [
+            {'pairing': {'Alice': 'Bob', 'Bob': 'Charlie', 'Charlie': 'Alice'}, 'budget': '50$'},
+            {'pairing': {'Alice': 'Zoë', 'Zoë': 'Alice'}, 'budget': None},
+        ]
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_jsonl_and_csv_have_one_row_per_giver_per_round(self):
+        jsonl_path = os.path.join(self.folder.name, 'draw.jsonl')
+        csv_path = os.path.join(self.folder.name, 'draw.csv')
+        self.assertEqual(export_draw(self.pairings, jsonl_path, 'abc123'), 5)
+        self.assertEqual(export_draw(self.pairings, csv_path, 'abc123'), 5)
+        with open(jsonl_path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows[0], {'draw_id': 'abc123', 'round': 1, 'budget': '50$', 'giver': 'Alice', 'receiver': 'Bob'})
+        self.assertEqual(rows[-1], {'draw_id': 'abc123', 'round': 2, 'budget': None, 'giver': 'Zoë', 'receiver': 'Alice'})
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'draw_id,round,budget,giver,receiver')
+        self.assertEqual(lines[4], 'abc123,2,,Alice,Zoë')
+
+    def test_text_table_is_the_summary(self):
+        summary = generate_summary(self.pairings, 3, {})
+        lines = summary.split("\n")
+        self.assertTrue(lines[0].startswith("Rounds: 2 | Participants: 4"))
+        self.assertEqual(lines[1:], list(iter_text_table(iter_assignments(self.pairings))))
+        self.assertEqual(lines[4].split(), ['Bob', 'Charlie', '-'])
+        path = os.path.join(self.folder.name, 'summary.txt')
+        export_draw(self.pairings, path, header=lines[0])
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), summary)
+
+    def test_summary_reports_score(self):
+        score = {'total': 2.0, 'initial': 9.0, 'repeat': 0, 'same_department': 2, 'short_cycle': 0}
+        header = generate_summary(self.pairings, 1, {}, score).split("\n")[0]
+        self.assertIn("Score: 2 (drawn: 9; repeats: 0, same department: 2, in short cycles: 0)", header)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_draw(self.pairings, os.path.join(self.folder.name, 'draw.xml'))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file